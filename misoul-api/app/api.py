@@ -1,11 +1,14 @@
 # app/api.py
 import os
 import time
-from flask import Flask, request, jsonify
+import json
+import threading
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import logging
 from logging.handlers import RotatingFileHandler
 import traceback
+from concurrent.futures import TimeoutError as FuturesTimeoutError, CancelledError
 
 # Import config
 from config import Config
@@ -15,6 +18,12 @@ from app.gemini_manager import GeminiManager
 from app.rag_manager import RAGManager
 from app.prompt_manager import PromptManager
 from app.misoul_chatbot import MISOULChatbot
+from app.chat_executor import ChatExecutor, ChatQueueFullError
+from app.deadline import Deadline, DeadlineExceeded
+from app.index_job import IndexBuildJob
+from app.index_versions import IndexReloader, current_version
+from app.session_store import create_session_store
+from app import metrics
 
 # Khởi tạo Flask app
 app = Flask(__name__)
@@ -40,13 +49,109 @@ os.environ["GOOGLE_API_KEY"] = Config.GOOGLE_API_KEY
 misoul_chatbot = None
 PDF_PROCESSED = False
 
+# Thread pool có giới hạn cho việc xử lý tin nhắn
+chat_executor = ChatExecutor(
+    max_workers=Config.CHAT_MAX_WORKERS,
+    max_queue_size=Config.CHAT_QUEUE_SIZE
+)
+metrics.QUEUE_DEPTH.set_function(lambda: chat_executor.queue_depth)
+metrics.IN_FLIGHT.set_function(lambda: chat_executor.in_flight)
+
+def install_vector_db(vector_db, version=None):
+    """
+    Đưa vector database vừa xây dựng hoặc tải lại vào RAGManager đang phục vụ
+    
+    Các truy vấn đang chạy hoàn tất trên phiên bản cũ, phiên bản cũ được giải phóng khi
+    truy vấn cuối cùng kết thúc.
+    """
+    global PDF_PROCESSED
+    PDF_PROCESSED = True
+    if misoul_chatbot is not None:
+        misoul_chatbot.rag_manager.set_vector_db(vector_db, version)
+        misoul_chatbot.rag_manager.get_crisis_documents(top_k=Config.CRISIS_TOP_K)
+        app.logger.info(f"Đã chuyển MISOUL sang vector database phiên bản {version}")
+
+def _served_index_version():
+    return misoul_chatbot.rag_manager.index_version if misoul_chatbot is not None else None
+
+def _load_index_version(version):
+    from app.pdf_processor_langchain import PDFProcessor
+    return PDFProcessor.load_vector_store(version)
+
+# Job nền xây dựng vector database từ PDF
+index_job = IndexBuildJob(on_complete=install_vector_db)
+
+# Tải lại phiên bản index mới (do worker khác hoặc process_pdfs.py xây dựng) không cần khởi động lại
+index_reloader = IndexReloader(
+    load=_load_index_version,
+    install=install_vector_db,
+    served_version=_served_index_version
+)
+
+# (phiên bản index, vector database) đã tải trong master gunicorn trước khi fork worker
+preloaded_vector_db = (None, None)
+
+def preload_vector_db():
+    """
+    Tải vector database trong master gunicorn trước khi fork worker (preload_app)
+    
+    Các worker nhận vector database qua fork: phần được memory-map dùng chung page cache,
+    phần còn lại (tài liệu, từ vựng) dùng chung theo copy-on-write, và worker được khởi
+    động lại không phải tải lại index. Chỉ tải index, không tạo chatbot hay thread nào
+    trong master. Checksum của các file index được kiểm tra đầy đủ một lần ở đây; worker
+    tải index sau đó chỉ so kích thước và thời điểm sửa của file.
+    
+    Returns:
+        bool: True nếu đã tải được
+    """
+    global preloaded_vector_db
+    from app.pdf_processor_langchain import PDFProcessor
+    
+    version = current_version()
+    vector_db = PDFProcessor.load_vector_store(version, checksums=True)
+    preloaded_vector_db = (version, vector_db)
+    if vector_db is not None:
+        app.logger.info("Đã tải trước vector database trong master, các worker sẽ dùng chung")
+    return vector_db is not None
+
+def _take_preloaded_vector_db():
+    """
+    Returns:
+        tuple: (phiên bản, vector database) đã tải trong master nếu CURRENT vẫn trỏ đến
+        phiên bản đó, ngược lại (None, None)
+    """
+    global preloaded_vector_db
+    
+    version, vector_db = preloaded_vector_db
+    # Worker chỉ lấy một lần; sau đó phiên bản được RAGManager đếm tham chiếu
+    preloaded_vector_db = (None, None)
+    if vector_db is None:
+        return None, None
+    if version != current_version():
+        app.logger.info("Index đã chuyển phiên bản sau khi master tải trước, tải bản mới")
+        return None, None
+    return version, vector_db
+
+# Khóa tránh nhiều request cùng khởi tạo chatbot
+_init_lock = threading.Lock()
+
+# Trạng thái sẵn sàng nhận traffic (đã khởi tạo và nạp index)
+ready_event = threading.Event()
+warmup_error = None
+
 def get_misoul_instance():
     """
     Khởi tạo một instance MISOUL Chatbot (nếu chưa có) và trả về nó
     """
     global misoul_chatbot, PDF_PROCESSED
     
-    if misoul_chatbot is None:
+    if misoul_chatbot is not None:
+        return misoul_chatbot
+    
+    with _init_lock:
+        if misoul_chatbot is not None:
+            return misoul_chatbot
+        
         try:
             app.logger.info("Khởi tạo MISOUL Chatbot...")
             
@@ -54,35 +159,34 @@ def get_misoul_instance():
             from app.pdf_processor_langchain import PDFProcessor
             PDF_PROCESSED = PDFProcessor.check_processing_status()
 
-            # Tải vector store
-            vector_db = PDFProcessor.load_vector_store()
+            # Dùng vector store master đã tải trước (preload_app), nếu không thì tải từ đĩa
+            version, vector_db = _take_preloaded_vector_db()
+            if vector_db is None:
+                version = current_version()
+                vector_db = PDFProcessor.load_vector_store(version)
             
-            if vector_db is None and not PDF_PROCESSED:
-                app.logger.warning("Không tìm thấy vector database. Kiểm tra thư mục vectorstore/db_faiss")
-                app.logger.info("Tạo vector database từ file PDF có sẵn...")
-                processor = PDFProcessor()
-                success = processor.process_all_pdfs()
-                PDF_PROCESSED = True  # Đánh dấu đã xử lý, ngay cả khi thất bại
-                
-                if success:
-                    vector_db = PDFProcessor.load_vector_store()
-                else:
-                    app.logger.error("Không thể xử lý PDF và tạo vector database")
-                    # Trả về None nếu không thể khởi tạo vector database
-                    return None
-            #elif vector_db is None:
-             #   app.logger.warning("Không tìm thấy vector database và đã thử xử lý PDF trước đó")
-                # Tiếp tục mà không cần vector database
+            if vector_db is None:
+                app.logger.warning("Không tìm thấy vector database dùng được. Kiểm tra thư mục %s", Config.VECTOR_DB_PATH)
+                # Xây dựng index trong nền, chatbot phục vụ không có RAG cho đến khi xong.
+                # Xây dựng lại cả khi trạng thái cho biết PDF đã xử lý, vì index có thể
+                # không tải được do là bản cũ không có vectorizer hoặc sai checksum
+                if index_job.start(force=True):
+                    app.logger.info("Đã bắt đầu job nền tạo vector database từ file PDF có sẵn...")
             
             # Khởi tạo các thành phần
             llm_manager = GeminiManager(model_name=Config.MODEL_NAME)
-            rag_manager = RAGManager(vector_db=vector_db)
+            rag_manager = RAGManager(vector_db=vector_db, load_if_missing=False, version=version)
             prompt_manager = PromptManager()
+            session_store = create_session_store()
             
             # Khởi tạo chatbot
-            misoul_chatbot = MISOULChatbot(llm_manager, rag_manager, prompt_manager)
+            misoul_chatbot = MISOULChatbot(llm_manager, rag_manager, prompt_manager, session_store)
             app.logger.info("MISOUL Chatbot khởi tạo thành công!")
             
+            # Theo dõi CURRENT để chuyển sang phiên bản index mới khi được publish
+            if index_reloader.watch():
+                app.logger.info(f"Đang theo dõi phiên bản index mỗi {Config.INDEX_WATCH_INTERVAL}s")
+            
         except Exception as e:
             app.logger.error(f"Lỗi khi khởi tạo MISOUL Chatbot: {str(e)}")
             app.logger.error(traceback.format_exc())
@@ -90,13 +194,50 @@ def get_misoul_instance():
     
     return misoul_chatbot
 
+def warm_up():
+    """
+    Khởi tạo trước MISOUL Chatbot và nạp index vào bộ nhớ trước khi nhận traffic
+    
+    Được gọi khi khởi động (run.py hoặc hook post_worker_init của gunicorn)
+    để người dùng đầu tiên không phải chờ khởi tạo.
+    
+    Returns:
+        bool: True nếu đã sẵn sàng
+    """
+    global warmup_error
+    
+    if ready_event.is_set():
+        return True
+    
+    start_time = time.time()
+    try:
+        misoul = get_misoul_instance()
+        if misoul is None:
+            raise RuntimeError("Không thể khởi tạo MISOUL Chatbot")
+        
+        # Truy vấn giả để nạp index và vectorizer vào bộ nhớ
+        misoul.rag_manager.retrieve_documents("tôi cảm thấy lo lắng và căng thẳng", emotional_level=2)
+        
+        # Chọn sẵn tài liệu cho tin nhắn khủng hoảng
+        misoul.rag_manager.get_crisis_documents(top_k=Config.CRISIS_TOP_K)
+        
+        warmup_error = None
+        ready_event.set()
+        app.logger.info(f"MISOUL sẵn sàng nhận traffic sau {time.time() - start_time:.2f}s")
+        return True
+    except Exception as e:
+        warmup_error = str(e)
+        app.logger.error(f"Lỗi khi khởi động trước MISOUL: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return False
+
 # Kiểm tra API key
 def verify_api_key():
     """
     Kiểm tra API key trong header request
     """
-    if request.endpoint == 'health_check' or request.endpoint == 'list_routes':
-        return  # Không yêu cầu API key cho health check và list routes
+    if request.endpoint in ('health_check', 'readiness_check', 'metrics_endpoint', 'list_routes'):
+        return  # Không yêu cầu API key cho health check, readiness, metrics và list routes
     
     # Xử lý OPTIONS request cho CORS
     if request.method == 'OPTIONS':
@@ -137,15 +278,64 @@ def process_chatbot_response(response, user_id):
         messages = [response]
     
     # Kiểm tra xem người dùng có đang chờ xác nhận không
-    waiting_confirmation = False
-    if hasattr(misoul, 'waiting_confirmation') and user_id in misoul.waiting_confirmation:
-        waiting_confirmation = misoul.waiting_confirmation.get(user_id, False)
+    waiting_confirmation = misoul.is_waiting_confirmation(user_id)
     
     return {
         "messages": messages,
         "waiting_confirmation": waiting_confirmation
     }
 
+# Hàm tạo phản hồi khi server quá tải
+def overloaded_response():
+    """
+    Trả về lỗi 503 kèm header Retry-After khi hàng đợi xử lý đã đầy
+    """
+    metrics.CHAT_REJECTED.inc(endpoint=request.endpoint)
+    app.logger.warning(
+        f"Hàng đợi chat đầy - đang xử lý: {chat_executor.in_flight} | đang chờ: {chat_executor.queue_depth}"
+    )
+    response = jsonify({"error": "MISOUL đang quá tải, vui lòng thử lại sau"})
+    response.headers['Retry-After'] = str(Config.CHAT_RETRY_AFTER_SECONDS)
+    return response, 503
+
+# Hàm đọc và kiểm tra dữ liệu của request chat
+def parse_chat_request(data):
+    """
+    Kiểm tra và chuẩn hóa dữ liệu của request chat
+    
+    Args:
+        data: JSON body của request
+        
+    Returns:
+        tuple: (params, error_response) - một trong hai giá trị là None
+    """
+    # Kiểm tra các trường bắt buộc
+    if not data or 'message' not in data:
+        return None, (jsonify({"error": "Thiếu trường 'message' trong request"}), 400)
+    
+    # Lấy thông tin từ request
+    message = data.get('message')
+    emotional_level = int(data.get('emotional_level', 1))
+    user_id = data.get('user_id', 'default_user')
+    
+    # Kiểm tra giới hạn emotional_level
+    if emotional_level < 1 or emotional_level > 5:
+        return None, (jsonify({"error": "emotional_level phải từ 1 đến 5"}), 400)
+    
+    # Dữ liệu sinh trắc học (tùy chọn)
+    biometric_data = data.get('biometric_data', {
+        'heart_rate': 75 + (emotional_level - 1) * 5,
+        'hrv': 60 - (emotional_level - 1) * 10,
+        'sleep_quality': 80 - (emotional_level - 1) * 10
+    })
+    
+    return {
+        "message": message,
+        "emotional_level": emotional_level,
+        "user_id": user_id,
+        "biometric_data": biometric_data
+    }, None
+
 # Route để kiểm tra API đang hoạt động
 @app.route('/api/health', methods=['GET', 'OPTIONS'])
 def health_check():
@@ -161,6 +351,34 @@ def health_check():
         "version": "1.0.0"
     })
 
+# Route để kiểm tra API đã sẵn sàng nhận traffic
+@app.route('/api/ready', methods=['GET', 'OPTIONS'])
+def readiness_check():
+    """
+    Kiểm tra MISOUL đã khởi tạo xong và nạp index chưa
+    
+    Khác với /api/health (chỉ kiểm tra process còn sống), endpoint này trả về 503
+    cho đến khi warm_up() hoàn tất, để load balancer chưa chuyển traffic tới.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    if ready_event.is_set():
+        return jsonify({"status": "ready"})
+    
+    body = {"status": "warming_up"}
+    if warmup_error:
+        body = {"status": "error", "error": warmup_error}
+    return jsonify(body), 503
+
+# Route xuất metric cho Prometheus
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Xuất metric của process hiện tại theo định dạng văn bản của Prometheus
+    """
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 # Route chính để trò chuyện với MISOUL
 @app.route('/api/chat', methods=['POST', 'OPTIONS'])
 def chat():
@@ -180,28 +398,19 @@ def chat():
         # Ghi nhận thời gian bắt đầu
         start_time = time.time()
         
-        # Lấy dữ liệu từ request
-        data = request.json
-        
-        # Kiểm tra các trường bắt buộc
-        if not data or 'message' not in data:
-            return jsonify({"error": "Thiếu trường 'message' trong request"}), 400
-        
-        # Lấy thông tin từ request
-        message = data.get('message')
-        emotional_level = int(data.get('emotional_level', 1))
-        user_id = data.get('user_id', 'default_user')
+        # Deadline của request được truyền qua toàn bộ pipeline xử lý
+        timeout_seconds = Config.CHAT_TIMEOUT_SECONDS
+        deadline = Deadline(timeout_seconds)
         
-        # Kiểm tra giới hạn emotional_level
-        if emotional_level < 1 or emotional_level > 5:
-            return jsonify({"error": "emotional_level phải từ 1 đến 5"}), 400
+        # Lấy dữ liệu từ request
+        params, error_response = parse_chat_request(request.json)
+        if error_response:
+            return error_response
         
-        # Dữ liệu sinh trắc học (tùy chọn)
-        biometric_data = data.get('biometric_data', {
-            'heart_rate': 75 + (emotional_level - 1) * 5,
-            'hrv': 60 - (emotional_level - 1) * 10,
-            'sleep_quality': 80 - (emotional_level - 1) * 10
-        })
+        message = params["message"]
+        emotional_level = params["emotional_level"]
+        user_id = params["user_id"]
+        biometric_data = params["biometric_data"]
         
         # Lấy instance MISOUL
         misoul = get_misoul_instance()
@@ -214,47 +423,36 @@ def chat():
         if time.time() - start_time > 10:  # 10 giây timeout cho khởi tạo
             return jsonify({"error": "Thời gian khởi tạo MISOUL quá lâu"}), 504
         
-        # Xử lý tin nhắn với MISOUL
+        # Xử lý tin nhắn với MISOUL trong thread pool có giới hạn.
+        # Request trùng lặp (ví dụ bấm gửi hai lần) dùng chung kết quả của request đang xử lý
+        # thay vì gọi Gemini thêm một lần; các lượt của cùng người dùng chờ nhau trong hàng đợi
+        # thay vì giữ thread xử lý
         try:
-            with_timeout = True  # Đặt timeout cho xử lý tin nhắn
-            timeout_seconds = 30  # 30 giây timeout
-            
-            if with_timeout:
-                import threading
-                import queue
-                
-                result_queue = queue.Queue()
-                
-                def process_with_queue():
-                    try:
-                        result = misoul.process_message(message, emotional_level, biometric_data, user_id)
-                        result_queue.put(("success", result))
-                    except Exception as e:
-                        result_queue.put(("error", str(e)))
-                
-                # Tạo và bắt đầu thread
-                thread = threading.Thread(target=process_with_queue)
-                thread.daemon = True
-                thread.start()
-                
-                # Chờ kết quả với timeout
-                try:
-                    status, response = result_queue.get(timeout=timeout_seconds)
-                    
-                    if status == "error":
-                        raise Exception(response)
-                    
-                except queue.Empty:
-                    return jsonify({"error": f"Xử lý tin nhắn quá thời gian ({timeout_seconds}s)"}), 504
-            else:
-                # Xử lý thông thường không có timeout
-                response = misoul.process_message(message, emotional_level, biometric_data, user_id)
-            
+            future, coalesced = chat_executor.submit_coalesced(
+                (user_id, message, emotional_level),
+                misoul.process_message, message, emotional_level, biometric_data, user_id, deadline,
+                serial_key=user_id
+            )
+        except ChatQueueFullError:
+            return overloaded_response()
+        
+        if coalesced:
+            metrics.CHAT_COALESCED.inc()
+            app.logger.info(f"Gộp request trùng lặp - User: {user_id}")
+        
+        try:
+            response = future.result(timeout=deadline.remaining())
+        except (FuturesTimeoutError, CancelledError, DeadlineExceeded):
+            # Hủy tác vụ nếu vẫn còn đang chờ; tác vụ đang chạy sẽ tự dừng theo deadline
+            future.cancel()
+            metrics.CHAT_TIMEOUTS.inc(endpoint="chat")
+            return jsonify({"error": f"Xử lý tin nhắn quá thời gian ({timeout_seconds}s)"}), 504
         except Exception as e:
             app.logger.error(f"Lỗi khi xử lý tin nhắn: {str(e)}")
             return jsonify({"error": f"Lỗi khi xử lý tin nhắn: {str(e)}"}), 500
         
         processing_time = time.time() - start_time
+        metrics.REQUEST_LATENCY.observe(processing_time, endpoint="chat")
         
         # Xử lý và định dạng phản hồi
         formatted_response = process_chatbot_response(response, user_id)
@@ -277,6 +475,189 @@ def chat():
         app.logger.error(traceback.format_exc())
         return jsonify({"error": error_message}), 500
 
+# Route trò chuyện dạng streaming (NDJSON)
+@app.route('/api/chat/stream', methods=['POST', 'OPTIONS'])
+def chat_stream():
+    """
+    Endpoint streaming: mỗi tin nhắn được gửi về dưới dạng một dòng JSON ngay khi sẵn sàng
+    
+    Các dòng có dạng {"type": "message", "content": ...}, kết thúc bằng
+    {"type": "done", ...} hoặc {"type": "error", "error": ...}
+    """
+    # Xử lý request OPTIONS cho CORS
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    # Kiểm tra API key
+    auth_result = verify_api_key()
+    if auth_result:
+        return auth_result
+    
+    start_time = time.time()
+    deadline = Deadline(Config.CHAT_TIMEOUT_SECONDS)
+    
+    params, error_response = parse_chat_request(request.json)
+    if error_response:
+        return error_response
+    
+    message = params["message"]
+    emotional_level = params["emotional_level"]
+    user_id = params["user_id"]
+    biometric_data = params["biometric_data"]
+    
+    try:
+        misoul = get_misoul_instance()
+    except Exception as e:
+        return jsonify({"error": f"Lỗi khi xử lý yêu cầu: {str(e)}"}), 500
+    
+    if misoul is None:
+        return jsonify({"error": "Không thể khởi tạo MISOUL Chatbot"}), 500
+    
+    # Stream chiếm một chỗ trong giới hạn xử lý cho đến khi kết nối đóng
+    if not chat_executor.try_acquire(running=True):
+        return overloaded_response()
+    
+    # Stream không dùng chung được với request khác, nên stream trùng lặp (bấm gửi hai lần)
+    # trong khi stream đầu còn chạy bị từ chối thay vì gọi Gemini thêm một lần
+    stream_key = ("stream", user_id, message, emotional_level)
+    if not chat_executor.try_claim(stream_key):
+        chat_executor.release(running=True)
+        app.logger.info(f"Từ chối stream trùng lặp - User: {user_id}")
+        return jsonify({"error": "Tin nhắn này đang được xử lý"}), 409
+    
+    def close_stream():
+        chat_executor.unclaim(stream_key)
+        chat_executor.release(running=True)
+    
+    def to_line(event):
+        return json.dumps(event, ensure_ascii=False) + "\n"
+    
+    def generate():
+        first_message_time = None
+        try:
+            # Chờ các lượt trước của người dùng trong hàng đợi xử lý, để lượt gửi sau stream cũng chờ stream
+            with chat_executor.serialized(user_id, deadline):
+                for chat_message in misoul.process_message_stream(
+                    message, emotional_level, biometric_data, user_id, deadline
+                ):
+                    if first_message_time is None:
+                        first_message_time = time.time() - start_time
+                    yield to_line({"type": "message", "content": chat_message})
+            
+            processing_time = time.time() - start_time
+            metrics.REQUEST_LATENCY.observe(processing_time, endpoint="chat_stream")
+            formatted_response = process_chatbot_response([], user_id)
+            
+            app.logger.info(
+                f"Chat stream - User: {user_id} | Emotion: {emotional_level} | "
+                f"First message: {(first_message_time or processing_time):.2f}s | Time: {processing_time:.2f}s"
+            )
+            
+            yield to_line({
+                "type": "done",
+                "user_id": user_id,
+                "emotional_level": emotional_level,
+                "waiting_confirmation": formatted_response["waiting_confirmation"],
+                "processing_time": processing_time
+            })
+        except DeadlineExceeded:
+            metrics.CHAT_TIMEOUTS.inc(endpoint="chat_stream")
+            app.logger.warning(f"Chat stream hết hạn - User: {user_id} | Timeout: {Config.CHAT_TIMEOUT_SECONDS}s")
+            yield to_line({"type": "error", "error": f"Xử lý tin nhắn quá thời gian ({Config.CHAT_TIMEOUT_SECONDS}s)"})
+        except Exception as e:
+            error_message = f"Lỗi khi xử lý tin nhắn: {str(e)}"
+            app.logger.error(error_message)
+            app.logger.error(traceback.format_exc())
+            yield to_line({"type": "error", "error": error_message})
+    
+    stream_response = Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Tắt buffer của nginx để tin nhắn đến client ngay
+        }
+    )
+    stream_response.call_on_close(close_stream)
+    return stream_response
+
+# Route để bắt đầu xây dựng lại vector database
+@app.route('/api/index/build', methods=['POST', 'OPTIONS'])
+def index_build():
+    """
+    Bắt đầu job nền xử lý PDF và xây dựng lại vector database
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    auth_result = verify_api_key()
+    if auth_result:
+        return auth_result
+    
+    if not index_job.start(force=True):
+        return jsonify({"error": "Job xây dựng index đang chạy", "job": index_job.status()}), 409
+    
+    app.logger.info("Đã bắt đầu job xây dựng lại vector database")
+    return jsonify({"status": "started", "job": index_job.status()}), 202
+
+# Route để xem tiến độ xây dựng vector database
+@app.route('/api/index/status', methods=['GET', 'OPTIONS'])
+def index_status():
+    """
+    Trả về trạng thái và tiến độ của job xây dựng index
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    auth_result = verify_api_key()
+    if auth_result:
+        return auth_result
+    
+    return jsonify({"job": index_job.status(), "reload": index_reloader.status()})
+
+# Route để tải lại phiên bản vector database mới nhất
+@app.route('/api/index/reload', methods=['POST', 'OPTIONS'])
+def index_reload():
+    """
+    Tải phiên bản index mà CURRENT trỏ đến trong nền rồi chuyển sang dùng nó
+    
+    Request đang xử lý hoàn tất trên phiên bản cũ. Body JSON tùy chọn {"force": true}
+    để tải lại cả khi phiên bản không đổi. Chỉ áp dụng cho worker nhận request; các
+    worker khác tự chuyển khi thấy CURRENT đổi (INDEX_WATCH_INTERVAL).
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    auth_result = verify_api_key()
+    if auth_result:
+        return auth_result
+    
+    data = request.get_json(silent=True) or {}
+    if not index_reloader.start(force=bool(data.get('force', False))):
+        return jsonify({"error": "Đang tải lại vector database", "reload": index_reloader.status()}), 409
+    
+    app.logger.info("Đã bắt đầu tải lại vector database")
+    return jsonify({"status": "started", "reload": index_reloader.status()}), 202
+
+# Route để hủy job xây dựng vector database
+@app.route('/api/index/cancel', methods=['POST', 'OPTIONS'])
+def index_cancel():
+    """
+    Yêu cầu hủy job xây dựng index đang chạy, index hiện tại được giữ nguyên
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    auth_result = verify_api_key()
+    if auth_result:
+        return auth_result
+    
+    if not index_job.cancel():
+        return jsonify({"error": "Không có job xây dựng index nào đang chạy", "job": index_job.status()}), 409
+    
+    app.logger.info("Đã yêu cầu hủy job xây dựng vector database")
+    return jsonify({"status": "cancelling", "job": index_job.status()}), 202
+
 # Route để xóa lịch sử trò chuyện
 @app.route('/api/clear_history', methods=['POST', 'OPTIONS'])
 def clear_history():
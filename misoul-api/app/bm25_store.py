@@ -0,0 +1,427 @@
+# app/bm25_store.py
+import os
+import re
+import json
+import math
+import unicodedata
+from collections import Counter
+from typing import List
+import numpy as np
+import scipy.sparse
+from langchain_core.documents import Document
+
+from app.keyword_matcher import fold_diacritics
+from app.chunk_store import save_arrays, load_array, load_documents, as_chunk_store
+from app.sparse_store import top_k_indices, BATCH_SIZE
+from config import Config
+from app.partitions import CategoryPartitions
+from app.retrieval_cache import LRUCache, normalize_query
+
+# Âm tiết: chuỗi chữ/số liền nhau (tiếng Việt viết cách nhau theo âm tiết)
+_SYLLABLE_PATTERN = re.compile(r"\w+")
+
+# Tiền tố của các term đã bỏ dấu, để không trùng với term có dấu
+FOLDED_PREFIX = "~"
+
+def tokenize(text):
+    """
+    Tách văn bản thành các âm tiết chữ thường (dạng NFC)
+
+    Args:
+        text: Văn bản
+
+    Returns:
+        list: Danh sách âm tiết
+    """
+    return _SYLLABLE_PATTERN.findall(unicodedata.normalize("NFC", text).lower())
+
+def syllable_terms(syllables):
+    """
+    Tạo term gồm từng âm tiết và từng cặp âm tiết liền nhau ("trầm", "cảm", "trầm cảm"),
+    vì phần lớn từ tiếng Việt có hai âm tiết
+
+    Args:
+        syllables: Danh sách âm tiết
+
+    Returns:
+        list: Danh sách term
+    """
+    return syllables + [f"{first} {second}" for first, second in zip(syllables, syllables[1:])]
+
+def folded_terms(syllables):
+    """
+    Returns:
+        list: Các term đã bỏ dấu của danh sách âm tiết ("~tram", "~cam", "~tram cam")
+    """
+    if not syllables:
+        return []
+    folded = fold_diacritics(" ".join(syllables)).split(" ")
+    return [FOLDED_PREFIX + term for term in syllable_terms(folded)]
+
+class BM25Store(CategoryPartitions):
+    """
+    Tìm kiếm từ vựng bằng BM25 trên inverted index tính sẵn.
+
+    Mỗi đoạn văn bản được đánh index hai lần: theo âm tiết và cặp âm tiết có dấu, và
+    theo âm tiết và cặp âm tiết đã bỏ dấu ("tram cam") cho người dùng gõ không dấu.
+    Trong truy vấn, âm tiết có dấu dùng term có dấu, âm tiết không dấu dùng term đã bỏ
+    dấu, nên cả truy vấn gõ không dấu lẫn truy vấn đã mở rộng bằng từ khóa có dấu đều khớp.
+
+    Trọng số BM25 của mỗi (term, đoạn) được tính khi xây dựng index, nên một truy vấn
+    chỉ cộng các posting list ngắn của term trong truy vấn vào mảng điểm.
+
+    Có cùng các hàm tìm kiếm mà RAGManager dùng với FAISS (similarity_search), thêm
+    tham số categories để chỉ tìm trong phân vùng của các danh mục đó và expansion để
+    cộng vector từ khóa tính sẵn vào vector truy vấn (encode_query/search_vector).
+    Phân vùng dùng trọng số tính trên toàn bộ tài liệu nên điểm giữa các phân vùng
+    so sánh được; điểm được tính trên toàn bộ posting list rồi lọc theo các hàng của
+    phân vùng.
+    """
+
+    # Tên các file lưu trong thư mục index: các mảng posting lưu thành .npy để memory-map được
+    POSTINGS_ARRAYS = ("bm25_term_offsets", "bm25_doc_ids", "bm25_weights")
+    LEGACY_POSTINGS_FILE = "bm25_postings.npz"  # Định dạng cũ (không memory-map được)
+    VOCABULARY_FILE = "bm25_vocabulary.json"
+
+    # Tham số BM25 mặc định
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, vocabulary, term_offsets, doc_ids, weights, documents, k1=K1, b=B):
+        """
+        Khởi tạo BM25Store từ inverted index đã tính sẵn
+
+        Args:
+            vocabulary: list term, vị trí trong list là ID của term
+            term_offsets: Mảng (số term + 1), posting list của term i nằm trong [offsets[i], offsets[i+1])
+            doc_ids: Mảng ID đoạn văn bản của các posting
+            weights: Mảng trọng số BM25 của các posting
+            documents: ChunkStore hoặc danh sách Document
+            k1: Tham số k1 đã dùng khi tính trọng số
+            b: Tham số b đã dùng khi tính trọng số
+        """
+        if len(term_offsets) != len(vocabulary) + 1 or len(doc_ids) != len(weights):
+            raise ValueError("Inverted index BM25 không hợp lệ: kích thước các mảng không khớp")
+
+        self.vocabulary = vocabulary if isinstance(vocabulary, list) else list(vocabulary)
+        self.term_ids = {term: term_id for term_id, term in enumerate(self.vocabulary)}
+        self.term_offsets = np.asarray(term_offsets, dtype=np.int64)
+        self._offsets = self.term_offsets.tolist()  # Truy cập từng phần tử nhanh hơn mảng numpy
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.documents = as_chunk_store(documents)
+        self.k1 = k1
+        self.b = b
+        self._query_vectors = LRUCache("bm25_query_vector", Config.QUERY_VECTOR_CACHE_SIZE)
+        self._term_matrix = None
+        self._init_partitions()
+
+    @staticmethod
+    def document_terms(text):
+        """
+        Returns:
+            tuple: (các term có dấu và đã bỏ dấu của đoạn văn bản, số âm tiết)
+        """
+        syllables = tokenize(text)
+        return syllable_terms(syllables) + folded_terms(syllables), len(syllables)
+
+    @staticmethod
+    def query_terms(text):
+        """
+        Returns:
+            list: Các term của truy vấn; term có âm tiết có dấu được giữ nguyên,
+                  term chỉ gồm âm tiết không dấu được tìm trong các term đã bỏ dấu
+        """
+        syllables = tokenize(text)
+        if not syllables:
+            return []
+        folded = fold_diacritics(" ".join(syllables)).split(" ")
+        accented = [original != plain for original, plain in zip(syllables, folded)]
+
+        terms = [
+            syllable if has_marks else FOLDED_PREFIX + plain
+            for syllable, plain, has_marks in zip(syllables, folded, accented)
+        ]
+        for i in range(len(syllables) - 1):
+            if accented[i] or accented[i + 1]:
+                terms.append(f"{syllables[i]} {syllables[i + 1]}")
+            else:
+                terms.append(f"{FOLDED_PREFIX}{folded[i]} {folded[i + 1]}")
+        return terms
+
+    @classmethod
+    def from_documents(cls, documents, k1=K1, b=B):
+        """
+        Xây dựng inverted index BM25 từ danh sách tài liệu
+
+        Args:
+            documents: Danh sách Document
+            k1: Tham số bão hòa tần suất term
+            b: Tham số chuẩn hóa theo độ dài đoạn
+
+        Returns:
+            BM25Store: Index mới
+        """
+        documents = as_chunk_store(documents)
+        postings = {}  # term -> list (ID đoạn, tần suất)
+        lengths = np.zeros(len(documents), dtype=np.float64)
+        for doc_id, text in enumerate(documents.texts()):
+            terms, lengths[doc_id] = cls.document_terms(text)
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, []).append((doc_id, count))
+
+        total = len(documents)
+        average_length = lengths.mean() if total and lengths.mean() > 0 else 1.0
+        norms = k1 * (1 - b + b * lengths / average_length)
+
+        vocabulary = sorted(postings)
+        term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        doc_ids, weights = [], []
+        for term_id, term in enumerate(vocabulary):
+            entries = postings[term]
+            idf = math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+            ids = np.fromiter((doc_id for doc_id, _ in entries), dtype=np.int32, count=len(entries))
+            counts = np.fromiter((count for _, count in entries), dtype=np.float64, count=len(entries))
+            doc_ids.append(ids)
+            weights.append(idf * counts * (k1 + 1) / (counts + norms[ids]))
+            term_offsets[term_id + 1] = term_offsets[term_id] + len(entries)
+
+        return cls(
+            vocabulary,
+            term_offsets,
+            np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype=np.int32),
+            np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+            documents,
+            k1=k1,
+            b=b
+        )
+
+    @property
+    def dimension(self):
+        """Số term trong từ vựng"""
+        return len(self.vocabulary)
+
+    @property
+    def nbytes(self):
+        """Dung lượng bộ nhớ của các mảng inverted index (byte, không tính từ vựng)"""
+        return self.term_offsets.nbytes + self.doc_ids.nbytes + self.weights.nbytes
+
+    def __len__(self):
+        return len(self.documents)
+
+    @staticmethod
+    def _partition_scores(scores, partition):
+        """
+        Returns:
+            numpy.ndarray: Điểm của các hàng thuộc phân vùng (chỉ cắt lát khi phân vùng là một đoạn hàng)
+        """
+        if partition is None:
+            return scores
+        if len(partition.runs) == 1:
+            start, end = partition.runs[0]
+            return scores[..., start:end]
+        return scores[..., partition.rows]
+
+    def encode_query(self, text):
+        """
+        Tạo vector truy vấn
+
+        Args:
+            text: Câu truy vấn
+
+        Returns:
+            dict: ID term -> số lần xuất hiện trong truy vấn, chỉ các term có trong từ vựng
+                  (dùng chung, không được sửa)
+        """
+        text = normalize_query(text)
+        vector = self._query_vectors.get(text)
+        if vector is None:
+            vector = {}
+            for term, count in Counter(self.query_terms(text)).items():
+                term_id = self.term_ids.get(term)
+                if term_id is not None:
+                    vector[term_id] = count
+            self._query_vectors.put(text, vector)
+        return vector
+
+    def search_vector(self, query_vector, k: int = 4, categories=None):
+        """
+        Tìm các đoạn văn bản có điểm BM25 cao nhất với vector truy vấn
+
+        Args:
+            query_vector: dict ID term -> trọng số (do encode_query tạo, có thể đã cộng thêm vector khác)
+            k: Số kết quả
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+
+        Returns:
+            list: Danh sách (Document, điểm BM25), điểm cao nhất trước
+        """
+        partition = self.partition(categories) if categories else None
+        doc_ids, weights = [], []
+        for term_id, weight in query_vector.items():
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            doc_ids.append(self.doc_ids[start:end])
+            weights.append(self.weights[start:end] * weight if weight != 1 else self.weights[start:end])
+
+        if not doc_ids:
+            return []
+        # Cộng trọng số của tất cả posting list vào mảng điểm trong một lần
+        scores = np.bincount(np.concatenate(doc_ids), weights=np.concatenate(weights), minlength=len(self.documents))
+        scores = self._partition_scores(scores, partition)
+        top = top_k_indices(scores, k)
+        return [
+            (self.documents[i], float(score))
+            for i, score in zip(self._row_ids(top, partition).tolist(), scores[top]) if score > 0
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, categories=None, expansion=None):
+        """
+        Tìm các đoạn văn bản có điểm BM25 cao nhất
+
+        Args:
+            query: Câu truy vấn
+            k: Số kết quả
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+            expansion: (vector từ khóa do encode_query tạo, trọng số) cộng vào vector truy vấn (tùy chọn)
+
+        Returns:
+            list: Danh sách (Document, điểm BM25), điểm cao nhất trước
+        """
+        query_vector = self.encode_query(query)
+        if expansion is not None:
+            keyword_vector, weight = expansion
+            query_vector = dict(query_vector)
+            for term_id, count in keyword_vector.items():
+                query_vector[term_id] = query_vector.get(term_id, 0) + weight * count
+        return self.search_vector(query_vector, k=k, categories=categories)
+
+    def similarity_search(self, query: str, k: int = 4, categories=None, expansion=None) -> List[Document]:
+        """
+        Tìm các đoạn văn bản có điểm BM25 cao nhất
+
+        Args:
+            query: Câu truy vấn
+            k: Số kết quả
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+            expansion: (vector từ khóa, trọng số) cộng vào vector truy vấn (tùy chọn)
+
+        Returns:
+            List[Document]: Danh sách tài liệu, liên quan nhất trước
+        """
+        return [
+            doc for doc, _ in
+            self.similarity_search_with_score(query, k=k, categories=categories, expansion=expansion)
+        ]
+
+    def term_matrix(self):
+        """
+        Returns:
+            scipy.sparse.csr_matrix: Inverted index dưới dạng ma trận (số term x số đoạn), dùng chung
+                                     mảng ID đoạn và trọng số với các posting list
+        """
+        if self._term_matrix is None:
+            # indptr cùng kiểu int32 với doc_ids để scipy không phải chép lại mảng posting
+            offsets = self.term_offsets.astype(np.int32) if len(self.doc_ids) < 2**31 else self.term_offsets
+            self._term_matrix = scipy.sparse.csr_matrix(
+                (self.weights, self.doc_ids, offsets), shape=(len(self.vocabulary), len(self.documents))
+            )
+        return self._term_matrix
+
+    def _query_matrix(self, query_vectors):
+        rows, columns, counts = [], [], []
+        for row, query_vector in enumerate(query_vectors):
+            rows.extend([row] * len(query_vector))
+            columns.extend(query_vector)
+            counts.extend(query_vector.values())
+        return scipy.sparse.csr_matrix(
+            (np.asarray(counts, dtype=np.float32), (rows, columns)), shape=(len(query_vectors), len(self.vocabulary))
+        )
+
+    def similarity_search_batch_with_score(self, queries, k: int = 4, categories=None, expansion=None):
+        """
+        Tìm kiếm cho nhiều câu truy vấn: chấm điểm bằng một phép nhân ma trận truy vấn với
+        term_matrix() cho mỗi BATCH_SIZE truy vấn
+
+        Args:
+            queries: Danh sách câu truy vấn
+            k: Số kết quả của mỗi truy vấn
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+            expansion: (vector từ khóa, trọng số) cộng vào vector của mọi truy vấn (tùy chọn)
+
+        Returns:
+            list: Với mỗi truy vấn theo thứ tự, danh sách (Document, điểm BM25) như similarity_search_with_score
+        """
+        if not queries:
+            return []
+
+        partition = self.partition(categories) if categories else None
+        term_matrix = self.term_matrix()
+        # Vector từ khóa giống nhau cho mọi truy vấn nên điểm của nó chỉ tính một lần
+        keyword_scores = None
+        if expansion is not None:
+            keyword_vector, weight = expansion
+            keyword_scores = weight * self._partition_scores((self._query_matrix([keyword_vector]) @ term_matrix).toarray().ravel(), partition)
+
+        results = []
+        for start in range(0, len(queries), BATCH_SIZE):
+            query_matrix = self._query_matrix([self.encode_query(query) for query in queries[start:start + BATCH_SIZE]])
+            batch_scores = self._partition_scores((query_matrix @ term_matrix).toarray(), partition)
+            if keyword_scores is not None:
+                batch_scores += keyword_scores
+            for scores in batch_scores:
+                top = top_k_indices(scores, k)
+                results.append([
+                    (self.documents[i], float(score))
+                    for i, score in zip(self._row_ids(top, partition).tolist(), scores[top]) if score > 0
+                ])
+        return results
+
+    def similarity_search_batch(self, queries, k: int = 4, categories=None, expansion=None) -> List[List[Document]]:
+        """
+        Tìm kiếm cho nhiều câu truy vấn (tham số như similarity_search_batch_with_score)
+
+        Returns:
+            list: Với mỗi truy vấn theo thứ tự, danh sách tài liệu liên quan nhất trước
+        """
+        return [
+            [doc for doc, _ in results] for results in
+            self.similarity_search_batch_with_score(queries, k=k, categories=categories, expansion=expansion)
+        ]
+
+    def save_local(self, directory):
+        """
+        Lưu inverted index, từ vựng và tài liệu vào thư mục
+
+        Args:
+            directory: Thư mục lưu
+        """
+        os.makedirs(directory, exist_ok=True)
+        save_arrays(directory, **dict(zip(self.POSTINGS_ARRAYS, (self.term_offsets, self.doc_ids, self.weights))))
+        with open(os.path.join(directory, self.VOCABULARY_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"k1": self.k1, "b": self.b, "terms": self.vocabulary}, f, ensure_ascii=False)
+        self.documents.save(directory)
+
+    @classmethod
+    def load_local(cls, directory):
+        """
+        Tải index từ thư mục
+
+        Args:
+            directory: Thư mục do save_local ghi
+
+        Returns:
+            BM25Store: Index đã tải (các mảng posting được memory-map nếu Config.INDEX_MMAP)
+        """
+        with open(os.path.join(directory, cls.VOCABULARY_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        legacy_path = os.path.join(directory, cls.LEGACY_POSTINGS_FILE)
+        if os.path.exists(legacy_path):
+            with np.load(legacy_path) as arrays:
+                term_offsets, doc_ids, weights = arrays["term_offsets"], arrays["doc_ids"], arrays["weights"]
+        else:
+            term_offsets, doc_ids, weights = (load_array(directory, name) for name in cls.POSTINGS_ARRAYS)
+
+        documents = load_documents(directory)
+        if len(doc_ids) and doc_ids.max() >= len(documents):
+            raise ValueError(f"Inverted index BM25 tham chiếu đến đoạn không tồn tại ({len(documents)} đoạn)")
+        return cls(data["terms"], term_offsets, doc_ids, weights, documents, k1=data["k1"], b=data["b"])
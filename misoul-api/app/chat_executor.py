@@ -0,0 +1,267 @@
+# app/chat_executor.py
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FuturesTimeoutError
+
+from app.deadline import DeadlineExceeded
+
+class ChatQueueFullError(Exception):
+    """
+    Lỗi khi hàng đợi xử lý tin nhắn đã đầy và không nhận thêm request
+    """
+    pass
+
+class ChatExecutor:
+    """
+    Thread pool có kích thước cố định để xử lý tin nhắn chat.
+
+    Số request được nhận cùng lúc bị giới hạn bởi max_workers (đang chạy)
+    cộng với max_queue_size (đang chờ). Khi vượt quá giới hạn, request mới
+    bị từ chối ngay bằng ChatQueueFullError thay vì tạo thêm thread.
+
+    Các tác vụ có cùng serial_key (ví dụ user_id) chạy lần lượt theo thứ tự gửi:
+    tác vụ sau chờ trong hàng đợi đến khi tác vụ trước xong, không chiếm thread xử lý
+    khi chờ, nên không chặn công việc của người dùng khác. Việc tuần tự hóa và gộp
+    request trùng lặp chỉ có hiệu lực trong một process; giữa các worker gunicorn,
+    các lượt của một người dùng được tuần tự hóa bởi SessionStore.lock().
+    """
+
+    def __init__(self, max_workers=4, max_queue_size=16):
+        """
+        Khởi tạo ChatExecutor
+
+        Args:
+            max_workers: Số thread xử lý tối đa
+            max_queue_size: Số request tối đa được phép chờ trong hàng đợi
+        """
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.capacity = max_workers + max_queue_size
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="misoul-chat")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._admitted = 0  # Số request đã nhận và chưa hoàn tất
+        self._running = 0   # Số request đang được xử lý
+        
+        # Tác vụ đang chạy theo khóa, để request trùng lặp dùng chung kết quả
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        
+        # serial_key -> lượt của tác vụ gửi sau cùng (Future hoàn tất khi tác vụ đã chạy xong hoặc bị bỏ qua)
+        self._turns = {}
+        self._turns_lock = threading.Lock()
+
+    @property
+    def in_flight(self):
+        """Số request đang được xử lý"""
+        with self._lock:
+            return self._running
+
+    @property
+    def queue_depth(self):
+        """Số request đang chờ đến lượt xử lý"""
+        with self._lock:
+            return self._admitted - self._running
+
+    def try_acquire(self, running=False):
+        """
+        Giữ một chỗ trong giới hạn của executor mà không chặn
+
+        Args:
+            running: True nếu chỗ này được dùng ngay (ví dụ một stream) thay vì chờ trong hàng đợi
+
+        Returns:
+            bool: True nếu còn chỗ, False nếu đã đầy
+        """
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._admitted += 1
+            if running:
+                self._running += 1
+        return True
+
+    def release(self, running=False):
+        """Trả lại chỗ đã giữ bằng try_acquire (cùng giá trị running)"""
+        with self._lock:
+            self._admitted -= 1
+            if running:
+                self._running -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args, serial_key=None, **kwargs):
+        """
+        Đưa một tác vụ vào hàng đợi xử lý
+
+        Args:
+            fn: Hàm cần chạy
+            *args, **kwargs: Tham số truyền cho hàm
+            serial_key: Khóa của các tác vụ phải chạy lần lượt (tùy chọn), tác vụ này chỉ bắt đầu
+                        sau khi các tác vụ gửi trước có cùng khóa đã xong
+
+        Returns:
+            Future: Kết quả của tác vụ
+
+        Raises:
+            ChatQueueFullError: Nếu hàng đợi đã đầy
+        """
+        if not self.try_acquire():
+            raise ChatQueueFullError(
+                f"Hàng đợi xử lý đã đầy ({self.max_workers} đang chạy, {self.max_queue_size} đang chờ)"
+            )
+
+        future = Future()
+        # Chỗ được trả lại khi tác vụ hoàn tất hoặc bị hủy trước khi chạy
+        future.add_done_callback(lambda _: self.release())
+
+        if serial_key is None:
+            try:
+                self._executor.submit(self._run, future, fn, args, kwargs)
+            except Exception:
+                future.cancel()
+                raise
+            return future
+
+        turn = Future()
+        previous = self._take_turn(serial_key, turn)
+        if previous is None:
+            self._start(future, fn, args, kwargs, turn)
+        else:
+            # Tác vụ chờ lượt ở đây, không chiếm thread xử lý
+            previous.add_done_callback(lambda _: self._start(future, fn, args, kwargs, turn))
+        return future
+
+    def _take_turn(self, serial_key, turn):
+        """
+        Returns:
+            Future: Lượt của tác vụ gửi trước có cùng khóa (None nếu không còn tác vụ nào)
+        """
+        with self._turns_lock:
+            previous = self._turns.get(serial_key)
+            self._turns[serial_key] = turn
+        turn.add_done_callback(lambda done: self._end_turn(serial_key, done))
+        return previous
+
+    def _end_turn(self, serial_key, turn):
+        with self._turns_lock:
+            if self._turns.get(serial_key) is turn:
+                del self._turns[serial_key]
+
+    def _start(self, future, fn, args, kwargs, turn):
+        try:
+            self._executor.submit(self._run, future, fn, args, kwargs, turn)
+        except Exception as e:
+            # Executor đã dừng
+            if future.set_running_or_notify_cancel():
+                future.set_exception(e)
+            turn.set_result(None)
+
+    def _run(self, future, fn, args, kwargs, turn=None):
+        try:
+            # Tác vụ đã bị hủy khi còn chờ thì bỏ qua
+            if not future.set_running_or_notify_cancel():
+                return
+
+            with self._lock:
+                self._running += 1
+            error = None
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                error = e
+            with self._lock:
+                self._running -= 1
+
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        finally:
+            if turn is not None:
+                turn.set_result(None)
+
+    @contextmanager
+    def serialized(self, serial_key, deadline=None):
+        """
+        Giữ lượt của serial_key trong khối lệnh with cho công việc chạy ngoài thread pool
+        (ví dụ một stream), sau khi các tác vụ gửi trước có cùng khóa đã xong
+
+        Args:
+            serial_key: Khóa như trong submit
+            deadline: Deadline của request (tùy chọn), giới hạn thời gian chờ lượt
+
+        Raises:
+            DeadlineExceeded: Nếu hết hạn khi còn chờ tác vụ trước
+        """
+        turn = Future()
+        previous = self._take_turn(serial_key, turn)
+        if previous is not None:
+            try:
+                previous.result(timeout=None if deadline is None else max(deadline.remaining(), 0))
+            except FuturesTimeoutError:
+                # Tác vụ sau vẫn phải chờ tác vụ trước, dù lượt này bị bỏ
+                previous.add_done_callback(lambda _: turn.set_result(None))
+                raise DeadlineExceeded(f"Request đã hết hạn khi chờ lượt trước của {serial_key}")
+
+        try:
+            yield
+        finally:
+            turn.set_result(None)
+
+    def submit_coalesced(self, key, fn, *args, serial_key=None, **kwargs):
+        """
+        Đưa tác vụ vào hàng đợi, hoặc dùng lại tác vụ đang chạy có cùng khóa trong process này
+        
+        Args:
+            key: Khóa xác định các request trùng lặp
+            fn: Hàm cần chạy
+            *args, **kwargs: Tham số truyền cho hàm
+            serial_key: Như trong submit
+            
+        Returns:
+            tuple: (Future, True nếu dùng chung tác vụ đang chạy)
+            
+        Raises:
+            ChatQueueFullError: Nếu hàng đợi đã đầy
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None and not future.done():
+                return future, True
+            
+            future = self.submit(fn, *args, serial_key=serial_key, **kwargs)
+            self._inflight[key] = future
+        
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future, False
+    
+    def try_claim(self, key):
+        """
+        Đánh dấu một request chạy ngoài thread pool (ví dụ stream) đang xử lý với khóa key
+        
+        Returns:
+            bool: False nếu trong process này đã có request cùng khóa đang xử lý
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None and not future.done():
+                return False
+            self._inflight[key] = Future()
+        return True
+    
+    def unclaim(self, key):
+        """Bỏ đánh dấu của try_claim khi request đã xong"""
+        with self._inflight_lock:
+            future = self._inflight.pop(key, None)
+        if future is not None:
+            future.set_result(None)
+    
+    def _forget(self, key, future):
+        with self._inflight_lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+    
+    def shutdown(self, wait=True):
+        """Dừng executor"""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,328 @@
+# app/chunk_store.py
+import os
+import json
+import numpy as np
+from langchain_core.documents import Document
+
+from config import Config
+from app.retrieval_cache import LRUCache
+
+# Tên các file lưu các đoạn văn bản trong thư mục index
+CHUNKS_FILE = "chunks.json"  # Số đoạn, tên các cột metadata và bảng giá trị của mỗi cột
+TEXT_ARRAYS = ("chunk_text", "chunk_offsets")  # Nội dung UTF-8 nối liền và vị trí bắt đầu của từng đoạn
+SNIPPET_ARRAYS = ("chunk_snippets", "chunk_snippet_offsets")  # Đoạn trích dùng trong prompt
+CODES_ARRAY = "chunk_metadata_codes"  # Mã giá trị metadata (số cột x số đoạn)
+LEGACY_DOCUMENTS_FILE = "documents.json"  # Định dạng cũ: toàn bộ đoạn văn bản trong một file JSON
+
+# Khóa metadata chứa đoạn trích tính sẵn của mỗi đoạn (PromptManager chỉ dùng phần này)
+SNIPPET_KEY = "snippet"
+SNIPPET_LENGTH = 300
+
+def save_arrays(directory, **arrays):
+    """
+    Lưu mỗi mảng thành một file .npy không nén (tên mảng + ".npy"), để khi tải có thể
+    memory-map thay vì đọc vào bộ nhớ riêng của process
+
+    Args:
+        directory: Thư mục index
+        **arrays: Tên -> mảng numpy
+    """
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + ".npy"), np.ascontiguousarray(array))
+
+def load_array(directory, name, mmap=None):
+    """
+    Tải mảng do save_arrays ghi
+
+    Khi memory-map (chỉ đọc), các worker gunicorn trên cùng máy dùng chung một bản của
+    file trong page cache của hệ điều hành thay vì mỗi worker giữ một bản sao.
+
+    Args:
+        directory: Thư mục index
+        name: Tên mảng
+        mmap: Memory-map file, mặc định Config.INDEX_MMAP
+
+    Returns:
+        numpy.ndarray: Mảng (numpy.memmap chỉ đọc nếu memory-map)
+    """
+    mmap = Config.INDEX_MMAP if mmap is None else mmap
+    return np.load(os.path.join(directory, name + ".npy"), mmap_mode="r" if mmap else None)
+
+def prompt_snippet(text):
+    """
+    Cắt nội dung một đoạn văn bản để đưa vào prompt
+
+    Args:
+        text: Nội dung đoạn văn bản
+
+    Returns:
+        str: Tối đa SNIPPET_LENGTH ký tự, thêm "..." nếu bị cắt
+    """
+    if len(text) > SNIPPET_LENGTH:
+        return text[:SNIPPET_LENGTH - 3] + "..."
+    return text
+
+def pack_strings(texts):
+    """
+    Nối các chuỗi thành một mảng byte UTF-8 kèm bảng vị trí
+
+    Returns:
+        tuple: (mảng uint8, mảng int64 len(texts) + 1 phần tử); chuỗi i là byte offsets[i]:offsets[i + 1]
+    """
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def load_documents(directory, mmap=None):
+    """
+    Tải các đoạn văn bản của thư mục index (ChunkStore.save hoặc định dạng documents.json cũ)
+
+    Args:
+        directory: Thư mục index
+        mmap: Memory-map các mảng, mặc định Config.INDEX_MMAP
+
+    Returns:
+        ChunkStore: Các đoạn văn bản theo thứ tự đã lưu
+    """
+    legacy_path = os.path.join(directory, LEGACY_DOCUMENTS_FILE)
+    if not os.path.exists(os.path.join(directory, CHUNKS_FILE)) and os.path.exists(legacy_path):
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            return ChunkStore.from_documents(
+                Document(page_content=item["page_content"], metadata=item["metadata"]) for item in json.load(f)
+            )
+    return ChunkStore.load(directory, mmap=mmap)
+
+def as_chunk_store(documents):
+    """
+    Returns:
+        ChunkStore: documents nếu đã là ChunkStore, nếu không thì ChunkStore tạo từ danh sách Document
+    """
+    if isinstance(documents, ChunkStore):
+        return documents
+    return ChunkStore.from_documents(documents)
+
+class ChunkStore:
+    """
+    Lưu các đoạn văn bản theo cột thay cho danh sách Document (hoặc docstore pickle).
+
+    Nội dung của tất cả các đoạn nằm trong một mảng byte UTF-8 với bảng vị trí; đoạn
+    trích cho prompt được tính sẵn và lưu tương tự. Metadata được mã hóa thành số nguyên:
+    mỗi khóa là một cột int32 (-1 nếu đoạn không có khóa đó) với bảng giá trị riêng,
+    nên các cột như category chỉ là vài KB. Khi tải, các mảng được memory-map và chỉ
+    bảng giá trị được đọc; Document chỉ được tạo cho các đoạn được truy cập (các kết quả
+    top-k), với metadata[SNIPPET_KEY] là đoạn trích; các Document hay được trả về nhất
+    được giữ trong một cache LRU (CHUNK_CACHE_SIZE) dùng chung với các phân vùng.
+
+    Dùng như một danh sách Document chỉ đọc (len, chỉ số, duyệt), và như docstore của
+    FAISS (search theo vị trí, với index_to_docstore_id là range).
+    """
+
+    def __init__(self, text, offsets, snippets, snippet_offsets, keys, values, codes, rows=None, cache=None):
+        """
+        Khởi tạo ChunkStore
+
+        Args:
+            text, offsets: Nội dung các đoạn (pack_strings)
+            snippets, snippet_offsets: Đoạn trích của các đoạn (pack_strings)
+            keys: Tên các cột metadata
+            values: Với mỗi cột, danh sách các giá trị khác nhau
+            codes: Mảng int32 (số cột x số đoạn), vị trí giá trị trong values hoặc -1
+            rows: Chỉ dùng các đoạn ở các vị trí này, theo thứ tự (tùy chọn)
+            cache: LRUCache vị trí -> Document dùng chung với store gốc (tùy chọn)
+        """
+        if len(codes) != len(keys) or (len(keys) and codes.shape[1] != len(offsets) - 1):
+            raise ValueError(f"Bảng mã metadata {codes.shape} không khớp với {len(keys)} cột, {len(offsets) - 1} đoạn")
+
+        self.text = text
+        self.offsets = offsets
+        self.snippets = snippets
+        self.snippet_offsets = snippet_offsets
+        self.keys = list(keys)
+        self.values = values
+        self.codes = codes
+        self.rows = rows
+        self._documents = cache if cache is not None else LRUCache("chunk_document", Config.CHUNK_CACHE_SIZE)
+
+    @classmethod
+    def from_documents(cls, documents):
+        """
+        Tạo ChunkStore từ danh sách Document
+
+        Args:
+            documents: Danh sách Document (metadata phải ghi được thành JSON)
+
+        Returns:
+            ChunkStore: Các đoạn văn bản theo thứ tự
+        """
+        documents = list(documents)
+        texts = [doc.page_content for doc in documents]
+        keys = list(dict.fromkeys(key for doc in documents for key in doc.metadata if key != SNIPPET_KEY))
+
+        values = []
+        codes = np.full((len(keys), len(documents)), -1, dtype=np.int32)
+        for column, key in enumerate(keys):
+            column_values, lookup = [], {}
+            for row, doc in enumerate(documents):
+                if key not in doc.metadata:
+                    continue
+                value = doc.metadata[key]
+                token = json.dumps(value, sort_keys=True)
+                code = lookup.get(token)
+                if code is None:
+                    code = lookup[token] = len(column_values)
+                    column_values.append(value)
+                codes[column, row] = code
+            values.append(column_values)
+
+        return cls(*pack_strings(texts), *pack_strings(prompt_snippet(text) for text in texts), keys, values, codes)
+
+    def __len__(self):
+        if self.rows is not None:
+            return len(self.rows)
+        return len(self.offsets) - 1
+
+    def _position(self, i):
+        """Vị trí trong các mảng của đoạn thứ i"""
+        return int(self.rows[i]) if self.rows is not None else int(i)
+
+    @staticmethod
+    def _decode(blob, offsets, position):
+        start, end = offsets[position:position + 2].tolist()
+        return blob[start:end].tobytes().decode("utf-8")
+
+    def _text(self, position):
+        return self._decode(self.text, self.offsets, position)
+
+    def _metadata(self, position):
+        metadata = {}
+        for key, column_values, code in zip(self.keys, self.values, self.codes[:, position].tolist()):
+            if code >= 0:
+                metadata[key] = column_values[code]
+        metadata[SNIPPET_KEY] = self._decode(self.snippets, self.snippet_offsets, position)
+        return metadata
+
+    def __getitem__(self, i):
+        """
+        Tạo Document của đoạn thứ i
+
+        Returns:
+            Document: Nội dung và metadata (kèm metadata[SNIPPET_KEY]) của đoạn (dùng chung, không được sửa)
+        """
+        if not -len(self) <= i < len(self):
+            raise IndexError(f"Không có đoạn {i} ({len(self)} đoạn)")
+        position = self._position(i % len(self))
+        document = self._documents.get(position)
+        if document is None:
+            document = Document(page_content=self._text(position), metadata=self._metadata(position))
+            self._documents.put(position, document)
+        return document
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def search(self, search):
+        """Tìm đoạn theo vị trí (giao diện Docstore mà FAISS dùng)"""
+        return self[search]
+
+    def texts(self):
+        """
+        Returns:
+            list: Nội dung các đoạn theo thứ tự, không tạo Document
+        """
+        return [self._text(self._position(i)) for i in range(len(self))]
+
+    def column(self, key):
+        """
+        Lấy giá trị một khóa metadata của tất cả các đoạn mà không tạo Document
+
+        Args:
+            key: Khóa metadata (ví dụ "category")
+
+        Returns:
+            numpy.ndarray: Mảng object, None với đoạn không có khóa này
+        """
+        if key not in self.keys:
+            return np.full(len(self), None, dtype=object)
+        column = self.keys.index(key)
+        # Mã -1 lấy phần tử cuối của bảng là None
+        table = np.empty(len(self.values[column]) + 1, dtype=object)
+        table[:-1] = self.values[column]
+        codes = self.codes[column] if self.rows is None else self.codes[column][self.rows]
+        return table[codes]
+
+    def subset(self, rows):
+        """
+        Tạo ChunkStore chỉ gồm các đoạn đã chọn, dùng chung các mảng (không chép nội dung)
+
+        Args:
+            rows: Vị trí các đoạn, theo thứ tự mới
+
+        Returns:
+            ChunkStore: Các đoạn đã chọn
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.rows is not None:
+            rows = self.rows[rows]
+        return ChunkStore(
+            self.text, self.offsets, self.snippets, self.snippet_offsets,
+            self.keys, self.values, self.codes, rows=rows, cache=self._documents
+        )
+
+    @property
+    def nbytes(self):
+        """Dung lượng các mảng (byte), không tính bảng giá trị metadata"""
+        arrays = (self.text, self.offsets, self.snippets, self.snippet_offsets, self.codes)
+        return sum(array.nbytes for array in arrays)
+
+    def save(self, directory):
+        """
+        Lưu các đoạn văn bản vào thư mục index
+
+        Args:
+            directory: Thư mục index
+        """
+        if self.rows is not None:
+            ChunkStore.from_documents(self).save(directory)
+            return
+
+        save_arrays(
+            directory,
+            **dict(zip(TEXT_ARRAYS, (self.text, self.offsets))),
+            **dict(zip(SNIPPET_ARRAYS, (self.snippets, self.snippet_offsets))),
+            **{CODES_ARRAY: self.codes}
+        )
+        with open(os.path.join(directory, CHUNKS_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"chunks": len(self), "keys": self.keys, "values": self.values}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, mmap=None):
+        """
+        Tải các đoạn văn bản do save ghi
+
+        Args:
+            directory: Thư mục index
+            mmap: Memory-map các mảng, mặc định Config.INDEX_MMAP
+
+        Returns:
+            ChunkStore: Các đoạn văn bản (nội dung chưa được đọc nếu memory-map)
+
+        Raises:
+            ValueError: Nếu các file không khớp với nhau
+        """
+        with open(os.path.join(directory, CHUNKS_FILE), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        text, offsets = (load_array(directory, name, mmap) for name in TEXT_ARRAYS)
+        snippets, snippet_offsets = (load_array(directory, name, mmap) for name in SNIPPET_ARRAYS)
+        codes = load_array(directory, CODES_ARRAY, mmap)
+        # Bỏ lớp numpy.memmap (vẫn là vùng nhớ đã memory-map): cắt lát ndarray thường nhanh hơn nhiều
+        text, offsets, snippets, snippet_offsets, codes = (
+            np.asarray(array) for array in (text, offsets, snippets, snippet_offsets, codes)
+        )
+
+        if len(offsets) - 1 != info["chunks"] or len(snippet_offsets) != len(offsets):
+            raise ValueError(f"Bảng vị trí không khớp với {info['chunks']} đoạn trong {CHUNKS_FILE}")
+        if offsets[-1] != len(text) or snippet_offsets[-1] != len(snippets):
+            raise ValueError("Nội dung các đoạn văn bản bị thiếu")
+        return cls(text, offsets, snippets, snippet_offsets, info["keys"], info["values"], codes)
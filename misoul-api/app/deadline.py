@@ -0,0 +1,63 @@
+# app/deadline.py
+import time
+
+class DeadlineExceeded(Exception):
+    """
+    Lỗi khi request đã hết thời gian cho phép, phần việc còn lại bị bỏ qua
+    """
+    pass
+
+class Deadline:
+    """
+    Thời hạn xử lý của một request, được truyền qua toàn bộ pipeline chat.
+
+    Mỗi bước kiểm tra thời hạn trước khi bắt đầu phần việc tốn kém
+    (truy xuất tài liệu, gọi Gemini) và trước khi ghi trạng thái hội thoại,
+    để request đã bị client bỏ không còn gây tác dụng phụ.
+    """
+
+    def __init__(self, timeout_seconds):
+        """
+        Khởi tạo Deadline
+
+        Args:
+            timeout_seconds: Số giây tính từ bây giờ đến khi hết hạn
+        """
+        self.timeout_seconds = timeout_seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + timeout_seconds
+    
+    def elapsed(self):
+        """
+        Returns:
+            float: Số giây đã trôi qua kể từ khi request bắt đầu
+        """
+        return time.monotonic() - self.started_at
+
+    def remaining(self):
+        """
+        Returns:
+            float: Số giây còn lại (không âm)
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        """
+        Returns:
+            bool: True nếu đã hết hạn
+        """
+        return time.monotonic() >= self.expires_at
+
+    def check(self, stage=""):
+        """
+        Kiểm tra thời hạn và dừng xử lý nếu đã hết hạn
+
+        Args:
+            stage: Tên bước đang thực hiện (để ghi log)
+
+        Raises:
+            DeadlineExceeded: Nếu đã hết hạn
+        """
+        if self.expired():
+            where = f" trước bước {stage}" if stage else ""
+            raise DeadlineExceeded(f"Request đã hết hạn sau {self.timeout_seconds}s{where}")
@@ -0,0 +1,207 @@
+# app/faiss_index.py
+import os
+import math
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from config import Config
+from app.chunk_store import ChunkStore, as_chunk_store, load_documents, CHUNKS_FILE
+from app.index_manifest import IndexManifestError
+
+# Các loại index FAISS (Config.FAISS_INDEX_TYPE)
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# IVF cần khoảng 39 vector huấn luyện cho mỗi cụm để k-means ổn định
+MIN_POINTS_PER_CENTROID = 39
+
+# Tên file index FAISS (như FAISS.save_local); các đoạn văn bản lưu bằng ChunkStore
+INDEX_FILE = "index.faiss"
+LEGACY_DOCSTORE_FILE = "index.pkl"  # Docstore pickle của FAISS.save_local, không còn được tải
+
+def get_index_type():
+    """
+    Lấy loại index FAISS đang được cấu hình
+
+    Returns:
+        str: "flat", "ivf_flat", "ivf_pq" hoặc "hnsw"
+
+    Raises:
+        ValueError: Nếu FAISS_INDEX_TYPE không được hỗ trợ
+    """
+    index_type = Config.FAISS_INDEX_TYPE.lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"FAISS_INDEX_TYPE không hợp lệ: {Config.FAISS_INDEX_TYPE} (hỗ trợ: {', '.join(INDEX_TYPES)})")
+    return index_type
+
+def choose_nlist(count):
+    """
+    Chọn số cụm IVF: FAISS_NLIST nếu được đặt, nếu không thì khoảng căn bậc hai số vector,
+    giới hạn để mỗi cụm có đủ vector huấn luyện
+
+    Args:
+        count: Số vector trong index
+
+    Returns:
+        int: Số cụm
+    """
+    nlist = Config.FAISS_NLIST or int(math.sqrt(count))
+    return max(1, min(nlist, count // MIN_POINTS_PER_CENTROID))
+
+def choose_pq_subquantizers(dimension):
+    """
+    Returns:
+        int: Số sub-quantizer PQ lớn nhất không vượt FAISS_PQ_M mà chia hết số chiều
+    """
+    m = max(1, min(Config.FAISS_PQ_M, dimension))
+    while dimension % m:
+        m -= 1
+    return m
+
+def factory_string(index_type, dimension, count):
+    """
+    Tạo chuỗi mô tả index cho faiss.index_factory
+
+    Args:
+        index_type: Loại index (INDEX_TYPES)
+        dimension: Số chiều vector
+        count: Số vector trong index
+
+    Returns:
+        str: Ví dụ "Flat", "IVF49,Flat", "IVF49,PQ50x5", "HNSW32"
+    """
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{Config.FAISS_HNSW_M}"
+
+    nlist = choose_nlist(count)
+    if index_type == "ivf_pq":
+        # Mỗi sub-quantizer có 2^nbits tâm cụm, giảm số bit khi không đủ vector huấn luyện
+        nbits = Config.FAISS_PQ_NBITS
+        while nbits > 1 and count < MIN_POINTS_PER_CENTROID * 2 ** nbits:
+            nbits -= 1
+        return f"IVF{nlist},PQ{choose_pq_subquantizers(dimension)}x{nbits}"
+    return f"IVF{nlist},Flat"
+
+def configure_search(index, nprobe=None, ef_search=None):
+    """
+    Đặt tham số tìm kiếm của index (không cần xây dựng lại), mặc định lấy từ Config
+
+    Args:
+        index: Index FAISS (vector_db.index)
+        nprobe: Số cụm IVF được duyệt mỗi truy vấn, mặc định Config.FAISS_NPROBE
+        ef_search: Độ rộng tìm kiếm HNSW, mặc định Config.FAISS_EF_SEARCH
+    """
+    import faiss
+
+    parameters = faiss.ParameterSpace()
+    if faiss.try_extract_index_ivf(index) is not None:
+        parameters.set_index_parameter(index, "nprobe", nprobe or Config.FAISS_NPROBE)
+    elif hasattr(index, "hnsw"):
+        parameters.set_index_parameter(index, "efSearch", ef_search or Config.FAISS_EF_SEARCH)
+
+def create_faiss_index(vectors, index_type):
+    """
+    Tạo và huấn luyện index FAISS (chưa thêm vector)
+
+    Args:
+        vectors: Mảng float32 (số vector x số chiều), dùng để huấn luyện IVF/PQ
+        index_type: Loại index (INDEX_TYPES)
+
+    Returns:
+        faiss.Index: Index rỗng đã huấn luyện, tham số tìm kiếm lấy từ Config
+    """
+    import faiss
+
+    count, dimension = vectors.shape
+    index = faiss.index_factory(dimension, factory_string(index_type, dimension, count))
+    if hasattr(index, "hnsw"):
+        index.hnsw.efConstruction = Config.FAISS_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(vectors)
+    configure_search(index)
+    return index
+
+def save_faiss_store(db, directory):
+    """
+    Lưu FAISS vector store: index FAISS và các đoạn văn bản dạng ChunkStore (không pickle)
+
+    Args:
+        db: FAISS vector store
+        directory: Thư mục lưu
+    """
+    import faiss
+
+    os.makedirs(directory, exist_ok=True)
+    faiss.write_index(db.index, os.path.join(directory, INDEX_FILE))
+    documents = db.docstore
+    if not isinstance(documents, ChunkStore):
+        # Store tạo bằng FAISS.from_documents: lấy Document theo thứ tự vector trong index
+        documents = [db.docstore.search(db.index_to_docstore_id[i]) for i in range(db.index.ntotal)]
+    as_chunk_store(documents).save(directory)
+
+def load_faiss_store(directory, embedding, mmap=None):
+    """
+    Tải FAISS vector store do save_faiss_store ghi, memory-map index nếu được
+
+    Memory-map index nên các worker trên cùng máy dùng chung vector trong page cache.
+    IO_FLAG_MMAP_IFC (faiss mới) memory-map cả index Flat/HNSW; với faiss cũ chỉ có
+    IO_FLAG_MMAP, chỉ áp dụng cho inverted list của IVF. Các đoạn văn bản là ChunkStore
+    dùng làm docstore (vị trí vector là ID), không unpickle gì khi tải.
+
+    Args:
+        directory: Thư mục index
+        embedding: MISOULEmbeddings đã tải từ cùng thư mục
+        mmap: Memory-map index và các đoạn văn bản, mặc định Config.INDEX_MMAP
+
+    Returns:
+        FAISS: Vector store đã tải, tham số tìm kiếm lấy từ Config
+
+    Raises:
+        IndexManifestError: Nếu index ở định dạng cũ (docstore pickle)
+    """
+    import faiss
+
+    if not os.path.exists(os.path.join(directory, CHUNKS_FILE)):
+        raise IndexManifestError(f"Index FAISS định dạng cũ ({LEGACY_DOCSTORE_FILE}), cần xây dựng lại")
+
+    mmap = Config.INDEX_MMAP if mmap is None else mmap
+    index_path = os.path.join(directory, INDEX_FILE)
+    index = None
+    if mmap:
+        try:
+            mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            index = faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"⚠️ Không memory-map được index FAISS, đọc vào bộ nhớ: {e}")
+    if index is None:
+        index = faiss.read_index(index_path)
+
+    documents = load_documents(directory, mmap=mmap)
+    if len(documents) != index.ntotal:
+        raise ValueError(f"Index FAISS có {index.ntotal} vector nhưng có {len(documents)} đoạn văn bản")
+    configure_search(index)
+    return FAISS(embedding, index, documents, range(len(documents)))
+
+def build_faiss_store(documents, embedding, index_type=None):
+    """
+    Tạo FAISS vector store với loại index đã cấu hình
+
+    Với "flat" kết quả giống FAISS.from_documents; các loại khác là tìm kiếm gần đúng,
+    nhanh hơn khi số đoạn văn bản lớn.
+
+    Args:
+        documents: ChunkStore hoặc danh sách Document
+        embedding: MISOULEmbeddings (được fit nếu chưa fit)
+        index_type: Loại index, mặc định Config.FAISS_INDEX_TYPE
+
+    Returns:
+        FAISS: Vector store mới, docstore là ChunkStore như khi tải bằng load_faiss_store
+    """
+    index_type = index_type or get_index_type()
+    documents = as_chunk_store(documents)
+    vectors = embedding.embed_documents_sparse(documents.texts()).toarray().astype(np.float32)
+
+    index = create_faiss_index(vectors, index_type)
+    index.add(vectors)
+    return FAISS(embedding, index, documents, range(len(documents)))
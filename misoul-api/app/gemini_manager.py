@@ -2,6 +2,9 @@
 import os
 import time
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from app.deadline import DeadlineExceeded
+from app.metrics import STAGE_LATENCY, GEMINI_ERRORS
 
 class GeminiManager:
 
@@ -33,39 +36,154 @@ class GeminiManager:
             print(f"❌ Lỗi khi khởi tạo model: {e}")
             raise ValueError(f"Không thể khởi tạo model {model_name}. Chi tiết lỗi: {str(e)}")
     
-    def generate_response(self, prompt, temperature=None, max_tokens=None):
-       
+    def _build_generation_config(self, temperature=None, max_tokens=None):
+        """
+        Tạo cấu hình generation cho một lần gọi mà không thay đổi cấu hình dùng chung của model
+        """
         generation_config = self.generation_config.copy()
         if temperature is not None:
             generation_config["temperature"] = temperature
         if max_tokens is not None:
             generation_config["max_output_tokens"] = max_tokens
+        return generation_config
+    
+    def _enhance_prompt(self, prompt):
+        """
+        Gắn system instruction của MISOUL vào đầu prompt
+        """
+        system_instruction = (
+            "Bạn là MISOUL, một người bạn tâm giao với chuyên môn tâm lý sâu sắc, "
+            "luôn trả lời bằng tiếng Việt và không lưu trữ dữ liệu người dùng.\n\n"
+        )
+        return system_instruction + prompt
+    
+    @staticmethod
+    def _request_options(deadline):
+        """
+        Tùy chọn cho lần gọi API: timeout bằng thời gian còn lại của request, để chính cuộc
+        gọi HTTP/gRPC bị hủy khi hết hạn (kể cả khi chưa nhận được đoạn nào)
+        """
+        if deadline is None:
+            return None
+        return {"timeout": max(deadline.remaining(), 0.001)}
+    
+    @staticmethod
+    def _cancel_stream(response):
+        """
+        Hủy kết nối streaming tới Gemini nếu chưa đọc hết để không tiếp tục trả tiền cho token
         
-        # Áp dụng cấu hình mới (nếu có)
-        if temperature is not None or max_tokens is not None:
-            self.model.generation_config = generation_config
+        SDK không có API công khai để hủy stream: dùng cancel() của stream gRPC hoặc close()
+        của iterator REST. Khi có deadline, timeout của cuộc gọi (_request_options) vẫn
+        đóng kết nối lúc hết hạn nếu không tìm được cách hủy.
+        """
+        if response is None or getattr(response, "_done", False):
+            return
+        iterator = getattr(response, "_iterator", None)
+        cancel = getattr(iterator, "cancel", None) or getattr(iterator, "close", None)
+        if not callable(cancel):
+            print("⚠️ Không tìm thấy cách hủy stream Gemini (SDK đã thay đổi?), kết nối chỉ đóng khi hết timeout")
+            return
+        try:
+            cancel()
+        except Exception as e:
+            print(f"⚠️ Không thể hủy stream Gemini: {e}")
+    
+    def generate_response(self, prompt, temperature=None, max_tokens=None, deadline=None):
+        
+        # Khi có thời hạn, dùng streaming để có thể dừng và hủy cuộc gọi ngay khi hết hạn
+        if deadline is not None:
+            return "".join(self.generate_response_stream(prompt, temperature, max_tokens, deadline=deadline))
+       
+        # Cấu hình được truyền theo từng lần gọi để các request song song không ghi đè lẫn nhau
+        generation_config = self._build_generation_config(temperature, max_tokens)
         
         # Ghi log cấu hình (cho debug)
         log_config = f"Temperature: {generation_config['temperature']}, Max tokens: {generation_config['max_output_tokens']}"
         
-        system_instruction = (
-            "Bạn là MISOUL, một người bạn tâm giao với chuyên môn tâm lý sâu sắc, "
-            "luôn trả lời bằng tiếng Việt và không lưu trữ dữ liệu người dùng.\n\n"
-        )
-        enhanced_prompt = system_instruction + prompt
+        enhanced_prompt = self._enhance_prompt(prompt)
         
         # Gọi API với xử lý lỗi
         try:
             start_time = time.time()
-            response = self.model.generate_content(enhanced_prompt)
+            response = self.model.generate_content(enhanced_prompt, generation_config=generation_config)
             end_time = time.time()
             
             # Log thời gian phản hồi
             print(f"⏱️ Thời gian phản hồi: {end_time - start_time:.2f} giây | {log_config}")
+            STAGE_LATENCY.observe(end_time - start_time, stage="llm")
             
             return response.text
             
         except Exception as e:
+            GEMINI_ERRORS.inc()
             error_msg = f"Lỗi khi gọi Gemini API: {str(e)}"
             print(f"❌ {error_msg}")
-            return f"Xin lỗi, tôi đang gặp khó khăn kỹ thuật. Vui lòng thử lại sau. (Chi tiết: {str(e)[:100]})"
\ No newline at end of file
+            return f"Xin lỗi, tôi đang gặp khó khăn kỹ thuật. Vui lòng thử lại sau. (Chi tiết: {str(e)[:100]})"
+    
+    def generate_response_stream(self, prompt, temperature=None, max_tokens=None, deadline=None):
+        """
+        Gọi Gemini ở chế độ streaming và trả về từng đoạn text ngay khi nhận được
+        
+        Args:
+            prompt: Prompt đã xây dựng
+            temperature: Temperature cho lần gọi này (tùy chọn)
+            max_tokens: Số token tối đa cho lần gọi này (tùy chọn)
+            deadline: Deadline của request (tùy chọn), stream bị hủy khi hết hạn
+            
+        Yields:
+            str: Các đoạn text theo thứ tự Gemini sinh ra
+            
+        Raises:
+            DeadlineExceeded: Nếu hết hạn trước hoặc trong khi sinh phản hồi
+        """
+        if deadline is not None:
+            deadline.check("gọi Gemini")
+        
+        generation_config = self._build_generation_config(temperature, max_tokens)
+        log_config = f"Temperature: {generation_config['temperature']}, Max tokens: {generation_config['max_output_tokens']}"
+        enhanced_prompt = self._enhance_prompt(prompt)
+        
+        start_time = time.time()
+        first_chunk_time = None
+        received_text = False
+        response = None
+        try:
+            response = self.model.generate_content(
+                enhanced_prompt,
+                generation_config=generation_config,
+                stream=True,
+                request_options=self._request_options(deadline)
+            )
+            for chunk in response:
+                if deadline is not None:
+                    deadline.check("nhận phản hồi Gemini")
+                text = chunk.text
+                if not text:
+                    continue
+                if first_chunk_time is None:
+                    first_chunk_time = time.time()
+                    STAGE_LATENCY.observe(first_chunk_time - start_time, stage="llm_first_chunk")
+                received_text = True
+                yield text
+            
+            end_time = time.time()
+            first_chunk_delay = (first_chunk_time or end_time) - start_time
+            print(f"⏱️ Thời gian phản hồi (stream): {end_time - start_time:.2f} giây, đoạn đầu sau {first_chunk_delay:.2f} giây | {log_config}")
+            STAGE_LATENCY.observe(end_time - start_time, stage="llm")
+            
+        except DeadlineExceeded:
+            print(f"⏱️ Hủy gọi Gemini do request đã hết hạn sau {time.time() - start_time:.2f} giây")
+            raise
+        except Exception as e:
+            # Timeout của cuộc gọi bằng thời gian còn lại nên lỗi timeout nghĩa là request đã hết hạn
+            if deadline is not None and (deadline.expired() or isinstance(e, google_exceptions.DeadlineExceeded)):
+                raise DeadlineExceeded(f"Request đã hết hạn khi gọi Gemini: {str(e)}")
+            GEMINI_ERRORS.inc()
+            error_msg = f"Lỗi khi gọi Gemini API (stream): {str(e)}"
+            print(f"❌ {error_msg}")
+            # Nếu đã gửi một phần nội dung thì tách lời xin lỗi thành đoạn riêng
+            separator = "\n\n" if received_text else ""
+            yield f"{separator}Xin lỗi, tôi đang gặp khó khăn kỹ thuật. Vui lòng thử lại sau. (Chi tiết: {str(e)[:100]})"
+        finally:
+            # Client ngắt kết nối hoặc hết hạn: hủy cuộc gọi đang chạy
+            self._cancel_stream(response)
@@ -0,0 +1,323 @@
+# app/hybrid_retriever.py
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List
+from langchain_core.documents import Document
+
+from config import Config
+from app.metrics import RETRIEVER_LATENCY, RETRIEVER_DROPPED
+from app.partitions import CategoryPartitions
+
+class BackendPool:
+    """
+    Thread pool riêng của một backend, giới hạn số lượt tìm kiếm đang chạy.
+
+    Lượt tìm kiếm bị bỏ qua do timeout vẫn chạy đến hết (future.cancel() không dừng được
+    task đã bắt đầu). Mỗi backend có pool riêng nên task cũ của backend chậm không chặn
+    backend khác, và không nhận thêm task khi mọi thread đang bận, nên task không bao
+    giờ phải xếp hàng sau các task cũ.
+    """
+
+    def __init__(self, backend, max_workers):
+        """
+        Args:
+            backend: Tên backend (đặt tên thread)
+            max_workers: Số lượt tìm kiếm chạy cùng lúc tối đa
+        """
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"misoul-retriever-{backend}")
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self):
+        """Số lượt tìm kiếm đang chạy"""
+        return self._in_flight
+
+    def try_submit(self, function, *args):
+        """
+        Returns:
+            Future: Lượt tìm kiếm đã gửi, None nếu mọi thread của backend đang bận
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers:
+                return None
+            self._in_flight += 1
+        future = self._executor.submit(self._run, function, args)
+        future.add_done_callback(self._release_cancelled)
+        return future
+
+    def _run(self, function, args):
+        # Trả chỗ trước khi future hoàn tất, để lượt kế tiếp của cùng thread gọi không bị coi là bận
+        try:
+            return function(*args)
+        finally:
+            self._release()
+
+    def _release_cancelled(self, future):
+        # Task bị hủy trước khi chạy thì _run không trả chỗ
+        if future.cancelled():
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+# Pool của từng backend, dùng chung cho mọi HybridRetriever để thay index không tạo thêm thread
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(backend, max_workers):
+    with _pools_lock:
+        pool = _pools.get(backend)
+        if pool is None:
+            pool = _pools[backend] = BackendPool(backend, max_workers)
+        return pool
+
+def document_key(doc):
+    """
+    Khóa nhận diện một đoạn văn bản giữa các backend (mỗi backend có bản Document riêng)
+    """
+    return (doc.metadata.get("source"), doc.page_content)
+
+def reciprocal_rank_fusion(result_lists, top_k, k=60):
+    """
+    Gộp nhiều danh sách kết quả bằng reciprocal rank fusion
+
+    Mỗi tài liệu được cộng 1 / (k + thứ hạng) từ mỗi danh sách có chứa nó, nên chỉ
+    dùng thứ hạng chứ không cần điểm của các backend cùng thang đo.
+
+    Args:
+        result_lists: Danh sách các list Document, mỗi list đã xếp theo độ liên quan
+        top_k: Số kết quả trả về
+        k: Hằng số làm giảm ảnh hưởng của các thứ hạng đầu
+
+    Returns:
+        list: Các Document có điểm gộp cao nhất
+    """
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [documents[key] for key in best]
+
+class HybridRetriever:
+    """
+    Tìm kiếm song song trên nhiều backend và gộp kết quả bằng reciprocal rank fusion.
+
+    Các backend được tìm cùng lúc nên độ trễ bằng backend chậm nhất chứ không phải tổng.
+    Backend không trả kết quả trong timeout, hoặc đang bận hết thread với các lượt trước
+    (BackendPool), bị bỏ qua trong lượt đó; lượt trò chuyện dùng kết quả của các backend
+    còn lại.
+
+    Có cùng các hàm tìm kiếm mà RAGManager dùng với FAISS (similarity_search).
+    """
+
+    # Mỗi backend lấy nhiều ứng viên hơn top_k để việc gộp có ý nghĩa
+    CANDIDATE_MULTIPLIER = 3
+
+    def __init__(self, stores, timeout=None, rrf_k=None):
+        """
+        Khởi tạo HybridRetriever
+
+        Args:
+            stores: dict tên backend -> vector store (có similarity_search)
+            timeout: Thời gian chờ tối đa cho mỗi lượt tìm kiếm (giây), mặc định Config.HYBRID_TIMEOUT_MS
+            rrf_k: Hằng số k của reciprocal rank fusion, mặc định Config.HYBRID_RRF_K
+        """
+        if not stores:
+            raise ValueError("HybridRetriever cần ít nhất một backend")
+
+        self.stores = dict(stores)
+        self.timeout = timeout if timeout is not None else Config.HYBRID_TIMEOUT_MS / 1000
+        self.rrf_k = rrf_k if rrf_k is not None else Config.HYBRID_RRF_K
+        # Mỗi thread xử lý chat tìm tối đa một lượt trên mỗi backend cùng lúc
+        self._pools = {backend: _get_pool(backend, max(2, Config.CHAT_MAX_WORKERS)) for backend in self.stores}
+
+    def __len__(self):
+        return max(len(store) for store in self.stores.values())
+
+    def category_counts(self):
+        """
+        Returns:
+            dict: Danh mục -> số đoạn văn bản, None nếu có backend không hỗ trợ phân vùng (FAISS)
+        """
+        if not all(isinstance(store, CategoryPartitions) for store in self.stores.values()):
+            return None
+        return next(iter(self.stores.values())).category_counts()
+
+    def encode_query(self, text):
+        """
+        Tạo vector truy vấn cho từng backend
+
+        Returns:
+            dict: Tên backend -> vector, None nếu có backend không hỗ trợ encode_query (FAISS)
+        """
+        if not all(hasattr(store, "encode_query") for store in self.stores.values()):
+            return None
+        return {backend: store.encode_query(text) for backend, store in self.stores.items()}
+
+    def _submit(self, backend, function, *args):
+        """
+        Gửi lượt tìm kiếm vào pool của backend
+
+        Returns:
+            Future: None nếu backend đang bận hết thread (lượt này bỏ qua backend đó)
+        """
+        future = self._pools[backend].try_submit(function, *args)
+        if future is None:
+            RETRIEVER_DROPPED.inc(backend=backend, reason="busy")
+            print(f"⚠️ Backend {backend} đang bận với các lượt tìm kiếm trước, bỏ qua")
+        return future
+
+    @staticmethod
+    def _search(backend, store, query, k, search_kwargs):
+        start_time = time.perf_counter()
+        try:
+            return store.similarity_search(query, k=k, **search_kwargs)
+        finally:
+            RETRIEVER_LATENCY.observe(time.perf_counter() - start_time, backend=backend)
+
+    def similarity_search(self, query: str, k: int = 4, deadline=None, categories=None, expansion=None) -> List[Document]:
+        """
+        Tìm tài liệu trên tất cả backend và gộp kết quả (tham số như similarity_search_with_status)
+
+        Returns:
+            List[Document]: Danh sách tài liệu, liên quan nhất trước
+        """
+        documents, _ = self.similarity_search_with_status(
+            query, k=k, deadline=deadline, categories=categories, expansion=expansion
+        )
+        return documents
+
+    def similarity_search_with_status(self, query: str, k: int = 4, deadline=None, categories=None, expansion=None):
+        """
+        Tìm tài liệu trên tất cả backend và gộp kết quả
+
+        Args:
+            query: Câu truy vấn
+            k: Số kết quả
+            deadline: Deadline của request (tùy chọn), rút ngắn thời gian chờ nếu còn ít hơn timeout
+            categories: Chỉ tìm trong các danh mục này (tùy chọn, cần category_counts() khác None)
+            expansion: (vector từ khóa do encode_query tạo, trọng số) cộng vào vector truy vấn
+                       của từng backend (tùy chọn)
+
+        Returns:
+            tuple: (danh sách tài liệu liên quan nhất trước, True nếu tất cả backend đều trả kết quả)
+        """
+        timeout = self.timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+
+        candidates = max(k * self.CANDIDATE_MULTIPLIER, k)
+        futures = {}
+        for backend, store in self.stores.items():
+            # Mỗi backend tự tạo vector truy vấn trong thread của nó
+            search_kwargs = {}
+            if categories:
+                search_kwargs["categories"] = categories
+            if expansion is not None:
+                keyword_vectors, weight = expansion
+                search_kwargs["expansion"] = (keyword_vectors[backend], weight)
+            future = self._submit(backend, self._search, backend, store, query, candidates, search_kwargs)
+            if future is not None:
+                futures[future] = backend
+        done, not_done = wait(futures, timeout=timeout)
+
+        result_lists = []
+        for future in futures:
+            backend = futures[future]
+            if future in not_done:
+                # Lượt tìm kiếm vẫn chạy xong trong nền nhưng kết quả không được dùng
+                future.cancel()
+                RETRIEVER_DROPPED.inc(backend=backend, reason="timeout")
+                print(f"⚠️ Backend {backend} không trả kết quả trong {timeout * 1000:.0f}ms, bỏ qua")
+                continue
+            try:
+                result_lists.append(future.result())
+            except Exception as e:
+                RETRIEVER_DROPPED.inc(backend=backend, reason="error")
+                print(f"⚠️ Lỗi khi tìm kiếm với backend {backend}: {e}")
+
+        complete = len(result_lists) == len(self.stores)
+        return reciprocal_rank_fusion(result_lists, top_k=k, k=self.rrf_k), complete
+
+    @staticmethod
+    def _search_batch(backend, store, queries, k, search_kwargs):
+        start_time = time.perf_counter()
+        try:
+            return store.similarity_search_batch(queries, k=k, **search_kwargs)
+        finally:
+            RETRIEVER_LATENCY.observe(time.perf_counter() - start_time, backend=backend)
+
+    def similarity_search_batch(self, queries, k: int = 4, deadline=None, categories=None, expansion=None):
+        """
+        Tìm kiếm cho nhiều câu truy vấn (tham số như similarity_search_batch_with_status)
+
+        Returns:
+            list: Với mỗi truy vấn theo thứ tự, danh sách tài liệu liên quan nhất trước
+        """
+        results, _ = self.similarity_search_batch_with_status(
+            queries, k=k, deadline=deadline, categories=categories, expansion=expansion
+        )
+        return results
+
+    def similarity_search_batch_with_status(self, queries, k: int = 4, deadline=None, categories=None, expansion=None):
+        """
+        Tìm kiếm cho nhiều câu truy vấn: mỗi backend chấm điểm cả lô trong thread của nó
+        (similarity_search_batch), sau đó kết quả của từng truy vấn được gộp bằng RRF
+
+        Không có timeout mặc định vì lô truy vấn không gắn với một lượt trò chuyện;
+        chỉ chờ đến deadline nếu có.
+
+        Args:
+            queries: Danh sách câu truy vấn
+            k: Số kết quả của mỗi truy vấn
+            deadline: Deadline (tùy chọn), backend chưa xong khi hết hạn bị bỏ qua
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+            expansion: (vector từ khóa do encode_query tạo, trọng số) cộng vào vector của mọi truy vấn (tùy chọn)
+
+        Returns:
+            tuple: (danh sách kết quả theo thứ tự truy vấn, True nếu tất cả backend đều trả kết quả)
+        """
+        timeout = deadline.remaining() if deadline is not None else None
+
+        candidates = max(k * self.CANDIDATE_MULTIPLIER, k)
+        futures = {}
+        for backend, store in self.stores.items():
+            search_kwargs = {}
+            if categories:
+                search_kwargs["categories"] = categories
+            if expansion is not None:
+                keyword_vectors, weight = expansion
+                search_kwargs["expansion"] = (keyword_vectors[backend], weight)
+            future = self._submit(backend, self._search_batch, backend, store, queries, candidates, search_kwargs)
+            if future is not None:
+                futures[future] = backend
+        done, not_done = wait(futures, timeout=timeout)
+
+        backend_results = []
+        for future in futures:
+            backend = futures[future]
+            if future in not_done:
+                future.cancel()
+                RETRIEVER_DROPPED.inc(backend=backend, reason="timeout")
+                print(f"⚠️ Backend {backend} không trả kết quả cho lô {len(queries)} truy vấn trước deadline, bỏ qua")
+                continue
+            try:
+                backend_results.append(future.result())
+            except Exception as e:
+                RETRIEVER_DROPPED.inc(backend=backend, reason="error")
+                print(f"⚠️ Lỗi khi tìm kiếm theo lô với backend {backend}: {e}")
+
+        complete = len(backend_results) == len(self.stores)
+        results = [
+            reciprocal_rank_fusion([results[i] for results in backend_results], top_k=k, k=self.rrf_k)
+            for i in range(len(queries))
+        ]
+        return results, complete
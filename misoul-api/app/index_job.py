@@ -0,0 +1,206 @@
+# app/index_job.py
+import os
+import threading
+import time
+import traceback
+
+try:
+    import fcntl  # Khóa file giữa các process (chỉ có trên Unix)
+except ImportError:
+    fcntl = None
+
+from config import Config
+from app.index_versions import current_version
+
+class IndexBuildCancelled(Exception):
+    """
+    Lỗi khi job xây dựng index bị hủy theo yêu cầu
+    """
+    pass
+
+class IndexBuildJob:
+    """
+    Job chạy nền để xử lý PDF và xây dựng lại vector database.
+
+    Job chạy trong một thread riêng nên request chat vẫn được phục vụ
+    (không có RAG hoặc với index cũ) trong lúc xây dựng. Index được ghi vào
+    một phiên bản mới (index_versions); khi xong, phiên bản mới được chuyển
+    cho on_complete để thay thế index đang dùng.
+    """
+
+    def __init__(self, on_complete=None):
+        """
+        Khởi tạo IndexBuildJob
+
+        Args:
+            on_complete: Hàm nhận (vector store mới, tên phiên bản) sau khi xây dựng thành công
+        """
+        self.on_complete = on_complete
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._thread = None
+        self._reset("idle")
+
+    def _reset(self, state):
+        self.state = state
+        self.stage = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.files_total = 0
+        self.files_done = 0
+        self.pages = 0
+        self.chunks = 0
+        self.chunks_indexed = 0
+
+    @property
+    def running(self):
+        """True nếu job đang chạy"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, force=True):
+        """
+        Bắt đầu xây dựng index trong thread nền
+
+        Args:
+            force: Xây dựng lại kể cả khi trạng thái cho biết PDF đã được xử lý
+
+        Returns:
+            bool: False nếu đã có job đang chạy
+        """
+        with self._lock:
+            if self.running:
+                return False
+
+            self._reset("running")
+            self.started_at = time.time()
+            self._cancel_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(force,), name="misoul-index-build", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def cancel(self):
+        """
+        Yêu cầu hủy job đang chạy
+
+        Returns:
+            bool: False nếu không có job nào đang chạy
+        """
+        if not self.running:
+            return False
+        self._cancel_event.set()
+        return True
+
+    # Các hàm được PDFProcessor gọi trong quá trình xử lý
+    def check_cancelled(self):
+        """Dừng job nếu đã có yêu cầu hủy"""
+        if self._cancel_event.is_set():
+            raise IndexBuildCancelled("Job xây dựng index đã bị hủy")
+
+    def set_stage(self, stage, files_total=None):
+        """Cập nhật bước hiện tại của job"""
+        with self._lock:
+            self.stage = stage
+            if files_total is not None:
+                self.files_total = files_total
+
+    def record_file(self, pages, chunks):
+        """Ghi nhận một file PDF đã được đọc và chia đoạn"""
+        with self._lock:
+            self.files_done += 1
+            self.pages += pages
+            self.chunks += chunks
+
+    def record_indexed(self, chunks):
+        """Ghi nhận số đoạn văn bản đã được đưa vào index"""
+        with self._lock:
+            self.chunks_indexed = chunks
+
+    def status(self):
+        """
+        Returns:
+            dict: Trạng thái và tiến độ hiện tại của job
+        """
+        with self._lock:
+            end_time = self.finished_at or time.time()
+            elapsed = end_time - self.started_at if self.started_at else 0.0
+            return {
+                "state": self.state,
+                "stage": self.stage,
+                "error": self.error,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed_seconds": round(elapsed, 2),
+                "files_total": self.files_total,
+                "files_done": self.files_done,
+                "pages": self.pages,
+                "chunks": self.chunks,
+                "chunks_indexed": self.chunks_indexed,
+                "chunks_per_sec": round(self.chunks / elapsed, 2) if elapsed > 0 else 0.0
+            }
+
+    def _run(self, force):
+        from app.pdf_processor_langchain import PDFProcessor
+
+        lock_file = None
+        try:
+            lock_file = self._acquire_process_lock()
+
+            processor = PDFProcessor()
+            if not processor.process_all_pdfs(force=force, job=self):
+                raise RuntimeError("Không thể xử lý PDF và tạo vector database")
+
+            self.check_cancelled()
+            self.set_stage("loading")
+            version = current_version()
+            vector_db = PDFProcessor.load_vector_store(version)
+            if vector_db is None:
+                raise RuntimeError("Không thể tải vector database vừa tạo")
+
+            if self.on_complete:
+                self.on_complete(vector_db, version)
+
+            self._finish("succeeded")
+            print(f"✅ Job xây dựng index hoàn tất: {self.status()}")
+        except IndexBuildCancelled:
+            self._finish("cancelled")
+            print("⚠️ Job xây dựng index đã bị hủy")
+        except Exception as e:
+            self._finish("failed", str(e))
+            print(f"❌ Job xây dựng index thất bại: {e}")
+            traceback.print_exc()
+        finally:
+            self._release_process_lock(lock_file)
+
+    def _finish(self, state, error=None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            self.stage = None
+            self.finished_at = time.time()
+
+    @staticmethod
+    def _acquire_process_lock():
+        """
+        Đảm bảo chỉ một process (worker gunicorn) xây dựng index tại một thời điểm
+        """
+        if fcntl is None:
+            return None
+
+        os.makedirs(Config.VECTOR_DB_PATH, exist_ok=True)
+        lock_file = open(os.path.join(Config.VECTOR_DB_PATH, ".index_build.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError("Một process khác đang xây dựng index")
+        return lock_file
+
+    @staticmethod
+    def _release_process_lock(lock_file):
+        if lock_file is None:
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
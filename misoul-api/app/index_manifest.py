@@ -0,0 +1,122 @@
+# app/index_manifest.py
+import os
+import json
+import time
+import hashlib
+
+# Tên file manifest trong thư mục index
+MANIFEST_FILE = "manifest.json"
+
+# Tăng khi định dạng các file trong thư mục index thay đổi
+MANIFEST_VERSION = 1
+
+class IndexManifestError(Exception):
+    """
+    Lỗi khi thư mục index không có manifest hoặc các file không khớp với manifest
+    """
+    pass
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    Tính checksum SHA-256 của một file
+    
+    Args:
+        path: Đường dẫn file
+        chunk_size: Số byte đọc mỗi lần
+    
+    Returns:
+        str: Checksum dạng hex
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_stat(path):
+    """
+    Returns:
+        list: [kích thước (byte), thời điểm sửa (ns)] của file
+    """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def write_manifest(directory, **info):
+    """
+    Ghi manifest chứa checksum, kích thước và thời điểm sửa của tất cả file trong thư mục index
+    
+    Index và vectorizer được ghi cùng một thư mục rồi mới đánh dấu bằng manifest,
+    nên manifest ràng buộc chúng với nhau: đổi bất kỳ file nào cũng làm checksum sai.
+    Checksum chỉ được tính một lần ở đây (khi publish); các lần tải sau chỉ so kích
+    thước và thời điểm sửa của file (xem read_manifest).
+    
+    Args:
+        directory: Thư mục index
+        **info: Thông tin bổ sung (loại embedding, số chiều, số đoạn văn bản...)
+    
+    Returns:
+        dict: Nội dung manifest
+    """
+    names = [
+        name for name in sorted(os.listdir(directory))
+        if name != MANIFEST_FILE and os.path.isfile(os.path.join(directory, name))
+    ]
+    files = {name: file_sha256(os.path.join(directory, name)) for name in names}
+    stats = {name: file_stat(os.path.join(directory, name)) for name in names}
+    manifest = dict(info, version=MANIFEST_VERSION, created_at=time.time(), files=files, stats=stats)
+    
+    with open(os.path.join(directory, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+def read_manifest(directory, verify=True, checksums=False):
+    """
+    Đọc manifest và kiểm tra các file trong thư mục index
+    
+    Mặc định chỉ stat từng file: file phải có kích thước và thời điểm sửa như khi ghi
+    manifest. Chỉ file có thời điểm sửa khác (ví dụ thư mục được chép lại) hoặc manifest
+    cũ không có kích thước mới được tính lại checksum, nên worker tải index không phải đọc
+    toàn bộ các file.
+    
+    Args:
+        directory: Thư mục index
+        verify: Kiểm tra các file của index
+        checksums: Tính lại checksum của mọi file (đọc toàn bộ index), dùng một lần khi
+                   master tải trước index cho các worker
+    
+    Returns:
+        dict: Nội dung manifest
+    
+    Raises:
+        IndexManifestError: Nếu không có manifest, sai phiên bản hoặc file không khớp manifest
+    """
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise IndexManifestError(f"Không tìm thấy {MANIFEST_FILE} trong {directory} (index cũ, cần xây dựng lại)")
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise IndexManifestError(
+            f"Phiên bản manifest {manifest.get('version')} không được hỗ trợ (cần {MANIFEST_VERSION})"
+        )
+    
+    if verify:
+        stats = manifest.get("stats", {})
+        for name, checksum in manifest.get("files", {}).items():
+            file_path = os.path.join(directory, name)
+            if not os.path.exists(file_path):
+                raise IndexManifestError(f"Thiếu file {name} trong {directory}")
+            
+            expected = stats.get(name)
+            if not checksums and expected is not None:
+                size, mtime_ns = file_stat(file_path)
+                if size != expected[0]:
+                    raise IndexManifestError(f"Kích thước của {name} không khớp với manifest")
+                if mtime_ns == expected[1]:
+                    continue
+            if file_sha256(file_path) != checksum:
+                raise IndexManifestError(f"Checksum của {name} không khớp với manifest")
+    
+    return manifest
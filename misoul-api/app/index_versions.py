@@ -0,0 +1,327 @@
+# app/index_versions.py
+import os
+import time
+import shutil
+import threading
+import traceback
+
+from config import Config
+from app import metrics
+
+# Thư mục chứa các phiên bản index và file trỏ đến phiên bản đang dùng, trong VECTOR_DB_PATH
+VERSIONS_DIRECTORY = "versions"
+CURRENT_FILE = "CURRENT"
+
+def current_version(root=None):
+    """
+    Đọc phiên bản index đang dùng
+
+    Args:
+        root: Thư mục vector database (mặc định Config.VECTOR_DB_PATH)
+
+    Returns:
+        str: Tên phiên bản, None nếu chưa có phiên bản nào (index cũ nằm trực tiếp trong root)
+    """
+    try:
+        with open(os.path.join(root or Config.VECTOR_DB_PATH, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def version_path(root, version):
+    """
+    Returns:
+        str: Thư mục của phiên bản, root nếu version là None (index cũ không có phiên bản)
+    """
+    root = root or Config.VECTOR_DB_PATH
+    if version is None:
+        return root
+    return os.path.join(root, VERSIONS_DIRECTORY, version)
+
+def list_versions(root=None):
+    """
+    Returns:
+        list: Tên các phiên bản có trên đĩa, cũ nhất trước
+    """
+    directory = os.path.join(root or Config.VECTOR_DB_PATH, VERSIONS_DIRECTORY)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+
+def create_version(root=None):
+    """
+    Tạo thư mục cho một phiên bản index mới (chưa được dùng cho đến khi publish_version)
+
+    Tên phiên bản theo thời điểm tạo nên thứ tự tên là thứ tự tạo.
+
+    Args:
+        root: Thư mục vector database (mặc định Config.VECTOR_DB_PATH)
+
+    Returns:
+        str: Tên phiên bản
+    """
+    root = root or Config.VECTOR_DB_PATH
+    base = time.strftime("%Y%m%d-%H%M%S")
+    version, suffix = base, 1
+    while os.path.exists(version_path(root, version)):
+        suffix += 1
+        version = f"{base}-{suffix}"
+    os.makedirs(version_path(root, version))
+    return version
+
+def publish_version(root, version):
+    """
+    Chuyển CURRENT sang phiên bản đã xây dựng xong
+
+    File CURRENT được ghi ra file tạm rồi os.replace, nên process khác luôn đọc được
+    phiên bản cũ hoặc phiên bản mới, không bao giờ đọc phải file ghi dở.
+
+    Args:
+        root: Thư mục vector database (mặc định Config.VECTOR_DB_PATH)
+        version: Tên phiên bản
+    """
+    root = root or Config.VECTOR_DB_PATH
+    tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+def discard_version(root, version):
+    """Xóa thư mục của một phiên bản chưa được dùng (ví dụ khi xây dựng bị hủy)"""
+    shutil.rmtree(version_path(root, version), ignore_errors=True)
+
+def prune_versions(root=None, keep=None):
+    """
+    Xóa các phiên bản cũ, giữ phiên bản đang dùng và các phiên bản mới nhất
+
+    Worker chưa chuyển sang phiên bản mới vẫn đọc được phiên bản trước đó (được giữ lại);
+    file đã memory-map vẫn dùng được sau khi bị xóa cho đến khi được unmap.
+
+    Args:
+        root: Thư mục vector database (mặc định Config.VECTOR_DB_PATH)
+        keep: Số phiên bản giữ lại, mặc định Config.INDEX_KEEP_VERSIONS
+
+    Returns:
+        list: Các phiên bản đã xóa
+    """
+    keep = max(1, Config.INDEX_KEEP_VERSIONS if keep is None else keep)
+    current = current_version(root)
+    versions = [version for version in list_versions(root) if version != current]
+    removed = versions[:max(0, len(versions) - (keep - 1))]
+    for version in removed:
+        discard_version(root, version)
+    return removed
+
+class IndexVersion:
+    """
+    Một phiên bản vector database được RAGManager phục vụ, có đếm tham chiếu.
+
+    RAGManager giữ một tham chiếu; mỗi truy vấn acquire() trước khi tìm kiếm và release()
+    khi xong. Khi được thay bằng phiên bản mới, RAGManager gọi retire(): các truy vấn đang
+    chạy vẫn dùng phiên bản cũ đến hết, và khi truy vấn cuối cùng release() thì vector
+    database cũ được bỏ tham chiếu để giải phóng.
+    """
+
+    _live_lock = threading.Lock()
+    live = 0  # Số phiên bản chưa được giải phóng trong process (metric misoul_index_versions_live)
+
+    def __init__(self, vector_db, version=None):
+        """
+        Khởi tạo IndexVersion
+
+        Args:
+            vector_db: Vector database (hoặc None khi chưa có index)
+            version: Tên phiên bản trên đĩa (None với index cũ không có phiên bản)
+        """
+        self.vector_db = vector_db
+        self.version = version
+        self.loaded_at = time.time()
+        self._references = 1
+        self._lock = threading.Lock()
+        with IndexVersion._live_lock:
+            IndexVersion.live += 1
+
+    def acquire(self):
+        """
+        Returns:
+            bool: False nếu phiên bản đã được giải phóng (cần lấy phiên bản đang dùng mới)
+        """
+        with self._lock:
+            if self._references == 0:
+                return False
+            self._references += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._references -= 1
+            if self._references > 0:
+                return
+            vector_db, self.vector_db = self.vector_db, None
+        with IndexVersion._live_lock:
+            IndexVersion.live -= 1
+        if vector_db is not None:
+            print(f"✅ Đã giải phóng vector database phiên bản {self.version or 'cũ'}")
+
+    def retire(self):
+        """Bỏ tham chiếu của RAGManager khi đã chuyển sang phiên bản khác"""
+        self.release()
+
+    @property
+    def in_flight(self):
+        """Số truy vấn đang dùng phiên bản này"""
+        with self._lock:
+            return max(0, self._references - 1)
+
+metrics.INDEX_VERSIONS_LIVE.set_function(lambda: IndexVersion.live)
+
+class IndexReloader:
+    """
+    Tải phiên bản index mà CURRENT trỏ đến trong thread nền rồi chuyển sang dùng nó.
+
+    Được kích hoạt bằng start() (endpoint /api/index/reload) hoặc bởi thread theo dõi
+    (watch) kiểm tra CURRENT định kỳ, để mọi worker đều chuyển sang phiên bản mới do
+    một worker hoặc process_pdfs.py xây dựng, không phải khởi động lại.
+    """
+
+    def __init__(self, load, install, served_version):
+        """
+        Khởi tạo IndexReloader
+
+        Args:
+            load: Hàm nhận tên phiên bản, trả về vector database hoặc None nếu lỗi
+            install: Hàm nhận (vector database, tên phiên bản) để chuyển sang dùng
+            served_version: Hàm trả về tên phiên bản đang được phục vụ
+        """
+        self.load = load
+        self.install = install
+        self.served_version = served_version
+        self._lock = threading.Lock()
+        self._thread = None
+        self._watcher = None
+        self._stop_event = threading.Event()
+        self._failed_version = None
+        self.state = "idle"
+        self.version = None
+        self.error = None
+        self.finished_at = None
+
+    @property
+    def running(self):
+        """True nếu đang tải phiên bản mới"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, force=False):
+        """
+        Bắt đầu tải lại trong thread nền
+
+        Args:
+            force: Tải lại cả khi CURRENT trỏ đến phiên bản đang phục vụ
+
+        Returns:
+            bool: False nếu đang có lượt tải lại khác
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self.state = "running"
+            self.error = None
+            self._thread = threading.Thread(
+                target=self.reload, args=(force,), name="misoul-index-reload", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def reload(self, force=False):
+        """
+        Tải phiên bản CURRENT và chuyển sang dùng nó (chạy trong thread gọi hàm)
+
+        Args:
+            force: Tải lại cả khi CURRENT trỏ đến phiên bản đang phục vụ
+
+        Returns:
+            str: "succeeded", "unchanged" hoặc "failed"
+        """
+        version = current_version()
+        try:
+            if not force and version == self.served_version():
+                result = "unchanged"
+            else:
+                start_time = time.time()
+                vector_db = self.load(version)
+                if vector_db is None:
+                    raise RuntimeError(f"Không tải được vector database phiên bản {version or 'cũ'}")
+                self.install(vector_db, version)
+                print(f"✅ Đã tải lại vector database phiên bản {version or 'cũ'} trong {time.time() - start_time:.2f}s")
+                result = "succeeded"
+            self._finish(result, version)
+            self._failed_version = None
+        except Exception as e:
+            print(f"❌ Lỗi khi tải lại vector database: {e}")
+            traceback.print_exc()
+            self._finish("failed", version, str(e))
+            # Không thử lại phiên bản hỏng cho đến khi CURRENT đổi hoặc được yêu cầu tải lại
+            self._failed_version = version
+            result = "failed"
+        metrics.INDEX_RELOADS.inc(result=result)
+        return result
+
+    def _finish(self, state, version, error=None):
+        with self._lock:
+            self.state = state
+            self.version = version
+            self.error = error
+            self.finished_at = time.time()
+
+    def watch(self, interval=None):
+        """
+        Bắt đầu thread kiểm tra CURRENT mỗi interval giây, tải lại khi phiên bản đổi
+
+        Args:
+            interval: Số giây giữa hai lần kiểm tra, mặc định Config.INDEX_WATCH_INTERVAL (0 = không theo dõi)
+
+        Returns:
+            bool: True nếu thread theo dõi đang chạy
+        """
+        interval = Config.INDEX_WATCH_INTERVAL if interval is None else interval
+        if interval <= 0:
+            return False
+        with self._lock:
+            if self._watcher is None or not self._watcher.is_alive():
+                self._stop_event.clear()
+                self._watcher = threading.Thread(
+                    target=self._watch, args=(interval,), name="misoul-index-watch", daemon=True
+                )
+                self._watcher.start()
+        return True
+
+    def stop(self):
+        """Dừng thread theo dõi"""
+        self._stop_event.set()
+
+    def _watch(self, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                version = current_version()
+                if version is not None and version != self.served_version() and version != self._failed_version:
+                    self.start()
+            except Exception as e:
+                print(f"⚠️ Lỗi khi kiểm tra phiên bản index: {e}")
+
+    def status(self):
+        """
+        Returns:
+            dict: Phiên bản đang phục vụ, phiên bản CURRENT và kết quả lần tải lại gần nhất
+        """
+        with self._lock:
+            return {
+                "state": "running" if self.running else self.state,
+                "served_version": self.served_version(),
+                "current_version": current_version(),
+                "last_version": self.version,
+                "error": self.error,
+                "finished_at": self.finished_at,
+                "watching": self._watcher is not None and self._watcher.is_alive()
+            }
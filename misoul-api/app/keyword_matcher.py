@@ -0,0 +1,232 @@
+# app/keyword_matcher.py
+import re
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+
+# === Danh sách từ khóa dùng chung ===
+
+# Từ khóa liên quan đến tự hại (hiển thị cảnh báo khẩn cấp)
+SELF_HARM_KEYWORDS = [
+    "tự tử", "kết thúc cuộc sống", "kết thúc cuộc đời", "chết", "không muốn sống",
+    "không còn muốn sống", "tôi chết", "tự hại", "tự làm đau", "cắt tay",
+    "uống thuốc", "nhảy lầu", "treo cổ", "kết liễu", "tự giết"
+]
+
+# Từ khóa cho biết người dùng có thể đang khủng hoảng (thêm hướng dẫn xử lý khủng hoảng vào prompt)
+CRISIS_KEYWORDS = [
+    "tự tử", "tự hại", "tự làm đau", "muốn chết", "không muốn sống",
+    "kết thúc cuộc đời", "kết thúc tất cả", "không còn ý nghĩa",
+    "đau khổ quá mức", "không chịu nổi", "cứu tôi", "giết", "chết",
+    "tôi sẽ biến mất", "tôi muốn biến mất", "cắt tay", "uống thuốc",
+    "quá đau đớn", "không thể tiếp tục", "tạm biệt", "lần cuối"
+]
+
+# Các từ khóa cho biết phản hồi có chứa bài tập/hướng dẫn
+EXERCISE_INDICATORS = [
+    "bài tập", "hướng dẫn", "các bước", "phương pháp",
+    "thực hành", "kỹ thuật", "tập luyện", "gợi ý", "5-4-3-2-1",
+    "kỹ thuật thở", "thiền", "thư giãn", "nghỉ ngơi"
+]
+
+# Câu trả lời đồng ý nhận bài tập
+CONFIRMATION_KEYWORDS = ["có", "ừ", "đồng ý", "ok", "được", "vâng", "yes", "y", "👍", "okk"]
+
+KeywordMatch = namedtuple("KeywordMatch", ["category", "keyword", "start", "end"])
+
+def _build_fold_table():
+    """
+    Bảng chuyển mỗi ký tự Latin (kể cả chữ tiếng Việt có dấu) thành chữ thường không dấu.
+
+    Mỗi ký tự chỉ được thay bằng đúng một ký tự, nên vị trí trong văn bản đã chuyển
+    trùng với vị trí trong văn bản gốc. Bảng là một list đánh chỉ số theo mã ký tự
+    (nhanh hơn dict khi dùng với str.translate); ký tự nằm ngoài bảng được giữ nguyên.
+    """
+    table = [chr(code) for code in range(0x1F00)]
+    for code in list(range(0x41, 0x5B)) + list(range(0xC0, 0x250)) + list(range(0x1E00, 0x1F00)):
+        char = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFD", char.lower()) if not unicodedata.combining(c))
+        if len(base) == 1:
+            table[code] = base
+    table[ord("Đ")] = "d"
+    table[ord("đ")] = "d"
+    return table
+
+FOLD_TABLE = _build_fold_table()
+
+def fold_diacritics(text):
+    """
+    Chuyển văn bản thành chữ thường không dấu, giữ nguyên độ dài ("Tự Tử" -> "tu tu")
+
+    Args:
+        text: Văn bản (dạng NFC)
+
+    Returns:
+        str: Văn bản đã bỏ dấu
+    """
+    if text.isascii():
+        return text.lower()
+    return text.translate(FOLD_TABLE)
+
+def _normalize_keyword(keyword):
+    return " ".join(unicodedata.normalize("NFC", keyword).lower().split())
+
+class KeywordMatcher:
+    """
+    Bộ so khớp nhiều nhóm từ khóa cùng lúc bằng một biểu thức chính quy đã biên dịch sẵn.
+
+    Văn bản được bỏ dấu trước khi so khớp nên "tu tu" (gõ không dấu) khớp với "tự tử".
+    Đoạn khớp có dấu phải giống từ khóa cả dấu, vì bỏ dấu làm trùng nhiều từ thường gặp
+    ("từ từ", "từ hai", "treo cờ" không khớp "tự tử", "tự hại", "treo cổ"). Từ khóa chỉ khớp
+    trọn từ ("có" không khớp trong "cókhông"). Với các nhóm exact, đoạn khớp luôn phải giống
+    từ khóa cả dấu, kể cả khi gõ không dấu ("co" không khớp "có"). Tất cả các nhóm được tìm
+    trong một lần duyệt văn bản.
+    """
+
+    # Văn bản ngắn hơn ngưỡng này (tin nhắn người dùng) được lưu kết quả, vì cùng một
+    # tin nhắn được kiểm tra nhiều nhóm ở nhiều bước trong một lượt
+    CACHE_MAX_TEXT_LENGTH = 500
+
+    def __init__(self, categories, exact_categories=(), cache_size=1024):
+        """
+        Khởi tạo KeywordMatcher
+
+        Args:
+            categories: dict tên nhóm -> danh sách từ khóa
+            exact_categories: Các nhóm yêu cầu khớp đúng dấu
+            cache_size: Số văn bản ngắn được lưu kết quả so khớp
+        """
+        # Từ khóa đã bỏ dấu -> danh sách (nhóm, từ khóa gốc, có yêu cầu đúng dấu không)
+        self._entries = {}
+        for category, keywords in categories.items():
+            exact = category in exact_categories
+            for keyword in keywords:
+                keyword = _normalize_keyword(keyword)
+                entries = self._entries.setdefault(fold_diacritics(keyword), [])
+                if (category, keyword, exact) not in entries:
+                    entries.append((category, keyword, exact))
+
+        self.categories = tuple(categories)
+        folded_keywords = sorted(self._entries, key=len, reverse=True)
+
+        # Ở mỗi vị trí, regex chỉ trả về từ khóa dài nhất; các từ khóa ngắn hơn là
+        # phần đầu trọn từ của nó ("chết" trong "chết đi") được kiểm tra thêm
+        self._patterns = {keyword: re.compile(self._keyword_pattern(keyword) + r"(?!\w)") for keyword in folded_keywords}
+        self._implied = {
+            keyword: [
+                other for other in folded_keywords
+                if other != keyword and keyword.startswith(other) and not self._is_word_char(keyword[len(other)])
+            ]
+            for keyword in folded_keywords
+        }
+
+        self._regex = re.compile(r"(?<!\w)(?=(" + self._trie_pattern(folded_keywords) + r")(?!\w))")
+        self._cached_scan = lru_cache(maxsize=cache_size)(self._scan)
+
+    @classmethod
+    def _trie_pattern(cls, keywords):
+        """
+        Tạo biểu thức chính quy dạng cây tiền tố: các từ khóa có chung phần đầu
+        chỉ được so khớp phần đó một lần thay vì thử lại với từng từ khóa
+        """
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = {}
+        return cls._node_pattern(trie)
+
+    @classmethod
+    def _node_pattern(cls, node):
+        # Nhánh dài hơn được thử trước, nhánh kết thúc ("") thử sau cùng
+        branches = []
+        for char in sorted(key for key in node if key):
+            prefix = r"\s+" if char == " " else re.escape(char)
+            branches.append(prefix + cls._node_pattern(node[char]))
+        if "" in node:
+            branches.append("")
+        if len(branches) == 1:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")"
+
+    @staticmethod
+    def _keyword_pattern(keyword):
+        return r"\s+".join(re.escape(word) for word in keyword.split(" "))
+
+    @staticmethod
+    def _is_word_char(char):
+        return char.isalnum() or char == "_"
+
+    def find_all(self, text):
+        """
+        Tìm tất cả từ khóa trong văn bản
+
+        Args:
+            text: Văn bản cần kiểm tra
+
+        Returns:
+            tuple: Các KeywordMatch theo thứ tự xuất hiện (vị trí tính trên văn bản dạng NFC)
+        """
+        if len(text) <= self.CACHE_MAX_TEXT_LENGTH:
+            return self._cached_scan(text)
+        return self._scan(text)
+
+    def _scan(self, text):
+        text = unicodedata.normalize("NFC", text)
+        folded = fold_diacritics(text)
+        matches = []
+        for match in self._regex.finditer(folded):
+            start = match.start(1)
+            keyword = " ".join(match.group(1).split())
+            self._collect(text, keyword, start, match.end(1), matches)
+            for other in self._implied[keyword]:
+                other_match = self._patterns[other].match(folded, start)
+                if other_match:
+                    self._collect(text, other, start, other_match.end(), matches)
+        return tuple(matches)
+
+    def _collect(self, text, folded_keyword, start, end, matches):
+        original = " ".join(text[start:end].lower().split())
+        # Chỉ đoạn gõ không dấu mới được khớp sau khi bỏ dấu
+        accented = original != folded_keyword
+        for category, keyword, exact in self._entries[folded_keyword]:
+            if (exact or accented) and original != keyword:
+                continue
+            matches.append(KeywordMatch(category, keyword, start, end))
+
+    def match_categories(self, text):
+        """
+        Returns:
+            set: Tên các nhóm có từ khóa xuất hiện trong văn bản
+        """
+        return {match.category for match in self.find_all(text)}
+
+    def contains(self, text, category):
+        """
+        Returns:
+            bool: True nếu văn bản chứa từ khóa thuộc nhóm category
+        """
+        return any(match.category == category for match in self.find_all(text))
+
+    def first(self, text, category):
+        """
+        Returns:
+            KeywordMatch: Từ khóa đầu tiên thuộc nhóm category (None nếu không có)
+        """
+        for match in self.find_all(text):
+            if match.category == category:
+                return match
+        return None
+
+# Bộ so khớp dùng chung, được biên dịch một lần khi import
+KEYWORDS = KeywordMatcher(
+    {
+        "self_harm": SELF_HARM_KEYWORDS,
+        "crisis": CRISIS_KEYWORDS,
+        "exercise": EXERCISE_INDICATORS,
+        "confirmation": CONFIRMATION_KEYWORDS
+    },
+    # Phản hồi của Gemini luôn có dấu, và câu xác nhận ngắn dễ nhầm khi bỏ dấu ("co", "u")
+    exact_categories=("exercise", "confirmation")
+)
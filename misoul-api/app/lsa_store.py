@@ -0,0 +1,377 @@
+# app/lsa_store.py
+import os
+import threading
+from typing import List
+import numpy as np
+from langchain_core.documents import Document
+from sklearn.decomposition import TruncatedSVD
+
+from config import Config
+from app.partitions import CategoryPartitions
+from app.retrieval_cache import LRUCache, normalize_query
+from app.chunk_store import save_arrays, load_array, load_documents, as_chunk_store, CHUNKS_FILE
+from app.sparse_store import top_k_indices, BATCH_SIZE
+
+# Kiểu dữ liệu lưu vector đã chiếu (Config.LSA_DTYPE)
+STORAGE_DTYPES = {
+    "float32": np.float32,
+    "float16": np.float16,
+    "int8": np.int8
+}
+
+# Số hàng float16/int8 được chuyển về float32 mỗi lần khi chấm điểm (bộ đệm cố định của mỗi luồng)
+SCORE_BLOCK_ROWS = 1024
+
+def quantize(vectors, dtype):
+    """
+    Chuyển các vector đã chuẩn hóa L2 sang kiểu lưu trữ nhỏ hơn
+
+    Với int8, mỗi hàng được nhân với 127 / giá trị tuyệt đối lớn nhất của hàng rồi làm tròn;
+    hệ số của từng hàng được trả về để khôi phục điểm khi tìm kiếm.
+
+    Args:
+        vectors: Mảng float (số đoạn x số chiều)
+        dtype: "float32", "float16" hoặc "int8"
+
+    Returns:
+        tuple: (mảng đã chuyển kiểu, mảng hệ số float32 của từng hàng hoặc None nếu không phải int8)
+
+    Raises:
+        ValueError: Nếu kiểu dữ liệu không được hỗ trợ
+    """
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"LSA_DTYPE không hợp lệ: {dtype} (hỗ trợ: {', '.join(STORAGE_DTYPES)})")
+    if dtype != "int8":
+        return vectors.astype(STORAGE_DTYPES[dtype]), None
+
+    peaks = np.abs(vectors).max(axis=1)
+    scales = np.where(peaks > 0, peaks / 127, 1).astype(np.float32)
+    return np.rint(vectors / scales[:, None]).astype(np.int8), scales
+
+class LSAStore(CategoryPartitions):
+    """
+    Vector store lưu embeddings TF-IDF đã chiếu xuống vài trăm chiều bằng LSA (TruncatedSVD).
+
+    Ma trận chiếu được fit khi xây dựng index (PDFProcessor.process_all_pdfs) và lưu cùng
+    vectorizer. Các vector đã chiếu được chuẩn hóa L2 rồi lưu dạng float16 hoặc int8 (hệ số
+    riêng cho từng hàng), ma trận chiếu được lưu cùng float16 khi vector không phải float32.
+    Vector truy vấn chỉ cần các hàng của ma trận chiếu ứng với vài từ có trong truy vấn, và
+    không cần chuẩn hóa vì thứ tự kết quả không phụ thuộc độ dài của nó.
+
+    Khi chấm điểm, vector float16/int8 được chuyển về float32 từng khối SCORE_BLOCK_ROWS hàng
+    vào một bộ đệm cố định của mỗi luồng (numpy không có phép nhân float16/int8 dùng BLAS),
+    nên mỗi truy vấn không cấp phát thêm bản float32 của cả ma trận. Theo
+    benchmarks/lsa_bench.py, int8 nhỏ hơn và có thời gian truy vấn gần bằng float32, còn
+    float16 chậm hơn khoảng gấp đôi (chuyển float16 sang float32 chậm hơn int8).
+
+    Có cùng các hàm tìm kiếm với SparseVectorStore (similarity_search, categories,
+    expansion, encode_query/search_vector và tìm kiếm theo lô).
+    """
+
+    # Tên các mảng lưu trong thư mục index (file .npy, memory-map được)
+    PROJECTION_ARRAY = "lsa_projection"
+    VECTORS_ARRAY = "lsa_vectors"
+    SCALES_ARRAY = "lsa_scales"
+    DOCUMENTS_FILE = CHUNKS_FILE
+
+    def __init__(self, vectors, components, documents, embedding, scales=None):
+        """
+        Khởi tạo LSAStore
+
+        Args:
+            vectors: Mảng (số đoạn x số chiều LSA) float32, float16 hoặc int8, mỗi hàng là một đoạn
+            components: Ma trận chiếu (số chiều LSA x số chiều TF-IDF)
+            documents: ChunkStore hoặc danh sách Document tương ứng với các hàng
+            embedding: MISOULEmbeddings đã fit
+            scales: Hệ số của từng hàng khi vectors là int8
+        """
+        if vectors.shape[0] != len(documents):
+            raise ValueError(f"Ma trận có {vectors.shape[0]} hàng nhưng có {len(documents)} tài liệu")
+        if vectors.shape[1] != components.shape[0]:
+            raise ValueError(f"Vector có {vectors.shape[1]} chiều nhưng ma trận chiếu có {components.shape[0]} chiều")
+        if (vectors.dtype == np.int8) != (scales is not None):
+            raise ValueError("Vector int8 cần hệ số của từng hàng và chỉ vector int8 có hệ số")
+
+        self.vectors = vectors
+        # Lưu dạng (số chiều TF-IDF x số chiều LSA) để lấy nhanh các hàng của từ trong truy vấn
+        projection_dtype = np.float32 if vectors.dtype == np.float32 else np.float16
+        self.projection = np.ascontiguousarray(np.asarray(components).T, dtype=projection_dtype)
+        self.scales = scales
+        self.documents = as_chunk_store(documents)
+        self.embedding = embedding
+        self._query_vectors = LRUCache("lsa_query_vector", Config.QUERY_VECTOR_CACHE_SIZE)
+        self._scratch = threading.local()
+        self._init_partitions()
+
+    @classmethod
+    def from_documents(cls, documents, embedding, components=None, dtype=None):
+        """
+        Fit vectorizer (nếu chưa fit) và ma trận chiếu LSA, tạo vector store từ danh sách tài liệu
+
+        Args:
+            documents: Danh sách Document
+            embedding: MISOULEmbeddings
+            components: Số chiều LSA, mặc định Config.LSA_COMPONENTS
+            dtype: Kiểu lưu vector, mặc định Config.LSA_DTYPE
+
+        Returns:
+            LSAStore: Vector store mới
+        """
+        documents = as_chunk_store(documents)
+        components = components or Config.LSA_COMPONENTS
+        dtype = dtype or Config.LSA_DTYPE
+
+        matrix = embedding.embed_documents_sparse(documents.texts())
+        # TruncatedSVD cần ít chiều hơn cả số đoạn và số chiều TF-IDF
+        components = max(1, min(components, matrix.shape[0] - 1, matrix.shape[1] - 1))
+        svd = TruncatedSVD(n_components=components, random_state=0)
+        reduced = svd.fit_transform(matrix).astype(np.float32)
+
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        reduced /= np.where(norms > 0, norms, 1)
+        vectors, scales = quantize(reduced, dtype)
+        return cls(vectors, svd.components_, documents, embedding, scales=scales)
+
+    @property
+    def dimension(self):
+        """Số chiều LSA của vector đã chiếu"""
+        return self.vectors.shape[1]
+
+    @property
+    def dtype(self):
+        """Kiểu lưu vector ("float32", "float16" hoặc "int8")"""
+        return self.vectors.dtype.name
+
+    @property
+    def nbytes(self):
+        """Dung lượng bộ nhớ của vector và ma trận chiếu (byte)"""
+        scales = self.scales.nbytes if self.scales is not None else 0
+        return self.vectors.nbytes + scales + self.projection.nbytes
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def _row_segments(self, partition):
+        """
+        Returns:
+            list: Các đoạn hàng cần chấm điểm, slice của mảng vector (không chép) hoặc mảng vị trí
+                  khi phân vùng có quá nhiều đoạn hàng
+        """
+        if partition is None:
+            return [slice(0, len(self))]
+        if partition.contiguous:
+            return [slice(start, end) for start, end in partition.runs]
+        return [partition.rows]
+
+    def _project(self, query_matrix):
+        if query_matrix.shape[0] == 1:
+            # Chỉ cộng các hàng của những từ có trong truy vấn
+            return (query_matrix.data.astype(np.float32) @ self.projection[query_matrix.indices])[None, :].astype(np.float32)
+        # Chỉ chuyển về float32 các hàng của ma trận chiếu ứng với từ có trong lô truy vấn
+        terms = np.unique(query_matrix.indices)
+        projection = self.projection[terms].astype(np.float32, copy=False)
+        return np.asarray(query_matrix[:, terms] @ projection, dtype=np.float32)
+
+    def _row_blocks(self, partition):
+        """
+        Returns:
+            generator: Các khối tối đa SCORE_BLOCK_ROWS hàng (slice hoặc mảng vị trí) của phân vùng
+        """
+        for rows in self._row_segments(partition):
+            if isinstance(rows, slice):
+                for start in range(rows.start, rows.stop, SCORE_BLOCK_ROWS):
+                    yield slice(start, min(start + SCORE_BLOCK_ROWS, rows.stop))
+            else:
+                for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+                    yield rows[start:start + SCORE_BLOCK_ROWS]
+
+    def _scratch_buffer(self, rows):
+        """
+        Returns:
+            numpy.ndarray: Bộ đệm float32 (rows x số chiều LSA) của luồng hiện tại, dùng lại giữa các truy vấn
+        """
+        buffer = getattr(self._scratch, "buffer", None)
+        if buffer is None:
+            buffer = self._scratch.buffer = np.empty((SCORE_BLOCK_ROWS, self.dimension), dtype=np.float32)
+        return buffer[:rows]
+
+    def _scores(self, query_vectors, partition=None):
+        # query_vectors: (số chiều LSA x số truy vấn), kết quả: (số hàng của phân vùng x số truy vấn);
+        # float16/int8 được chuyển về float32 từng khối vào bộ đệm cố định để dùng BLAS,
+        # không tạo bản float32 của cả ma trận cho mỗi truy vấn
+        rows_count = len(self) if partition is None else len(partition)
+        scores = np.empty((rows_count, query_vectors.shape[1]), dtype=np.float32)
+        position = 0
+        for rows in self._row_blocks(partition):
+            block = self.vectors[rows]
+            end = position + len(block)
+            if block.dtype != np.float32:
+                buffer = self._scratch_buffer(len(block))
+                np.copyto(buffer, block)
+                block = buffer
+            np.matmul(block, query_vectors, out=scores[position:end])
+            if self.scales is not None:
+                scores[position:end] *= self.scales[rows, None]
+            position = end
+        return scores
+
+    def encode_query(self, text):
+        """
+        Tạo vector truy vấn
+
+        Args:
+            text: Câu truy vấn
+
+        Returns:
+            numpy.ndarray: Vector TF-IDF đã chiếu (số chiều LSA, dùng chung, không được sửa)
+        """
+        text = normalize_query(text)
+        vector = self._query_vectors.get(text)
+        if vector is None:
+            vector = self._project(self.embedding.embed_query_sparse(text))[0]
+            self._query_vectors.put(text, vector)
+        return vector
+
+    def search_vector(self, query_vector, k: int = 4, categories=None):
+        """
+        Tìm các đoạn văn bản có tích vô hướng lớn nhất với vector truy vấn
+
+        Args:
+            query_vector: Vector do encode_query tạo (có thể đã cộng thêm vector khác)
+            k: Số kết quả
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+
+        Returns:
+            list: Danh sách (Document, điểm), điểm cao nhất trước
+        """
+        # Truy vấn không có từ nào trong từ vựng thì không có tài liệu liên quan
+        if not query_vector.any():
+            return []
+
+        partition = self.partition(categories) if categories else None
+        scores = self._scores(query_vector[:, None], partition).ravel()
+        top = top_k_indices(scores, k)
+        return [(self.documents[i], float(score)) for i, score in zip(self._row_ids(top, partition).tolist(), scores[top])]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, categories=None, expansion=None):
+        """
+        Tìm các đoạn văn bản tương tự nhất với câu truy vấn
+
+        Args:
+            query: Câu truy vấn
+            k: Số kết quả
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+            expansion: (vector từ khóa do encode_query tạo, trọng số) cộng vào vector truy vấn (tùy chọn)
+
+        Returns:
+            list: Danh sách (Document, điểm), điểm cao nhất trước
+        """
+        query_vector = self.encode_query(query)
+        if expansion is not None:
+            keyword_vector, weight = expansion
+            query_vector = query_vector + weight * keyword_vector
+        return self.search_vector(query_vector, k=k, categories=categories)
+
+    def similarity_search(self, query: str, k: int = 4, categories=None, expansion=None) -> List[Document]:
+        """
+        Tìm các đoạn văn bản tương tự nhất với câu truy vấn
+
+        Args:
+            query: Câu truy vấn
+            k: Số kết quả
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+            expansion: (vector từ khóa, trọng số) cộng vào vector truy vấn (tùy chọn)
+
+        Returns:
+            List[Document]: Danh sách tài liệu, liên quan nhất trước
+        """
+        return [
+            doc for doc, _ in
+            self.similarity_search_with_score(query, k=k, categories=categories, expansion=expansion)
+        ]
+
+    def similarity_search_batch_with_score(self, queries, k: int = 4, categories=None, expansion=None):
+        """
+        Tìm kiếm cho nhiều câu truy vấn: một lần gọi vectorizer, một phép chiếu và một phép
+        nhân ma trận cho mỗi BATCH_SIZE truy vấn
+
+        Args:
+            queries: Danh sách câu truy vấn
+            k: Số kết quả của mỗi truy vấn
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+            expansion: (vector từ khóa, trọng số) cộng vào vector của mọi truy vấn (tùy chọn)
+
+        Returns:
+            list: Với mỗi truy vấn theo thứ tự, danh sách (Document, điểm) như similarity_search_with_score
+        """
+        if not queries:
+            return []
+
+        partition = self.partition(categories) if categories else None
+        query_vectors = self._project(self.embedding.embed_queries_sparse([normalize_query(query) for query in queries]))
+        if expansion is not None:
+            keyword_vector, weight = expansion
+            query_vectors += weight * keyword_vector
+
+        results = []
+        for start in range(0, len(query_vectors), BATCH_SIZE):
+            batch = query_vectors[start:start + BATCH_SIZE]
+            batch_scores = self._scores(batch.T, partition).T
+            for query_vector, scores in zip(batch, batch_scores):
+                if not query_vector.any():
+                    results.append([])
+                    continue
+                top = top_k_indices(scores, k)
+                results.append([
+                    (self.documents[i], float(score)) for i, score in zip(self._row_ids(top, partition).tolist(), scores[top])
+                ])
+        return results
+
+    def similarity_search_batch(self, queries, k: int = 4, categories=None, expansion=None) -> List[List[Document]]:
+        """
+        Tìm kiếm cho nhiều câu truy vấn (tham số như similarity_search_batch_with_score)
+
+        Returns:
+            list: Với mỗi truy vấn theo thứ tự, danh sách tài liệu liên quan nhất trước
+        """
+        return [
+            [doc for doc, _ in results] for results in
+            self.similarity_search_batch_with_score(queries, k=k, categories=categories, expansion=expansion)
+        ]
+
+    def save_local(self, directory):
+        """
+        Lưu vector, ma trận chiếu và tài liệu vào thư mục
+
+        Args:
+            directory: Thư mục lưu (vectorizer được lưu riêng bằng MISOULEmbeddings.save)
+        """
+        os.makedirs(directory, exist_ok=True)
+        arrays = {self.VECTORS_ARRAY: self.vectors, self.PROJECTION_ARRAY: self.projection}
+        if self.scales is not None:
+            arrays[self.SCALES_ARRAY] = self.scales
+        save_arrays(directory, **arrays)
+        self.documents.save(directory)
+
+    @classmethod
+    def load_local(cls, directory, embedding):
+        """
+        Tải vector store từ thư mục
+
+        Args:
+            directory: Thư mục do save_local ghi
+            embedding: MISOULEmbeddings đã tải từ cùng thư mục
+
+        Returns:
+            LSAStore: Vector store đã tải (các mảng được memory-map nếu Config.INDEX_MMAP)
+        """
+        vectors = load_array(directory, cls.VECTORS_ARRAY)
+        projection = load_array(directory, cls.PROJECTION_ARRAY)
+        has_scales = os.path.exists(os.path.join(directory, cls.SCALES_ARRAY + ".npy"))
+        scales = load_array(directory, cls.SCALES_ARRAY) if has_scales else None
+        if projection.shape[0] != embedding.dimension:
+            raise ValueError(
+                f"Ma trận chiếu LSA có {projection.shape[0]} chiều nhưng vectorizer có {embedding.dimension} chiều"
+            )
+        # projection.T.T là chính mảng đã memory-map nên không bị chép lại
+        return cls(vectors, projection.T, load_documents(directory), embedding, scales=scales)
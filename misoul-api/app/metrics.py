@@ -0,0 +1,294 @@
+# app/metrics.py
+import threading
+import time
+from contextlib import contextmanager
+
+# Các mốc mặc định (giây) cho histogram độ trễ
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Các mốc (số ký tự) cho histogram kích thước prompt
+PROMPT_SIZE_BUCKETS = (1000, 2000, 4000, 6000, 8000, 12000, 16000, 24000, 32000)
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + body + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    """
+    Lớp cơ sở cho các metric có nhãn (labels)
+    """
+    metric_type = ""
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} cần các nhãn {self.label_names}, nhận được {tuple(labels)}")
+        return tuple(labels[name] for name in self.label_names)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        for suffix, label_values, extra, value in self._samples():
+            labels = _format_labels(self.label_names, label_values, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """Bộ đếm chỉ tăng"""
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.label_names:
+            items = [((), 0)]
+        return [("", key, None, value) for key, value in items]
+
+class Gauge(_Metric):
+    """Giá trị có thể tăng giảm, hoặc được đọc từ một hàm khi xuất metric"""
+    metric_type = "gauge"
+
+    def __init__(self, name, description, label_names=()):
+        super().__init__(name, description, label_names)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        """Đọc giá trị từ function mỗi lần xuất metric"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        if not values and not self.label_names:
+            values[()] = 0
+        return [("", key, None, value) for key, value in sorted(values.items())]
+
+class Histogram(_Metric):
+    """Phân phối giá trị theo các mốc (bucket) cố định"""
+    metric_type = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Đo thời gian chạy của khối lệnh with"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state["counts"]))) for key, state in self._values.items())
+        samples = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                samples.append(("_bucket", key, ("le", _format_value(bound)), cumulative))
+            samples.append(("_sum", key, None, state["sum"]))
+            samples.append(("_count", key, None, state["count"]))
+        return samples
+
+class MetricsRegistry:
+    """
+    Tập hợp các metric của process và xuất theo định dạng văn bản của Prometheus.
+
+    Mỗi process (worker gunicorn) có registry riêng.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, description, label_names=()):
+        return self.register(Counter(name, description, label_names))
+
+    def gauge(self, name, description, label_names=()):
+        return self.register(Gauge(name, description, label_names))
+
+    def histogram(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, description, label_names, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+# === Metric của pipeline chat ===
+STAGE_LATENCY = REGISTRY.histogram(
+    "misoul_stage_latency_seconds",
+    "Thời gian xử lý từng bước của pipeline chat",
+    ["stage"]
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    "misoul_chat_request_seconds",
+    "Tổng thời gian xử lý một request chat",
+    ["endpoint"]
+)
+CRISIS_LATENCY = REGISTRY.histogram(
+    "misoul_crisis_latency_seconds",
+    "Thời gian từ khi nhận tin nhắn khủng hoảng đến khi gửi cảnh báo khẩn cấp (warning) và phản hồi đầy đủ (reply), "
+    "theo endpoint (chat gửi cảnh báo cùng phản hồi, chat_stream gửi cảnh báo trước)",
+    ["phase", "endpoint"]
+)
+CHAT_TIMEOUTS = REGISTRY.counter(
+    "misoul_chat_timeouts_total",
+    "Số request chat bị hết thời gian",
+    ["endpoint"]
+)
+CHAT_REJECTED = REGISTRY.counter(
+    "misoul_chat_rejected_total",
+    "Số request chat bị từ chối do hàng đợi đầy",
+    ["endpoint"]
+)
+CHAT_COALESCED = REGISTRY.counter(
+    "misoul_chat_coalesced_total",
+    "Số request chat trùng lặp dùng chung kết quả của request đang xử lý"
+)
+GEMINI_ERRORS = REGISTRY.counter(
+    "misoul_gemini_errors_total",
+    "Số lần gọi Gemini API bị lỗi"
+)
+CACHE_HITS = REGISTRY.counter(
+    "misoul_cache_hits_total",
+    "Số lần tìm thấy kết quả trong cache",
+    ["cache"]
+)
+CACHE_MISSES = REGISTRY.counter(
+    "misoul_cache_misses_total",
+    "Số lần không tìm thấy kết quả trong cache",
+    ["cache"]
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "misoul_chat_queue_depth",
+    "Số request chat đang chờ trong hàng đợi"
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "misoul_chat_in_flight",
+    "Số request chat đang được xử lý"
+)
+PROMPT_SIZE = REGISTRY.histogram(
+    "misoul_prompt_size_chars",
+    "Kích thước prompt gửi tới Gemini (số ký tự)",
+    buckets=PROMPT_SIZE_BUCKETS
+)
+
+# === Metric của session store ===
+SESSION_EVICTIONS = REGISTRY.counter(
+    "misoul_session_evictions_total",
+    "Số phiên hội thoại bị xóa khỏi session store",
+    ["reason"]
+)
+SESSION_COUNT = REGISTRY.gauge(
+    "misoul_sessions",
+    "Số phiên hội thoại đang được lưu",
+    ["store"]
+)
+SESSION_BYTES = REGISTRY.gauge(
+    "misoul_session_bytes",
+    "Ước lượng bộ nhớ (byte) của các phiên hội thoại",
+    ["store"]
+)
+
+# === Metric của truy xuất tài liệu ===
+RETRIEVER_LATENCY = REGISTRY.histogram(
+    "misoul_retriever_latency_seconds",
+    "Thời gian tìm kiếm của từng backend trong chế độ hybrid",
+    ["backend"]
+)
+RETRIEVER_DROPPED = REGISTRY.counter(
+    "misoul_retriever_dropped_total",
+    "Số lần kết quả của một backend bị bỏ qua trong chế độ hybrid (timeout, busy hoặc error)",
+    ["backend", "reason"]
+)
+
+# === Metric của phiên bản index ===
+INDEX_VERSIONS_LIVE = REGISTRY.gauge(
+    "misoul_index_versions_live",
+    "Số phiên bản vector database còn trong bộ nhớ (đang phục vụ hoặc còn truy vấn đang dùng)"
+)
+INDEX_RELOADS = REGISTRY.counter(
+    "misoul_index_reloads_total",
+    "Số lần tải lại vector database theo kết quả",
+    ["result"]
+)
@@ -1,21 +1,30 @@
 # Thêm vào file misoul_chatbot.py
 import re
+import time
+import unicodedata
+from app.metrics import STAGE_LATENCY, PROMPT_SIZE, CRISIS_LATENCY
+from app.session_store import InMemorySessionStore
+from app.user_locks import UserLocks
+from app.keyword_matcher import KEYWORDS, SELF_HARM_KEYWORDS
+from config import Config
+
 class MISOULChatbot:
     """
     MISOUL Chatbot - Người bạn tâm giao với chuyên môn tâm lý
     """
     
-    def __init__(self, llm_manager, rag_manager, prompt_manager):
+    def __init__(self, llm_manager, rag_manager, prompt_manager, session_store=None):
         # Các thuộc tính hiện tại
         self.llm_manager = llm_manager
         self.rag_manager = rag_manager
         self.prompt_manager = prompt_manager
-        self.conversation_memory = {}  # Lưu trữ cuộc trò chuyện theo ID người dùng
-        self.pending_responses = {}    # Lưu trữ phản hồi đang chờ xác nhận
-        self.waiting_confirmation = {} # Theo dõi trạng thái chờ xác nhận
         
-        # Thêm thuộc tính mới để quản lý cảnh báo
-        self.warning_shown = {}        # Theo dõi người dùng đã được hiển thị cảnh báo hay chưa
+        # Lịch sử trò chuyện, bài tập chờ xác nhận và trạng thái cảnh báo theo ID người dùng
+        self.session_store = session_store or InMemorySessionStore()
+        
+        # Các lượt của cùng một người dùng được xử lý tuần tự để không ghi đè trạng thái của nhau
+        self.user_locks = UserLocks()
+        
         self.self_harm_messages = []   # Danh sách từ khóa liên quan đến tự hại
         self.initialize_self_harm_keywords()
         
@@ -23,11 +32,7 @@ class MISOULChatbot:
     
     def initialize_self_harm_keywords(self):
         """Khởi tạo danh sách từ khóa liên quan đến tự hại"""
-        self.self_harm_messages = [
-            "tự tử", "kết thúc cuộc sống", "kết thúc cuộc đời", "chết", "không muốn sống", 
-            "không còn muốn sống", "tôi chết", "tự hại", "tự làm đau", "cắt tay", 
-            "uống thuốc", "nhảy lầu", "treo cổ", "kết liễu", "tự giết"
-        ]
+        self.self_harm_messages = SELF_HARM_KEYWORDS
     
     def check_self_harm_content(self, message):
         """
@@ -39,11 +44,8 @@ class MISOULChatbot:
         Returns:
             bool: True nếu phát hiện nội dung tự hại, False nếu không
         """
-        message = message.lower()
-        for keyword in self.self_harm_messages:
-            if keyword in message:
-                return True
-        return False
+        # Khớp cả khi người dùng gõ không dấu ("tu tu")
+        return KEYWORDS.contains(message, "self_harm")
     
     def get_emergency_warning(self):
         """
@@ -59,13 +61,13 @@ class MISOULChatbot:
                 "* **Trung tâm Sức khỏe Tâm thần Bạch Mai: (024) 3825.3028**\n"
                 "* **Cứu thương: 115**")
     
-    def should_show_warning(self, user_message, user_id):
+    def should_show_warning(self, user_message, session):
         """
         Kiểm tra xem có nên hiển thị cảnh báo khẩn cấp không
         
         Args:
             user_message: Tin nhắn của người dùng
-            user_id: ID của người dùng
+            session: SessionState của người dùng
             
         Returns:
             bool: True nếu nên hiển thị cảnh báo, False nếu không
@@ -75,8 +77,8 @@ class MISOULChatbot:
         
         # Kiểm tra tin nhắn trước đó có từ chối ý định tự hại không
         denied_self_harm_intent = False
-        if user_id in self.conversation_memory and self.conversation_memory[user_id]:
-            last_messages = self.conversation_memory[user_id][-3:]  # Lấy 3 tin nhắn gần nhất
+        if session.history:
+            last_messages = session.history[-3:]  # Lấy 3 tin nhắn gần nhất
             for msg, _ in last_messages:
                 # Kiểm tra nếu người dùng đã từ chối ý định tự hại
                 if "không có ý định tự hại" in msg.lower() or "không tự hại" in msg.lower():
@@ -84,18 +86,20 @@ class MISOULChatbot:
         
         # Kiểm tra xem đã hiển thị cảnh báo trong 5 tin nhắn gần đây chưa
         warning_recently_shown = False
-        if user_id in self.warning_shown:
-            last_shown = self.warning_shown.get(user_id, 0)
-            warning_recently_shown = (len(self.conversation_memory.get(user_id, [])) - last_shown) < 5
+        if session.warning_shown is not None:
+            warning_recently_shown = (session.turn_count - session.warning_shown) < 5
         
         # Quyết định hiển thị cảnh báo
-        show_warning = contains_self_harm and not denied_self_harm_intent and not warning_recently_shown
-        
-        # Cập nhật trạng thái hiển thị cảnh báo
-        if show_warning:
-            self.warning_shown[user_id] = len(self.conversation_memory.get(user_id, []))
+        return contains_self_harm and not denied_self_harm_intent and not warning_recently_shown
+    
+    def mark_warning_shown(self, session):
+        """
+        Ghi nhận cảnh báo khẩn cấp đã được hiển thị cho người dùng
         
-        return show_warning
+        Args:
+            session: SessionState của người dùng
+        """
+        session.warning_shown = session.turn_count
     
     def modify_prompt_guidelines(self, emotional_level):
         """
@@ -203,54 +207,16 @@ class MISOULChatbot:
         Returns:
             dict: Thông tin về việc có cần xin phép hay không
         """
-        # Kiểm tra xem có phải là câu trả lời đề xuất bài tập không
-        exercise_indicators = [
-            "bài tập", "hướng dẫn", "các bước", "phương pháp",
-            "thực hành", "kỹ thuật", "tập luyện", "gợi ý", "5-4-3-2-1",
-            "kỹ thuật thở", "thiền", "thư giãn", "nghỉ ngơi"
-        ]
-        
-        contains_exercise = any(indicator in response.lower() for indicator in exercise_indicators)
-        
-        if contains_exercise:
-            # Tìm vị trí thích hợp để chia phản hồi
-            # Cải tiến: Tìm câu hoàn chỉnh cuối cùng trước phần hướng dẫn
-            sentences = re.split(r'(?<=[.!?])\s+', response)
-            intro_sentences = []
-            exercise_sentences = []
-            
-            found_exercise = False
-            for sentence in sentences:
-                if not found_exercise:
-                    # Kiểm tra xem câu này có chứa indicator không
-                    if any(indicator in sentence.lower() for indicator in exercise_indicators):
-                        # Tìm điểm phân chia phù hợp
-                        for indicator in exercise_indicators:
-                            if indicator in sentence.lower():
-                                pattern = re.compile(re.escape(indicator), re.IGNORECASE)
-                                parts = pattern.split(sentence, 1)
-                                if len(parts) > 1:
-                                    # Thêm phần đầu vào intro nếu có
-                                    if parts[0].strip():
-                                        intro_sentences.append(parts[0].strip())
-                                    # Thêm phần sau vào exercise
-                                    exercise_text = indicator + parts[1].strip()
-                                    exercise_sentences.append(exercise_text)
-                                    found_exercise = True
-                                    break
-                        
-                        # Nếu không tìm được điểm phân chia, thêm toàn bộ câu vào exercise
-                        if not found_exercise:
-                            exercise_sentences.append(sentence)
-                            found_exercise = True
-                    else:
-                        intro_sentences.append(sentence)
-                else:
-                    exercise_sentences.append(sentence)
-            
-            # Tạo nội dung giới thiệu và hướng dẫn
-            intro_text = " ".join(intro_sentences).strip()
-            exercise_text = " ".join(exercise_sentences).strip()
+        # Tìm từ khóa bài tập đầu tiên trong một lần quét
+        indicator = KEYWORDS.first(response, "exercise")
+        
+        if indicator is not None:
+            # Chia phản hồi tại từ khóa bài tập: các câu trước đó (kể cả phần đầu
+            # của câu chứa từ khóa) là phần giới thiệu, phần còn lại là hướng dẫn
+            response = unicodedata.normalize("NFC", response)
+            sentence_break = r'(?<=[.!?])\s+'
+            intro_text = " ".join(re.split(sentence_break, response[:indicator.start])).strip()
+            exercise_text = " ".join(re.split(sentence_break, response[indicator.start:])).strip()
             
             # Thêm câu hỏi xin phép
             permission_message = f"{intro_text} Bạn có muốn tôi chia sẻ một số bài tập/hướng dẫn có thể giúp ích không?"
@@ -267,68 +233,92 @@ class MISOULChatbot:
             "full_content": response
         }
     
-    def process_message(self, user_message, emotional_level=1, biometric_data=None, user_id="default_user"):
+    def contains_exercise_indicator(self, text):
         """
-        Xử lý tin nhắn người dùng và tạo phản hồi với bộ nhớ cuộc trò chuyện
+        Kiểm tra đoạn văn bản có chứa từ khóa bài tập/hướng dẫn không
         
         Args:
-            user_message: Tin nhắn của người dùng
-            emotional_level: Mức độ cảm xúc (1-5)
-            biometric_data: Dữ liệu sinh trắc học (tùy chọn)
-            user_id: ID của người dùng để lưu trữ cuộc trò chuyện riêng (mặc định: "default_user")
-                
+            text: Đoạn văn bản cần kiểm tra
+            
         Returns:
-            str hoặc dict: Phản hồi từ chatbot (tương thích ngược với API hiện tại)
+            bool: True nếu có từ khóa bài tập
         """
-        # Kiểm tra nếu đang chờ xác nhận từ người dùng
-        if user_id in self.waiting_confirmation and self.waiting_confirmation[user_id]:
-            # Kiểm tra phản hồi của người dùng
-            positive_responses = ["có", "ừ", "đồng ý", "ok", "được", "vâng", "yes", "y", "👍", "okk"]
+        return KEYWORDS.contains(text, "exercise")
+    
+    def _remember_turn(self, session, user_message, assistant_message):
+        """
+        Thêm một lượt trò chuyện vào lịch sử và giới hạn độ dài lịch sử
+        """
+        # Prompt chỉ dùng vài lượt gần nhất với phản hồi đã cắt ngắn,
+        # nên không cần giữ toàn bộ phản hồi dài trong bộ nhớ
+        session.add_turn(
+            user_message, assistant_message,
+            max_turns=Config.SESSION_MAX_TURNS,
+            max_assistant_chars=Config.SESSION_ASSISTANT_MAX_CHARS
+        )
+    
+    def is_waiting_confirmation(self, user_id):
+        """
+        Kiểm tra người dùng có đang chờ xác nhận nhận bài tập không
+        
+        Args:
+            user_id: ID của người dùng
             
-            if any(pos in user_message.lower() for pos in positive_responses):
-                # Người dùng đồng ý, gửi nội dung hướng dẫn đã được chia nhỏ
-                pending_content = self.pending_responses.get(user_id, "")
-                messages = self.split_response_into_messages(pending_content)
-                
-                # Cập nhật lịch sử trò chuyện
-                conversation_history = self.conversation_memory.get(user_id, [])
-                conversation_history.append((user_message, pending_content))
-                
-                # Giới hạn lịch sử để tránh prompt quá dài
-                max_history_length = 10
-                if len(conversation_history) > max_history_length:
-                    conversation_history = conversation_history[-max_history_length:]
-                
-                # Lưu lịch sử trò chuyện đã cập nhật
-                self.conversation_memory[user_id] = conversation_history
-                
-                # Đặt lại trạng thái chờ
-                self.waiting_confirmation[user_id] = False
-                self.pending_responses[user_id] = ""
-                
-                # Trả về danh sách tin nhắn (tương thích với API mới)
-                return messages
-            else:
-                # Người dùng từ chối, gửi tin nhắn thay thế
-                decline_message = "Không vấn đề. Nếu bạn cần bất kỳ hỗ trợ nào khác, hãy cho tôi biết nhé."
-                
-                # Cập nhật lịch sử trò chuyện
-                conversation_history = self.conversation_memory.get(user_id, [])
-                conversation_history.append((user_message, decline_message))
-                self.conversation_memory[user_id] = conversation_history
-                
-                # Đặt lại trạng thái chờ
-                self.waiting_confirmation[user_id] = False
-                self.pending_responses[user_id] = ""
-                
-                # Trả về tin nhắn từ chối (tương thích với API mới)
-                return decline_message
+        Returns:
+            bool: True nếu đang chờ xác nhận
+        """
+        return bool(self.session_store.load(user_id).waiting_confirmation)
+    
+    def _handle_confirmation(self, user_message, session):
+        """
+        Xử lý câu trả lời của người dùng khi đang chờ xác nhận nhận bài tập
         
-        # Xử lý tin nhắn thông thường
-        if not user_message.strip():
-            welcome_message = "Xin chào! Tôi là MISOUL, người bạn đồng hành hỗ trợ sức khỏe tâm lý. Tôi có thể giúp gì cho bạn hôm nay?"
-            return welcome_message
+        Returns:
+            list hoặc str: Nội dung bài tập đã chia nhỏ hoặc tin nhắn từ chối
+        """
+        # Kiểm tra phản hồi của người dùng
+        if KEYWORDS.contains(user_message, "confirmation"):
+            # Người dùng đồng ý, gửi nội dung hướng dẫn đã được chia nhỏ
+            pending_content = session.pending_response
+            messages = self.split_response_into_messages(pending_content)
+            
+            # Cập nhật lịch sử trò chuyện
+            self._remember_turn(session, user_message, pending_content)
+            
+            # Đặt lại trạng thái chờ
+            session.waiting_confirmation = False
+            session.pending_response = ""
+            
+            # Trả về danh sách tin nhắn (tương thích với API mới)
+            return messages
+        
+        # Người dùng từ chối, gửi tin nhắn thay thế
+        decline_message = "Không vấn đề. Nếu bạn cần bất kỳ hỗ trợ nào khác, hãy cho tôi biết nhé."
+        
+        # Cập nhật lịch sử trò chuyện
+        self._remember_turn(session, user_message, decline_message)
+        
+        # Đặt lại trạng thái chờ
+        session.waiting_confirmation = False
+        session.pending_response = ""
+        
+        # Trả về tin nhắn từ chối (tương thích với API mới)
+        return decline_message
+    
+    def _prepare_generation(self, user_message, emotional_level, biometric_data, session, deadline=None, show_warning=None, crisis=None):
+        """
+        Chuẩn bị mọi thứ cần cho lần gọi LLM: cảnh báo, tài liệu, prompt và cấu hình sinh
         
+        Hàm này không ghi trạng thái hội thoại, để request hết hạn có thể bị bỏ qua an toàn.
+        
+        Args:
+            show_warning: Kết quả should_show_warning nếu đã kiểm tra trước (tùy chọn)
+            crisis: Kết quả check_self_harm_content nếu đã kiểm tra trước (tùy chọn)
+        
+        Returns:
+            dict: prompt, temperature, max_tokens, show_warning và crisis
+                  (True nếu tin nhắn có nội dung tự hại)
+        """
         # Chuẩn bị biometric_data nếu không được cung cấp
         if biometric_data is None:
             biometric_data = {
@@ -338,13 +328,21 @@ class MISOULChatbot:
             }
         
         # Lấy lịch sử trò chuyện của người dùng nếu có
-        conversation_history = self.conversation_memory.get(user_id, [])
+        conversation_history = session.history
         
         # Kiểm tra nội dung tự hại và quyết định hiển thị cảnh báo
-        show_warning = self.should_show_warning(user_message, user_id)
-        
-        # Truy xuất tài liệu liên quan
-        retrieved_docs = self.rag_manager.retrieve_documents(user_message, emotional_level)
+        with STAGE_LATENCY.time(stage="safety_check"):
+            if crisis is None:
+                crisis = self.check_self_harm_content(user_message)
+            if show_warning is None:
+                show_warning = self.should_show_warning(user_message, session)
+        
+        # Truy xuất tài liệu liên quan; tin nhắn khủng hoảng dùng tài liệu đã chọn sẵn
+        with STAGE_LATENCY.time(stage="retrieval"):
+            if crisis:
+                retrieved_docs = self.rag_manager.get_crisis_documents(top_k=Config.CRISIS_TOP_K, deadline=deadline)
+            else:
+                retrieved_docs = self.rag_manager.retrieve_documents(user_message, emotional_level, deadline=deadline)
         
         # Thêm hướng dẫn về phản hồi dựa trên mức độ cảm xúc
         guidelines = self.modify_prompt_guidelines(emotional_level)
@@ -355,14 +353,16 @@ class MISOULChatbot:
             guidelines += "\n8. Thể hiện sự đồng cảm và cung cấp hướng dẫn cụ thể để người dùng tìm kiếm sự giúp đỡ."
         
         # Xây dựng prompt với hướng dẫn bổ sung
-        prompt = self.prompt_manager.create_prompt(
-            user_message, 
-            emotional_level, 
-            biometric_data, 
-            retrieved_docs, 
-            conversation_history,
-            guidelines
-        )
+        with STAGE_LATENCY.time(stage="prompt"):
+            prompt = self.prompt_manager.create_prompt(
+                user_message, 
+                emotional_level, 
+                biometric_data, 
+                retrieved_docs, 
+                conversation_history,
+                guidelines
+            )
+        PROMPT_SIZE.observe(len(prompt))
         
         # Điều chỉnh temperature theo mức độ cảm xúc
         temperature = 0.7
@@ -371,53 +371,254 @@ class MISOULChatbot:
         elif emotional_level == 3:
             temperature = 0.5  # Khá nhất quán khi lo âu vừa phải
         
+        # Tin nhắn khủng hoảng cần phản hồi ngắn gọn, nhất quán và nhanh
+        max_tokens = None
+        if crisis:
+            temperature = min(temperature, Config.CRISIS_TEMPERATURE)
+            max_tokens = Config.CRISIS_MAX_OUTPUT_TOKENS
+        
+        return {
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "show_warning": show_warning,
+            "crisis": crisis
+        }
+    
+    @staticmethod
+    def _elapsed(deadline, started_at):
+        """Số giây kể từ khi request bắt đầu (theo deadline nếu có)"""
+        if deadline is not None:
+            return deadline.elapsed()
+        return time.monotonic() - started_at
+    
+    def process_message(self, user_message, emotional_level=1, biometric_data=None, user_id="default_user", deadline=None):
+        """
+        Xử lý tin nhắn người dùng và tạo phản hồi với bộ nhớ cuộc trò chuyện
+        
+        Args:
+            user_message: Tin nhắn của người dùng
+            emotional_level: Mức độ cảm xúc (1-5)
+            biometric_data: Dữ liệu sinh trắc học (tùy chọn)
+            user_id: ID của người dùng để lưu trữ cuộc trò chuyện riêng (mặc định: "default_user")
+            deadline: Deadline của request (tùy chọn)
+                
+        Returns:
+            str hoặc dict: Phản hồi từ chatbot (tương thích ngược với API hiện tại)
+            
+        Raises:
+            DeadlineExceeded: Nếu request hết hạn, khi đó trạng thái hội thoại không bị thay đổi
+        """
+        # Request đã hết hạn khi còn chờ trong hàng đợi thì bỏ qua
+        if deadline is not None:
+            deadline.check("xử lý tin nhắn")
+        
+        # Khóa trong process trước, để chỉ một thread của process chờ lượt trong session store dùng chung
+        with self.user_locks.hold(user_id, deadline), self.session_store.lock(user_id, deadline):
+            return self._process_message(user_message, emotional_level, biometric_data, user_id, deadline)
+    
+    def _process_message(self, user_message, emotional_level, biometric_data, user_id, deadline):
+        """
+        Xử lý một lượt trò chuyện, người gọi phải đang giữ khóa của user_id
+        """
+        started_at = time.monotonic()
+        
+        # Đọc trạng thái hội thoại một lần cho cả lượt
+        session = self.session_store.load(user_id)
+        
+        # Kiểm tra nếu đang chờ xác nhận từ người dùng
+        if session.waiting_confirmation:
+            result = self._handle_confirmation(user_message, session)
+            self.session_store.save(user_id, session)
+            return result
+        
+        # Xử lý tin nhắn thông thường
+        if not user_message.strip():
+            welcome_message = "Xin chào! Tôi là MISOUL, người bạn đồng hành hỗ trợ sức khỏe tâm lý. Tôi có thể giúp gì cho bạn hôm nay?"
+            return welcome_message
+        
+        generation = self._prepare_generation(
+            user_message, emotional_level, biometric_data, session, deadline
+        )
+        
         # Tạo phản hồi với temperature phù hợp
-        response = self.llm_manager.generate_response(prompt, temperature=temperature)
+        response = self.llm_manager.generate_response(
+            generation["prompt"],
+            temperature=generation["temperature"],
+            max_tokens=generation["max_tokens"],
+            deadline=deadline
+        )
+        
+        # Không ghi trạng thái cho request mà client đã bỏ
+        if deadline is not None:
+            deadline.check("lưu lịch sử trò chuyện")
         
         # Tạo cảnh báo nếu cần
         messages = []
-        if show_warning:
+        if generation["show_warning"]:
+            self.mark_warning_shown(session)
             messages.append(self.get_emergency_warning())
         
         # Kiểm tra xem có phải phản hồi đề xuất bài tập không
+        postprocess_start = time.perf_counter()
         exercise_info = self.detect_exercise_suggestion(response)
         
         if exercise_info["requires_permission"]:
             # Lưu nội dung đầy đủ để sử dụng sau khi người dùng xác nhận
-            self.pending_responses[user_id] = exercise_info["full_content"]
-            self.waiting_confirmation[user_id] = True
+            session.pending_response = exercise_info["full_content"]
+            session.waiting_confirmation = True
             
             # Cập nhật lịch sử trò chuyện chỉ với phần giới thiệu
-            conversation_history.append((user_message, exercise_info["initial_message"]))
-            self.conversation_memory[user_id] = conversation_history
+            self._remember_turn(session, user_message, exercise_info["initial_message"])
             
             # Thêm tin nhắn xin phép vào danh sách phản hồi
             messages.append(exercise_info["initial_message"])
-            
-            # Trả về tin nhắn xin phép (tương thích với API mới)
-            if len(messages) == 1:
-                return messages[0]
-            return messages
         else:
             # Chia nhỏ phản hồi thành nhiều tin nhắn
             response_messages = self.split_response_into_messages(response)
             messages.extend(response_messages)
             
             # Cập nhật lịch sử trò chuyện với phản hồi đầy đủ
-            conversation_history.append((user_message, response))
+            self._remember_turn(session, user_message, response)
+        
+        STAGE_LATENCY.observe(time.perf_counter() - postprocess_start, stage="postprocess")
+        
+        # Ghi trạng thái hội thoại một lần cho cả lượt
+        self.session_store.save(user_id, session)
+        
+        # Không streaming thì cảnh báo được gửi cùng phản hồi, nên được ghi vào series
+        # endpoint="chat" tách khỏi độ trễ cảnh báo của luồng nhanh khi streaming
+        if generation["crisis"]:
+            elapsed = self._elapsed(deadline, started_at)
+            if generation["show_warning"]:
+                CRISIS_LATENCY.observe(elapsed, phase="warning", endpoint="chat")
+            CRISIS_LATENCY.observe(elapsed, phase="reply", endpoint="chat")
+        
+        # Tương thích ngược - trả về danh sách tin nhắn hoặc chuỗi đơn
+        if len(messages) == 1:
+            return messages[0]  # Trả về chuỗi đơn nếu chỉ có một tin nhắn
+        return messages  # Trả về danh sách tin nhắn nếu có nhiều tin nhắn
+    
+    def process_message_stream(self, user_message, emotional_level=1, biometric_data=None, user_id="default_user", deadline=None):
+        """
+        Phiên bản streaming của process_message: trả về từng tin nhắn ngay khi có thể chốt được
+        
+        Mỗi đoạn văn (kết thúc bằng dòng trống) được gửi đi ngay khi Gemini sinh xong.
+        Khi gặp đoạn có nội dung bài tập, phần còn lại được giữ lại để xin phép người dùng
+        giống như process_message.
+        
+        Args:
+            user_message: Tin nhắn của người dùng
+            emotional_level: Mức độ cảm xúc (1-5)
+            biometric_data: Dữ liệu sinh trắc học (tùy chọn)
+            user_id: ID của người dùng
+            deadline: Deadline của request (tùy chọn)
             
-            # Giới hạn lịch sử để tránh prompt quá dài
-            max_history_length = 10
-            if len(conversation_history) > max_history_length:
-                conversation_history = conversation_history[-max_history_length:]
+        Yields:
+            str: Từng tin nhắn của phản hồi
             
-            # Lưu lịch sử trò chuyện đã cập nhật
-            self.conversation_memory[user_id] = conversation_history
+        Raises:
+            DeadlineExceeded: Nếu request hết hạn, khi đó lịch sử trò chuyện không bị thay đổi
+        """
+        # Giữ khóa của người dùng cho đến khi stream kết thúc hoặc bị đóng
+        with self.user_locks.hold(user_id, deadline), self.session_store.lock(user_id, deadline):
+            yield from self._process_message_stream(user_message, emotional_level, biometric_data, user_id, deadline)
+    
+    def _process_message_stream(self, user_message, emotional_level, biometric_data, user_id, deadline):
+        """
+        Phần xử lý của process_message_stream, người gọi phải đang giữ khóa của user_id
+        """
+        started_at = time.monotonic()
+        session = self.session_store.load(user_id)
+        
+        # Các nhánh không gọi LLM được xử lý như bình thường
+        if session.waiting_confirmation or not user_message.strip():
+            result = self._process_message(user_message, emotional_level, biometric_data, user_id, deadline)
+            for message in (result if isinstance(result, list) else [result]):
+                yield message
+            return
+        
+        # Cảnh báo khẩn cấp được gửi ngay, trước khi truy xuất tài liệu và gọi Gemini.
+        # Luồng khủng hoảng chỉ dùng kết quả của bộ so khớp tự hại (check_self_harm_content),
+        # để câu bình thường có dấu không bị đưa vào luồng khẩn cấp
+        with STAGE_LATENCY.time(stage="safety_check"):
+            crisis = self.check_self_harm_content(user_message)
+            show_warning = crisis and self.should_show_warning(user_message, session)
+        
+        if show_warning:
+            self.mark_warning_shown(session)
+            CRISIS_LATENCY.observe(self._elapsed(deadline, started_at), phase="warning", endpoint="chat_stream")
+            yield self.get_emergency_warning()
+        
+        generation = self._prepare_generation(
+            user_message, emotional_level, biometric_data, session, deadline,
+            show_warning=show_warning, crisis=crisis
+        )
+        
+        response = ""        # Toàn bộ văn bản đã nhận từ Gemini
+        cursor = 0           # Vị trí bắt đầu của phần chưa gửi
+        streamed = []        # Các đoạn văn đã gửi cho người dùng
+        holding = False      # True khi đã gặp nội dung bài tập và phải chờ xin phép
+        
+        for chunk in self.llm_manager.generate_response_stream(
+            generation["prompt"],
+            temperature=generation["temperature"],
+            max_tokens=generation["max_tokens"],
+            deadline=deadline
+        ):
+            response += chunk
             
-            # Tương thích ngược - trả về danh sách tin nhắn hoặc chuỗi đơn
-            if len(messages) == 1:
-                return messages[0]  # Trả về chuỗi đơn nếu chỉ có một tin nhắn
-            return messages  # Trả về danh sách tin nhắn nếu có nhiều tin nhắn
+            # Gửi các đoạn văn đã hoàn chỉnh
+            while not holding:
+                paragraph_end = response.find('\n\n', cursor)
+                if paragraph_end == -1:
+                    break
+                
+                paragraph = response[cursor:paragraph_end]
+                if self.contains_exercise_indicator(paragraph):
+                    holding = True
+                    break
+                
+                cursor = paragraph_end + 2
+                if paragraph.strip():
+                    streamed.append(paragraph.strip())
+                    yield paragraph.strip()
+        
+        remainder = response[cursor:]
+        postprocess_start = time.perf_counter()
+        
+        if self.contains_exercise_indicator(remainder):
+            # Các đoạn đã gửi không chứa bài tập nên thuộc phần giới thiệu
+            exercise_info = self.detect_exercise_suggestion(remainder)
+            
+            session.pending_response = exercise_info["full_content"]
+            session.waiting_confirmation = True
+            
+            # Lịch sử lưu phần giới thiệu đầy đủ như process_message
+            introduction = "\n\n".join(streamed + [exercise_info["initial_message"]])
+            self._remember_turn(session, user_message, introduction)
+            self.session_store.save(user_id, session)
+            
+            STAGE_LATENCY.observe(time.perf_counter() - postprocess_start, stage="postprocess")
+            if generation["crisis"]:
+                CRISIS_LATENCY.observe(self._elapsed(deadline, started_at), phase="reply", endpoint="chat_stream")
+            yield exercise_info["initial_message"]
+            return
+        
+        if streamed:
+            # Phản hồi đã được chia theo đoạn văn, phần còn lại là đoạn cuối
+            remaining_messages = [remainder.strip()] if remainder.strip() else []
+        else:
+            remaining_messages = self.split_response_into_messages(remainder)
+        
+        self._remember_turn(session, user_message, response)
+        self.session_store.save(user_id, session)
+        STAGE_LATENCY.observe(time.perf_counter() - postprocess_start, stage="postprocess")
+        if generation["crisis"]:
+            CRISIS_LATENCY.observe(self._elapsed(deadline, started_at), phase="reply", endpoint="chat_stream")
+        
+        for message in remaining_messages:
+            yield message
     
     # [Phần còn lại của class giữ nguyên]
     
@@ -431,12 +632,7 @@ class MISOULChatbot:
         Returns:
             bool: True nếu xóa thành công, False nếu không tìm thấy lịch sử
         """
-        if user_id in self.conversation_memory:
-            self.conversation_memory[user_id] = []
-            self.waiting_confirmation[user_id] = False
-            self.pending_responses[user_id] = ""
-            return True
-        return False
+        return self.session_store.delete(user_id)
     
     def get_conversation_history(self, user_id="default_user", max_items=None):
         """
@@ -449,7 +645,7 @@ class MISOULChatbot:
         Returns:
             list: Danh sách các cặp (user_message, assistant_response)
         """
-        history = self.conversation_memory.get(user_id, [])
+        history = [tuple(turn) for turn in self.session_store.load(user_id).history]
         if max_items is not None and max_items > 0:
             return history[-max_items:]
         return history
@@ -466,7 +662,7 @@ class MISOULChatbot:
             bool: True nếu lưu thành công, False nếu có lỗi
         """
         try:
-            history = self.conversation_memory.get(user_id, [])
+            history = self.session_store.load(user_id).history
             if not history:
                 return False
             
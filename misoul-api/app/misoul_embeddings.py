@@ -1,15 +1,24 @@
 # app/misoul_embeddings.py
+import os
+import json
 from typing import List
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
+from langchain_core.embeddings import Embeddings
 
-class MISOULEmbeddings:
+class MISOULEmbeddings(Embeddings):
     """
     Lớp embeddings tương thích với LangChain
     
-    Sử dụng TF-IDF thay vì CountVectorizer để có hiệu quả tốt hơn
+    Sử dụng TF-IDF thay vì CountVectorizer để có hiệu quả tốt hơn.
+    Vectorizer đã fit được lưu cùng index (save/load) để truy vấn dùng
+    đúng từ vựng và trọng số IDF như lúc xây dựng index.
     """
     
+    # Tên các file lưu vectorizer trong thư mục index
+    VOCABULARY_FILE = "vectorizer_vocabulary.json"
+    IDF_FILE = "vectorizer_idf.npy"
+    
     def __init__(self, max_features=5000):
         """
         Khởi tạo embedding model
@@ -20,6 +29,11 @@ class MISOULEmbeddings:
         self.vectorizer = TfidfVectorizer(max_features=max_features)
         self.fitted = False
     
+    @property
+    def dimension(self):
+        """Số chiều của vector embedding (0 nếu chưa fit)"""
+        return len(self.vectorizer.vocabulary_) if self.fitted else 0
+    
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """
         Tạo embeddings cho danh sách văn bản
@@ -30,16 +44,29 @@ class MISOULEmbeddings:
         Returns:
             List[List[float]]: Danh sách các embedding vectors
         """
+        return self.embed_documents_sparse(texts).toarray().tolist()
+    
+    def embed_documents_sparse(self, texts):
+        """
+        Tạo embeddings dạng ma trận thưa cho danh sách văn bản (fit vectorizer nếu chưa fit)
+        
+        Args:
+            texts: Danh sách các văn bản
+            
+        Returns:
+            scipy.sparse.csr_matrix: Ma trận embeddings, mỗi hàng đã chuẩn hóa L2
+        """
         # Trích xuất text từ documents nếu đó là đối tượng Document
         if hasattr(texts[0], 'page_content'):
             texts = [doc.page_content for doc in texts]
         
         if not self.fitted:
-            self.vectorizer.fit(texts)
+            # fit_transform chỉ tách từ một lần thay vì hai lần như fit rồi transform
+            embeddings = self.vectorizer.fit_transform(texts)
             self.fitted = True
+            return embeddings
         
-        embeddings = self.vectorizer.transform(texts).toarray()
-        return embeddings.tolist()
+        return self.vectorizer.transform(texts)
     
     def embed_query(self, text: str) -> List[float]:
         """
@@ -50,10 +77,95 @@ class MISOULEmbeddings:
             
         Returns:
             List[float]: Embedding vector
+            
+        Raises:
+            ValueError: Nếu vectorizer chưa được fit (vector 0 sẽ cho kết quả tìm kiếm vô nghĩa)
+        """
+        return self.embed_query_sparse(text).toarray()[0].tolist()
+    
+    def embed_query_sparse(self, text):
+        """
+        Tạo embedding dạng ma trận thưa cho một câu truy vấn
+        
+        Args:
+            text: Câu truy vấn
+            
+        Returns:
+            scipy.sparse.csr_matrix: Ma trận 1 hàng
+            
+        Raises:
+            ValueError: Nếu vectorizer chưa được fit
+        """
+        return self.embed_queries_sparse([text])
+    
+    def embed_queries_sparse(self, texts):
+        """
+        Tạo embeddings dạng ma trận thưa cho nhiều câu truy vấn trong một lần gọi vectorizer
+        
+        Args:
+            texts: Danh sách câu truy vấn
+            
+        Returns:
+            scipy.sparse.csr_matrix: Ma trận, mỗi hàng là embedding của một câu truy vấn
+            
+        Raises:
+            ValueError: Nếu vectorizer chưa được fit
+        """
+        if not self.fitted:
+            raise ValueError("Vectorizer chưa được fit, hãy tải bằng MISOULEmbeddings.load() cùng với index")
+        
+        return self.vectorizer.transform(texts)
+    
+    def save(self, directory):
+        """
+        Lưu từ vựng và trọng số IDF của vectorizer đã fit
+        
+        Args:
+            directory: Thư mục lưu (thư mục của index)
+            
+        Returns:
+            list: Đường dẫn các file đã ghi
         """
         if not self.fitted:
-            # Nếu chưa fit, thì không thể embed query
-            return np.zeros(self.vectorizer.max_features).tolist()
+            raise ValueError("Không thể lưu vectorizer chưa được fit")
+        
+        vocabulary_path = os.path.join(directory, self.VOCABULARY_FILE)
+        idf_path = os.path.join(directory, self.IDF_FILE)
+        
+        with open(vocabulary_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "max_features": self.vectorizer.max_features,
+                "vocabulary": {term: int(index) for term, index in self.vectorizer.vocabulary_.items()}
+            }, f, ensure_ascii=False)
+        np.save(idf_path, self.vectorizer.idf_)
+        
+        return [vocabulary_path, idf_path]
+    
+    @classmethod
+    def load(cls, directory):
+        """
+        Tải vectorizer đã fit từ thư mục index
+        
+        Args:
+            directory: Thư mục chứa các file do save() ghi
+            
+        Returns:
+            MISOULEmbeddings: Embedding model đã fit
+            
+        Raises:
+            FileNotFoundError: Nếu thư mục không có vectorizer đã lưu
+        """
+        with open(os.path.join(directory, cls.VOCABULARY_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        idf = np.load(os.path.join(directory, cls.IDF_FILE))
+        
+        if len(idf) != len(data["vocabulary"]):
+            raise ValueError(
+                f"Vectorizer không hợp lệ: {len(data['vocabulary'])} từ nhưng {len(idf)} trọng số IDF"
+            )
         
-        embedding = self.vectorizer.transform([text]).toarray()[0]
-        return embedding.tolist()
\ No newline at end of file
+        embeddings = cls(max_features=data["max_features"])
+        embeddings.vectorizer.vocabulary_ = data["vocabulary"]
+        embeddings.vectorizer.idf_ = idf
+        embeddings.fitted = True
+        return embeddings
@@ -0,0 +1,95 @@
+# app/partitions.py
+import threading
+from collections import Counter
+import numpy as np
+
+# Phân vùng có nhiều đoạn hàng liên tiếp hơn số này (index cũ chưa sắp theo danh mục) được
+# chấm điểm trên toàn bộ các hàng rồi lọc, thay vì chấm từng đoạn hàng
+MAX_PARTITION_RUNS = 32
+
+class Partition:
+    """
+    Các hàng của một tổ hợp danh mục trong vector store.
+
+    Chỉ giữ vị trí các hàng và các đoạn hàng liên tiếp (runs), không chép dữ liệu của index.
+    """
+
+    __slots__ = ("rows", "runs")
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: Vị trí các hàng, tăng dần
+        """
+        self.rows = np.asarray(rows, dtype=np.int64)
+        if len(self.rows) == 0:
+            self.runs = []
+            return
+        breaks = np.flatnonzero(np.diff(self.rows) != 1)
+        starts = self.rows[np.concatenate(([0], breaks + 1))]
+        ends = self.rows[np.concatenate((breaks, [len(self.rows) - 1]))] + 1
+        self.runs = list(zip(starts.tolist(), ends.tolist()))
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def contiguous(self):
+        """True nếu phân vùng gồm ít đoạn hàng liên tiếp (chấm điểm từng đoạn hàng rẻ hơn chấm toàn bộ)"""
+        return len(self.runs) <= MAX_PARTITION_RUNS
+
+class CategoryPartitions:
+    """
+    Chia vector store thành các phân vùng theo metadata["category"] của từng đoạn.
+
+    Lớp con gọi _init_partitions() sau khi có self.documents (ChunkStore). Phân vùng
+    (Partition) của mỗi tổ hợp danh mục được tạo một lần khi cần rồi dùng lại; tìm kiếm
+    có lọc chỉ chấm điểm các hàng thuộc danh mục đó. Store chấm điểm phân vùng trên
+    chính các mảng của index (không chép), nên mảng đã memory-map vẫn được các worker
+    dùng chung trong page cache. Các đoạn được sắp theo danh mục khi xây dựng index nên
+    mỗi danh mục là một đoạn hàng liên tiếp.
+    """
+
+    def _init_partitions(self):
+        # Đọc cột category của ChunkStore, không tạo Document cho từng đoạn
+        self._categories = self.documents.column("category")
+        self._category_counts = dict(Counter(self._categories))
+        self._partitions = {}
+        self._partitions_lock = threading.Lock()
+
+    def category_counts(self):
+        """
+        Returns:
+            dict: Danh mục -> số đoạn văn bản
+        """
+        return self._category_counts
+
+    def partition(self, categories):
+        """
+        Lấy phân vùng gồm các đoạn thuộc các danh mục đã cho
+
+        Args:
+            categories: Danh sách danh mục
+
+        Returns:
+            Partition: Vị trí các hàng thuộc các danh mục này
+        """
+        key = frozenset(categories)
+        partition = self._partitions.get(key)
+        if partition is not None:
+            return partition
+
+        with self._partitions_lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                rows = np.flatnonzero(np.isin(self._categories, list(key)))
+                partition = self._partitions[key] = Partition(rows)
+        return partition
+
+    @staticmethod
+    def _row_ids(positions, partition):
+        """
+        Returns:
+            numpy.ndarray: Vị trí hàng trong store của các vị trí trong phân vùng (giữ nguyên nếu không có phân vùng)
+        """
+        return positions if partition is None else partition.rows[positions]
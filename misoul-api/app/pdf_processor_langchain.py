@@ -7,71 +7,34 @@ from typing import List, Dict, Any
 import traceback
 from langchain_community.document_loaders import PDFPlumberLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from config import Config
-
-class MISOULEmbeddings:
-    """
-    Lớp embeddings tương thích với LangChain
-    
-    Sử dụng TF-IDF để tạo vector embeddings hiệu quả
-    """
-    
-    def __init__(self, max_features=5000):
-        """
-        Khởi tạo embedding model
-        
-        Args:
-            max_features: Số lượng tính năng tối đa
-        """
-        from sklearn.feature_extraction.text import TfidfVectorizer
-        self.vectorizer = TfidfVectorizer(max_features=max_features)
-        self.fitted = False
-    
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """
-        Tạo embeddings cho danh sách văn bản
-        
-        Args:
-            texts: Danh sách các văn bản
-            
-        Returns:
-            List[List[float]]: Danh sách các embedding vectors
-        """
-        # Trích xuất text từ documents nếu đó là đối tượng Document
-        if hasattr(texts[0], 'page_content'):
-            texts = [doc.page_content for doc in texts]
-        
-        if not self.fitted:
-            self.vectorizer.fit(texts)
-            self.fitted = True
-        
-        embeddings = self.vectorizer.transform(texts).toarray()
-        return embeddings.tolist()
-    
-    def embed_query(self, text: str) -> List[float]:
-        """
-        Tạo embedding cho một câu truy vấn
-        
-        Args:
-            text: Câu truy vấn
-            
-        Returns:
-            List[float]: Embedding vector
-        """
-        if not self.fitted:
-            # Nếu chưa fit, thì không thể embed query
-            import numpy as np
-            return np.zeros(self.vectorizer.max_features).tolist()
-        
-        embedding = self.vectorizer.transform([text]).toarray()[0]
-        return embedding.tolist()
+from app.misoul_embeddings import MISOULEmbeddings
+from app.sparse_store import SparseVectorStore
+from app.bm25_store import BM25Store
+from app.lsa_store import LSAStore
+from app.faiss_index import build_faiss_store, save_faiss_store, load_faiss_store, get_index_type
+from app.hybrid_retriever import HybridRetriever
+from app.index_manifest import write_manifest, read_manifest, IndexManifestError
+from app.index_versions import current_version, version_path, create_version, publish_version, discard_version, prune_versions
 
 class PDFProcessor:
     """
     Lớp xử lý tài liệu PDF và chuyển đổi thành vector embeddings sử dụng LangChain
     """
     
+    # Thư mục index trong VECTOR_DB_PATH cho mỗi backend (Config.RETRIEVER_BACKEND)
+    INDEX_DIRECTORIES = {
+        "sparse": "db_sparse",
+        "faiss": "db_faiss",
+        "bm25": "db_bm25",
+        "lsa": "db_lsa"
+    }
+    
+    # Segment HNSW của Chroma (hnswlib) có sẵn trong thư mục vector database của bản cũ
+    LEGACY_HNSW_FILES = ("header.bin", "length.bin", "link_lists.bin", "index_metadata.pickle")
+    # Phần còn thiếu để dùng được segment: vector và đồ thị tầng 0, nội dung các đoạn văn bản
+    LEGACY_HNSW_DATA_FILES = ("data_level0.bin", "chroma.sqlite3")
+    
     def __init__(self, pdf_directory=None, vector_db_path=None):
         """
         Khởi tạo PDFProcessor
@@ -95,6 +58,70 @@ class PDFProcessor:
         # Khởi tạo embedding model
         self.embedding_model = MISOULEmbeddings()
     
+    @staticmethod
+    def get_backend():
+        """
+        Lấy backend tìm kiếm đang được cấu hình
+        
+        Returns:
+            str: "sparse", "faiss", "bm25", "lsa" hoặc "hybrid"
+            
+        Raises:
+            ValueError: Nếu RETRIEVER_BACKEND không được hỗ trợ
+        """
+        backend = Config.RETRIEVER_BACKEND.lower()
+        if backend != "hybrid" and backend not in PDFProcessor.INDEX_DIRECTORIES:
+            raise ValueError(
+                f"RETRIEVER_BACKEND không hợp lệ: {Config.RETRIEVER_BACKEND} "
+                f"(hỗ trợ: {', '.join(PDFProcessor.INDEX_DIRECTORIES)}, hybrid)"
+            )
+        return backend
+    
+    @staticmethod
+    def get_backends():
+        """
+        Lấy danh sách các backend cần xây dựng và tải index
+        
+        Returns:
+            list: Một backend, hoặc các backend trong HYBRID_BACKENDS ở chế độ hybrid
+            
+        Raises:
+            ValueError: Nếu có backend không được hỗ trợ
+        """
+        backend = PDFProcessor.get_backend()
+        if backend != "hybrid":
+            return [backend]
+        
+        backends = [name.strip().lower() for name in Config.HYBRID_BACKENDS.split(",") if name.strip()]
+        invalid = [name for name in backends if name not in PDFProcessor.INDEX_DIRECTORIES]
+        if not backends or invalid:
+            raise ValueError(
+                f"HYBRID_BACKENDS không hợp lệ: {Config.HYBRID_BACKENDS} "
+                f"(hỗ trợ: {', '.join(PDFProcessor.INDEX_DIRECTORIES)})"
+            )
+        return list(dict.fromkeys(backends))
+    
+    @staticmethod
+    def get_index_path(vector_db_path=None, backend=None, version=None):
+        """
+        Lấy thư mục index của backend
+        
+        Mỗi lần xây dựng tạo một phiên bản mới trong VECTOR_DB_PATH/versions, file CURRENT
+        trỏ đến phiên bản đang dùng; index cũ (trước khi có phiên bản) nằm trực tiếp trong
+        VECTOR_DB_PATH và được dùng khi chưa có CURRENT.
+        
+        Args:
+            vector_db_path: Thư mục vector database (mặc định Config.VECTOR_DB_PATH)
+            backend: Backend tìm kiếm (mặc định backend đầu tiên của Config.RETRIEVER_BACKEND)
+            version: Phiên bản index (mặc định phiên bản CURRENT)
+            
+        Returns:
+            str: Đường dẫn thư mục index
+        """
+        backend = backend or PDFProcessor.get_backends()[0]
+        version = version or current_version(vector_db_path)
+        return os.path.join(version_path(vector_db_path, version), PDFProcessor.INDEX_DIRECTORIES[backend])
+    
     @staticmethod
     def check_processing_status():
         """Kiểm tra trạng thái đã xử lý PDF"""
@@ -220,16 +247,87 @@ class PDFProcessor:
         else:
             return "general_mental_health"
     
-    def process_all_pdfs(self):
+    def _build_index(self, backend, chunks):
+        """
+        Tạo index của một backend từ các đoạn văn bản
+        
+        Args:
+            backend: "sparse", "faiss", "bm25" hoặc "lsa"
+            chunks: Danh sách các đoạn văn bản
+            
+        Returns:
+            Vector store của backend
+        """
+        print(f"⏳ Đang tạo vector database ({backend}) với {len(chunks)} đoạn văn bản...")
+        if backend == "sparse":
+            return SparseVectorStore.from_documents(chunks, self.embedding_model)
+        if backend == "bm25":
+            return BM25Store.from_documents(chunks)
+        if backend == "lsa":
+            # Ma trận chiếu LSA được fit tại đây, cùng lúc với vectorizer
+            return LSAStore.from_documents(chunks, self.embedding_model)
+        # Loại index FAISS (flat, IVF hoặc HNSW) được chọn khi xây dựng theo FAISS_INDEX_TYPE
+        return build_faiss_store(chunks, self.embedding_model)
+    
+    def _save_index(self, backend, db, chunk_count, version):
+        """
+        Lưu index của một backend cùng vectorizer và manifest
+        
+        Args:
+            backend: "sparse", "faiss", "bm25" hoặc "lsa"
+            db: Vector store do _build_index tạo
+            chunk_count: Số đoạn văn bản trong index
+            version: Phiên bản mới (create_version), chưa được publish nên không process nào đang đọc
+        """
+        index_path = PDFProcessor.get_index_path(self.vector_db_path, backend, version)
+        if backend == "faiss":
+            save_faiss_store(db, index_path)
+        else:
+            db.save_local(index_path)
+        
+        # Lưu vectorizer đã fit cùng thư mục, manifest ràng buộc nó với index
+        # (BM25 tự lưu từ vựng trong inverted index)
+        extra = {}
+        if backend == "bm25":
+            embedding, dimension = "bm25", db.dimension
+        elif backend == "lsa":
+            self.embedding_model.save(index_path)
+            embedding, dimension = "tfidf+lsa", db.dimension
+            extra["dtype"] = db.dtype
+        else:
+            self.embedding_model.save(index_path)
+            embedding, dimension = "tfidf", self.embedding_model.dimension
+        if backend == "faiss":
+            extra["index_type"] = get_index_type()
+        write_manifest(
+            index_path,
+            backend=backend,
+            embedding=embedding,
+            dimension=dimension,
+            chunks=chunk_count,
+            **extra
+        )
+        print(f"✅ Đã lưu vector database vào {index_path}")
+    
+    def process_all_pdfs(self, force=False, job=None):
         """
         Xử lý tất cả các file PDF trong thư mục và tạo vector database
         
+        Args:
+            force: Xử lý lại kể cả khi trạng thái cho biết đã xử lý trước đó
+            job: IndexBuildJob (tùy chọn) để báo tiến độ và nhận yêu cầu hủy
+        
         Returns:
             bool: True nếu thành công, False nếu thất bại
+            
+        Raises:
+            IndexBuildCancelled: Nếu job bị hủy giữa chừng
         """
+        from app.index_job import IndexBuildCancelled
+        
         try:
             # Kiểm tra xem đã xử lý chưa
-            if PDFProcessor.check_processing_status():
+            if not force and PDFProcessor.check_processing_status():
                 print("✅ Các file PDF đã được xử lý trước đó. Bỏ qua bước xử lý.")
                 return True
                 
@@ -241,12 +339,16 @@ class PDFProcessor:
                 return False
             
             print(f"🔍 Tìm thấy {len(pdf_files)} file PDF để xử lý")
+            if job:
+                job.set_stage("loading_pdfs", files_total=len(pdf_files))
             
             # Lưu trữ tất cả các đoạn văn bản
             all_chunks = []
             
             # Xử lý từng file PDF
             for pdf_file in pdf_files:
+                if job:
+                    job.check_cancelled()
                 print(f"⏳ Đang xử lý file: {os.path.basename(pdf_file)}")
                 
                 # Tải PDF
@@ -268,52 +370,170 @@ class PDFProcessor:
                 
                 # Thêm vào danh sách chung
                 all_chunks.extend(chunks_with_metadata)
+                if job:
+                    job.record_file(pages=len(documents), chunks=len(chunks_with_metadata))
             
             if not all_chunks:
                 print("❌ Không có đoạn văn bản nào để xử lý sau khi đọc tất cả các file PDF")
                 return False
             
-            # Tạo vector database với FAISS
-            print(f"⏳ Đang tạo FAISS vector database với {len(all_chunks)} đoạn văn bản...")
-            db = FAISS.from_documents(all_chunks, self.embedding_model)
+            # Sắp các đoạn theo danh mục để mỗi danh mục là một đoạn hàng liên tiếp của index:
+            # phân vùng được tìm trên các hàng đó của mảng dùng chung, không phải chép ra
+            all_chunks.sort(key=lambda chunk: chunk.metadata.get("category", ""))
             
-            # Lưu vector database
-            faiss_path = os.path.join(self.vector_db_path, "db_faiss")
-            db.save_local(faiss_path)
-            print(f"✅ Đã lưu FAISS vector database vào {faiss_path}")
+            # Tạo vector database với các backend đã cấu hình trong một phiên bản mới;
+            # process khác chỉ thấy phiên bản này khi CURRENT được chuyển sang, cùng lúc cho mọi backend
+            backends = PDFProcessor.get_backends()
+            version = create_version(self.vector_db_path)
+            try:
+                for backend in backends:
+                    if job:
+                        job.check_cancelled()
+                        job.set_stage("embedding")
+                    db = self._build_index(backend, all_chunks)
+                    if job:
+                        job.check_cancelled()
+                        job.set_stage("saving")
+                    self._save_index(backend, db, len(all_chunks), version)
+                if job:
+                    job.check_cancelled()
+            except BaseException:
+                discard_version(self.vector_db_path, version)
+                raise
+            publish_version(self.vector_db_path, version)
+            print(f"✅ Đã chuyển vector database sang phiên bản {version}")
+            removed = prune_versions(self.vector_db_path)
+            if removed:
+                print(f"✅ Đã xóa các phiên bản index cũ: {', '.join(removed)}")
+            if job:
+                job.record_indexed(len(all_chunks))
             
             # Lưu trạng thái đã xử lý
             PDFProcessor.save_processing_status(True)
             
             return True
             
+        except IndexBuildCancelled:
+            raise
         except Exception as e:
             print(f"❌ Lỗi khi xử lý PDF: {e}")
             traceback.print_exc()
             return False
     
     @staticmethod
-    def load_vector_store():
+    def load_vector_store(version=None, checksums=False):
         """
         Tải vector store từ đĩa
         
+        Args:
+            version: Phiên bản index (mặc định phiên bản CURRENT)
+            checksums: Tính lại checksum của mọi file index thay vì chỉ so kích thước và thời điểm sửa
+            
+        Returns:
+            SparseVectorStore, FAISS, BM25Store, LSAStore hoặc HybridRetriever (theo Config.RETRIEVER_BACKEND),
+            None nếu lỗi hoặc có index không dùng được
+        """
+        try:
+            backends = PDFProcessor.get_backends()
+            hybrid = PDFProcessor.get_backend() == "hybrid"
+        except ValueError as e:
+            print(f"❌ {e}")
+            return None
+        
+        stores = {}
+        for backend in backends:
+            db = PDFProcessor._load_index(backend, version, checksums)
+            if db is None:
+                return None
+            stores[backend] = db
+        
+        if hybrid:
+            print(f"✅ Đã bật tìm kiếm hybrid với các backend: {', '.join(stores)}")
+            return HybridRetriever(stores)
+        return stores[backends[0]]
+    
+    @staticmethod
+    def _report_legacy_hnsw_store(vector_db_path=None):
+        """
+        Giải thích vì sao segment HNSW của bản cũ (nếu có trong thư mục vector database)
+        không được dùng thay cho việc xây dựng lại index
+        
+        Args:
+            vector_db_path: Thư mục vector database (mặc định Config.VECTOR_DB_PATH)
+        """
+        vector_db_path = vector_db_path or Config.VECTOR_DB_PATH
+        if not all(os.path.exists(os.path.join(vector_db_path, name)) for name in PDFProcessor.LEGACY_HNSW_FILES):
+            return
+        missing = [
+            name for name in PDFProcessor.LEGACY_HNSW_DATA_FILES
+            if not os.path.exists(os.path.join(vector_db_path, name))
+        ]
+        if missing:
+            print(
+                f"⚠️ {vector_db_path} có segment HNSW của bản cũ nhưng thiếu {', '.join(missing)} "
+                "(vector và nội dung các đoạn văn bản), không tải được, cần xây dựng lại index từ PDF"
+            )
+        else:
+            print(f"⚠️ {vector_db_path} có segment HNSW của bản cũ (Chroma), chưa được hỗ trợ, cần xây dựng lại index từ PDF")
+    
+    @staticmethod
+    def _load_index(backend, version=None, checksums=False):
+        """
+        Tải index của một backend
+        
+        Args:
+            backend: "sparse", "faiss", "bm25" hoặc "lsa"
+            version: Phiên bản index (mặc định phiên bản CURRENT)
+            checksums: Tính lại checksum của mọi file index (xem read_manifest)
+            
         Returns:
-            FAISS: FAISS vector store hoặc None nếu lỗi
+            Vector store của backend hoặc None nếu lỗi
         """
         try:
-            faiss_path = os.path.join(Config.VECTOR_DB_PATH, "db_faiss")
-            if not os.path.exists(faiss_path):
-                print(f"❌ Không tìm thấy FAISS vector database tại {faiss_path}")
+            index_path = PDFProcessor.get_index_path(backend=backend, version=version)
+            if not os.path.exists(index_path):
+                print(f"❌ Không tìm thấy vector database ({backend}) tại {index_path}")
+                PDFProcessor._report_legacy_hnsw_store()
                 return None
             
-            # Tải FAISS với allow_dangerous_deserialization=True
-            embedding_model = MISOULEmbeddings()
-            db = FAISS.load_local(faiss_path, embedding_model, allow_dangerous_deserialization=True)
-            print(f"✅ Đã tải FAISS vector database từ {faiss_path}")
+            # Chỉ tải index khi vectorizer và index khớp với manifest
+            manifest = read_manifest(index_path, checksums=checksums)
+            if backend == "bm25":
+                db = BM25Store.load_local(index_path)
+                dimension, expected_dimension = db.dimension, manifest.get("dimension")
+            else:
+                if MISOULEmbeddings.VOCABULARY_FILE not in manifest["files"]:
+                    raise IndexManifestError("Index không có vectorizer đi kèm, cần xây dựng lại")
+                embedding_model = MISOULEmbeddings.load(index_path)
+                expected_dimension = embedding_model.dimension
+                
+                if backend == "sparse":
+                    db = SparseVectorStore.load_local(index_path, embedding_model)
+                    dimension = db.dimension
+                elif backend == "lsa":
+                    db = LSAStore.load_local(index_path, embedding_model)
+                    dimension, expected_dimension = db.dimension, manifest.get("dimension")
+                else:
+                    # Đổi FAISS_INDEX_TYPE cần xây dựng lại index; nprobe/efSearch thì không
+                    index_type = manifest.get("index_type", "flat")
+                    if index_type != get_index_type():
+                        raise IndexManifestError(
+                            f"Index FAISS loại {index_type} nhưng FAISS_INDEX_TYPE là {get_index_type()}, cần xây dựng lại"
+                        )
+                    db = load_faiss_store(index_path, embedding_model)
+                    dimension = db.index.d
+            if dimension != expected_dimension:
+                raise IndexManifestError(
+                    f"Index có {dimension} chiều nhưng cần {expected_dimension} chiều"
+                )
+            print(f"✅ Đã tải vector database ({backend}) từ {index_path} ({manifest.get('chunks')} đoạn, {dimension} chiều)")
             
             return db
+        except IndexManifestError as e:
+            print(f"❌ Vector database ({backend}) không dùng được: {e}")
+            return None
         except Exception as e:
-            print(f"❌ Lỗi khi tải FAISS vector database: {e}")
+            print(f"❌ Lỗi khi tải vector database ({backend}): {e}")
             traceback.print_exc()
             return None
 
@@ -1,5 +1,7 @@
 # app/prompt_manager.py
 import re
+from app.keyword_matcher import KEYWORDS
+from app.chunk_store import SNIPPET_KEY, prompt_snippet
 class PromptManager:
     """
     Quản lý việc tạo và định dạng prompt cho mô hình ngôn ngữ.
@@ -124,17 +126,8 @@ Bạn PHẢI:
 QUAN TRỌNG: KHÔNG đưa thông tin khẩn cấp vào tin nhắn của bạn. Tin nhắn khẩn cấp sẽ được hiển thị riêng.
 """
 
-        # Thêm biến flag để kiểm tra nội dung tiêu cực và khủng hoảng
-        crisis_keywords = [
-            "tự tử", "tự hại", "tự làm đau", "muốn chết", "không muốn sống", 
-            "kết thúc cuộc đời", "kết thúc tất cả", "không còn ý nghĩa", 
-            "đau khổ quá mức", "không chịu nổi", "cứu tôi", "giết", "chết", 
-            "tôi sẽ biến mất", "tôi muốn biến mất", "cắt tay", "uống thuốc",
-            "quá đau đớn", "không thể tiếp tục", "tạm biệt", "lần cuối"
-        ]
-
         # Kiểm tra xem tin nhắn của người dùng có chứa từ khóa khủng hoảng không
-        has_crisis_indicators = any(keyword in user_message.lower() for keyword in crisis_keywords)
+        has_crisis_indicators = KEYWORDS.contains(user_message, "crisis")
 
         # Nếu phát hiện dấu hiệu khủng hoảng hoặc mức độ cảm xúc là 4-5, thêm hướng dẫn xử lý khủng hoảng
         if has_crisis_indicators or emotional_level >= 4:
@@ -172,10 +165,10 @@ LƯU Ý QUAN TRỌNG: KHÔNG đề cập đến các chỉ số cụ thể này
             retrieved_context = "\nTHÔNG TIN CHUYÊN MÔN LIÊN QUAN:\n"
             for i, doc in enumerate(retrieved_docs, 1):
                 category = doc.metadata.get('category', 'không phân loại') if hasattr(doc, 'metadata') else 'không phân loại'
-                content = doc.page_content if hasattr(doc, 'page_content') else str(doc)
-                # Giới hạn độ dài nội dung
-                if len(content) > 300:
-                    content = content[:297] + "..."
+                # Giới hạn độ dài nội dung; đoạn trích đã được tính sẵn khi tài liệu đến từ ChunkStore
+                content = doc.metadata.get(SNIPPET_KEY) if hasattr(doc, 'metadata') else None
+                if content is None:
+                    content = prompt_snippet(doc.page_content if hasattr(doc, 'page_content') else str(doc))
                 retrieved_context += f"Tài liệu {i} (Danh mục: {category}):\n{content}\n\n"
 
         # === PHẦN 6: HƯỚNG DẪN PHẢN HỒI CỤ THỂ ===
@@ -1,5 +1,78 @@
 # app/rag_manager.py
+from contextlib import contextmanager
+import numpy as np
+from config import Config
 from app.pdf_processor_langchain import PDFProcessor
+from app.hybrid_retriever import HybridRetriever
+from app.retrieval_cache import LRUCache, normalize_query
+from app.index_versions import IndexVersion, current_version
+
+# Truy vấn dùng để chọn sẵn tài liệu cho tin nhắn khủng hoảng
+CRISIS_QUERY = "khủng hoảng tự tử tự hại ý định tự sát tuyệt vọng hỗ trợ khẩn cấp an toàn tìm kiếm giúp đỡ"
+
+# Các danh mục tài liệu (metadata["category"]) được tìm cho mỗi mức độ cảm xúc
+CATEGORY_ROUTES = {
+    1: ["mindfulness", "cbt_techniques", "general_mental_health"],
+    2: ["anxiety", "mindfulness", "cbt_techniques", "general_mental_health"],
+    3: ["anxiety", "depression", "cbt_techniques", "mindfulness"],
+    4: ["depression", "anxiety", "cbt_techniques"],
+    5: ["crisis", "cbt_techniques", "depression"]
+}
+
+# Các từ khóa liên quan đến mỗi mức độ cảm xúc, dùng để mở rộng truy vấn
+EMOTIONAL_KEYWORDS = {
+    1: ["bình thường", "ổn định", "tích cực"],
+    2: ["lo lắng nhẹ", "căng thẳng nhẹ", "hơi buồn"],
+    3: ["lo âu", "căng thẳng", "buồn", "trầm"],
+    4: ["trầm cảm", "lo âu nặng", "căng thẳng cao", "sợ hãi"],
+    5: ["khủng hoảng", "tuyệt vọng", "cực kỳ lo âu", "cực kỳ trầm cảm"]
+}
+
+def parse_expansion_weights(value):
+    """
+    Đọc trọng số mở rộng truy vấn của 5 mức độ cảm xúc từ chuỗi "w1,w2,w3,w4,w5"
+    
+    Args:
+        value: Chuỗi cấu hình (QUERY_EXPANSION_WEIGHTS)
+        
+    Returns:
+        dict: Mức độ cảm xúc -> trọng số
+        
+    Raises:
+        ValueError: Nếu chuỗi không có đúng 5 số không âm
+    """
+    weights = [float(weight) for weight in value.split(",")]
+    if len(weights) != len(EMOTIONAL_KEYWORDS) or any(weight < 0 for weight in weights):
+        raise ValueError(f"QUERY_EXPANSION_WEIGHTS cần {len(EMOTIONAL_KEYWORDS)} số không âm, nhận được: {value}")
+    return dict(zip(sorted(EMOTIONAL_KEYWORDS), weights))
+
+def _faiss_search_batch(vector_db, queries, k):
+    """
+    Tìm kiếm nhiều câu truy vấn trên FAISS bằng một lần gọi index.search
+
+    Args:
+        vector_db: FAISS vector store
+        queries: Danh sách câu truy vấn
+        k: Số kết quả của mỗi truy vấn
+
+    Returns:
+        list: Với mỗi truy vấn theo thứ tự, danh sách tài liệu liên quan nhất trước
+    """
+    embedding = vector_db.embedding_function
+    if hasattr(embedding, "embed_queries_sparse"):
+        # Một lần gọi vectorizer cho cả lô
+        vectors = embedding.embed_queries_sparse(queries).toarray().astype(np.float32)
+    else:
+        vectors = np.array([vector_db._embed_query(query) for query in queries], dtype=np.float32)
+    if getattr(vector_db, "_normalize_L2", False):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms > 0, norms, 1)
+
+    _, indices = vector_db.index.search(vectors, k)
+    return [
+        [vector_db.docstore.search(vector_db.index_to_docstore_id[i]) for i in row if i != -1]
+        for row in indices
+    ]
 
 class RAGManager:
     """
@@ -9,31 +82,178 @@ class RAGManager:
     kết hợp với phân tích cảm xúc để cung cấp thông tin chính xác và phù hợp.
     """
     
-    def __init__(self, vector_db=None):
+    def __init__(self, vector_db=None, load_if_missing=True, version=None):
         """
         Khởi tạo RAGManager với vector database
         
         Args:
-            vector_db: Vector database (FAISS hoặc None)
+            vector_db: Vector database (SparseVectorStore, FAISS, BM25Store, HybridRetriever hoặc None)
+            load_if_missing: Tải vector database từ đĩa nếu không được cung cấp
+            version: Phiên bản index của vector_db (index_versions)
         """
         # Nếu không cung cấp vector_db, tải từ đĩa
-        self.vector_db = vector_db or PDFProcessor.load_vector_store()
+        if vector_db is None and load_if_missing:
+            version = current_version()
+            vector_db = PDFProcessor.load_vector_store(version)
+        # Phiên bản đang phục vụ, có đếm số truy vấn đang dùng (set_vector_db thay thế)
+        self._active = IndexVersion(vector_db, version)
+        
+        # (vector_db, tài liệu) được chọn sẵn cho tin nhắn khủng hoảng
+        self._crisis_documents = (None, [])
+        
+        # Trọng số của vector từ khóa theo mức độ cảm xúc, chỉnh bằng set_expansion_weight
+        self.expansion_weights = parse_expansion_weights(Config.QUERY_EXPANSION_WEIGHTS)
+        
+        # (vector_db, mức độ cảm xúc -> vector từ khóa) tính một lần cho mỗi vector database
+        self._keyword_vectors = (vector_db, self._encode_keywords(vector_db))
+        
+        # (vector_db, cache kết quả tìm kiếm của vector database đó)
+        self._retrieval_cache = (vector_db, self._create_retrieval_cache())
         print("✅ Đã khởi tạo RAG Manager thành công!")
+    
+    @property
+    def vector_db(self):
+        """Vector database đang phục vụ (truy vấn mới dùng bản này)"""
+        return self._active.vector_db
+    
+    @property
+    def index_version(self):
+        """Phiên bản index đang phục vụ (None với index không có phiên bản)"""
+        return self._active.version
+    
+    def set_vector_db(self, vector_db, version=None):
+        """
+        Thay thế vector database đang dùng bằng bản mới
+        
+        Phép gán tham chiếu là nguyên tử: các truy vấn đang chạy tiếp tục với
+        bản cũ, truy vấn mới dùng bản mới. Bản cũ được giải phóng khi truy vấn
+        cuối cùng dùng nó kết thúc (IndexVersion đếm tham chiếu).
+        
+        Args:
+            vector_db: Vector database mới
+            version: Phiên bản index của vector database mới
+        """
+        # Tính vector từ khóa trước khi chuyển để truy vấn đầu tiên không phải chờ
+        keyword_vectors = self._encode_keywords(vector_db)
+        old_cache = self._retrieval_cache[1]
+        previous, self._active = self._active, IndexVersion(vector_db, version)
+        self._keyword_vectors = (vector_db, keyword_vectors)
+        self._retrieval_cache = (vector_db, self._create_retrieval_cache())
+        self._crisis_documents = (None, [])
+        in_flight = previous.in_flight
+        previous.retire()
+        # Kết quả của index cũ không còn dùng được
+        old_cache.clear()
+        print(f"✅ Đã chuyển sang vector database mới (phiên bản {version or 'không có'}), "
+              f"{in_flight} truy vấn còn dùng bản cũ")
+    
+    @contextmanager
+    def _use_vector_db(self):
+        """
+        Giữ phiên bản vector database đang dùng trong suốt một lượt truy xuất, để bản
+        cũ không bị giải phóng khi được thay giữa chừng
+        
+        Yields:
+            Vector database (hoặc None)
+        """
+        while True:
+            active = self._active
+            # Phiên bản vừa được giải phóng thì set_vector_db đã gán bản mới
+            if active.acquire():
+                break
+        try:
+            yield active.vector_db
+        finally:
+            active.release()
+    
+    def set_expansion_weight(self, emotional_level, weight):
+        """
+        Đặt trọng số của vector từ khóa cảm xúc cho một mức độ
+        
+        Args:
+            emotional_level: Mức độ cảm xúc (1-5)
+            weight: Trọng số (0 = không mở rộng truy vấn)
+        """
+        if emotional_level not in EMOTIONAL_KEYWORDS:
+            raise ValueError(f"Mức độ cảm xúc không hợp lệ: {emotional_level}")
+        if weight < 0:
+            raise ValueError(f"Trọng số không được âm: {weight}")
+        self.expansion_weights[emotional_level] = float(weight)
+    
+    @staticmethod
+    def _encode_keywords(vector_db):
+        """
+        Tạo vector từ khóa cho mỗi mức độ cảm xúc
+        
+        Args:
+            vector_db: Vector database
+            
+        Returns:
+            dict: Mức độ cảm xúc -> vector từ khóa, None nếu vector database không hỗ trợ
+                  encode_query (FAISS dùng cách nối chuỗi trong _expand_query)
+        """
+        if vector_db is None or not hasattr(vector_db, "encode_query"):
+            return None
         
-    def retrieve_documents(self, query, emotional_level=1, top_k=3):
+        vectors = {}
+        for level, keywords in EMOTIONAL_KEYWORDS.items():
+            vector = vector_db.encode_query(" ".join(keywords))
+            if vector is None:
+                return None
+            vectors[level] = vector
+        return vectors
+    
+    @staticmethod
+    def _create_retrieval_cache():
+        return LRUCache("retrieval", Config.RETRIEVAL_CACHE_SIZE)
+    
+    def _get_retrieval_cache(self, vector_db):
+        cached_db, cache = self._retrieval_cache
+        if cached_db is not vector_db:
+            cache = self._create_retrieval_cache()
+            # Chỉ giữ cache của bản đang phục vụ; truy vấn còn chạy trên bản cũ dùng cache tạm
+            if vector_db is self.vector_db:
+                self._retrieval_cache = (vector_db, cache)
+        return cache
+    
+    def _get_keyword_vectors(self, vector_db):
+        cached_db, vectors = self._keyword_vectors
+        if cached_db is not vector_db:
+            vectors = self._encode_keywords(vector_db)
+            if vector_db is self.vector_db:
+                self._keyword_vectors = (vector_db, vectors)
+        return vectors
+        
+    def retrieve_documents(self, query, emotional_level=1, top_k=3, deadline=None):
 
-        if self.vector_db is None:
+        # Không tìm kiếm cho request đã hết hạn
+        if deadline is not None:
+            deadline.check("truy xuất tài liệu")
+
+        # Giữ phiên bản đang dùng để không bị ảnh hưởng nếu index được thay giữa chừng
+        with self._use_vector_db() as vector_db:
+            return self._retrieve_documents(vector_db, query, emotional_level, top_k, deadline)
+    
+    def _retrieve_documents(self, vector_db, query, emotional_level, top_k, deadline):
+        if vector_db is None:
             print("⚠️ Vector database không có sẵn, trả về danh sách tài liệu trống")
             return []
         
     # Tiếp tục xử lý nếu có vector_db...
 
-        expanded_query = self._expand_query(query, emotional_level)
-        
         # Tìm kiếm tài liệu tương tự
         try:
-            if self.vector_db:
-                documents = self.vector_db.similarity_search(expanded_query, k=top_k)
+            if vector_db:
+                # Cùng truy vấn, mức độ cảm xúc và top_k trên cùng index cho cùng kết quả
+                cache = self._get_retrieval_cache(vector_db)
+                cache_key = self._cache_key(query, emotional_level, top_k)
+                documents = cache.get(cache_key)
+                if documents is None:
+                    documents, complete = self._search_documents(vector_db, query, emotional_level, top_k, deadline)
+                    # Kết quả thiếu backend (hybrid bị timeout) không được lưu
+                    if complete:
+                        cache.put(cache_key, tuple(documents))
+                documents = list(documents)
                 print(f"🔍 Đã tìm thấy {len(documents)} tài liệu liên quan")
                 for i, doc in enumerate(documents):
                     category = doc.metadata.get('category', 'không rõ')
@@ -46,9 +266,235 @@ class RAGManager:
             print(f"⚠️ Lỗi khi tìm kiếm tài liệu: {e}")
             return []
     
+    def retrieve_documents_batch(self, queries, levels=None, top_k=3, deadline=None):
+        """
+        Truy xuất tài liệu cho nhiều truy vấn cùng lúc (đánh giá offline, làm nóng cache)
+        
+        Các truy vấn cùng mức độ cảm xúc dùng chung danh mục và vector từ khóa, nên
+        được tìm trong một lô: một lần gọi vectorizer và một phép nhân ma trận (hoặc một
+        lần index.search với FAISS). Kết quả giống như gọi retrieve_documents cho từng
+        truy vấn và dùng chung cache kết quả với retrieve_documents.
+        
+        Args:
+            queries: Danh sách truy vấn
+            levels: Mức độ cảm xúc (1-5) của từng truy vấn, hoặc một mức cho tất cả (mặc định 1)
+            top_k: Số tài liệu cần lấy cho mỗi truy vấn
+            deadline: Deadline (tùy chọn)
+            
+        Returns:
+            list: Danh sách tài liệu của từng truy vấn, cùng thứ tự với queries
+            
+        Raises:
+            ValueError: Nếu số mức độ cảm xúc khác số truy vấn
+        """
+        queries = list(queries)
+        if levels is None or isinstance(levels, int):
+            levels = [levels or 1] * len(queries)
+        levels = list(levels)
+        if len(levels) != len(queries):
+            raise ValueError(f"Có {len(queries)} truy vấn nhưng có {len(levels)} mức độ cảm xúc")
+        
+        if deadline is not None:
+            deadline.check("truy xuất tài liệu")
+        
+        with self._use_vector_db() as vector_db:
+            return self._retrieve_documents_batch(vector_db, queries, levels, top_k, deadline)
+    
+    def _retrieve_documents_batch(self, vector_db, queries, levels, top_k, deadline):
+        if vector_db is None:
+            print("⚠️ Vector database không có sẵn, trả về danh sách tài liệu trống")
+            return [[] for _ in queries]
+        
+        cache = self._get_retrieval_cache(vector_db)
+        cache_keys = [self._cache_key(query, level, top_k) for query, level in zip(queries, levels)]
+        results = [cache.get(key) for key in cache_keys]
+        
+        # Gom các truy vấn chưa có trong cache theo mức độ cảm xúc, mỗi nhóm là một lô
+        groups = {}
+        for i, documents in enumerate(results):
+            if documents is None:
+                groups.setdefault(levels[i], []).append(i)
+        
+        for level, positions in groups.items():
+            try:
+                batch, complete = self._search_documents_batch(
+                    vector_db, [queries[i] for i in positions], level, top_k, deadline
+                )
+            except Exception as e:
+                print(f"⚠️ Lỗi khi tìm kiếm theo lô {len(positions)} truy vấn mức {level}: {e}")
+                batch, complete = [[] for _ in positions], False
+            for i, documents in zip(positions, batch):
+                results[i] = tuple(documents)
+                if complete:
+                    cache.put(cache_keys[i], results[i])
+        
+        print(f"🔍 Đã truy xuất tài liệu cho {len(queries)} truy vấn ({sum(map(len, groups.values()))} truy vấn mới)")
+        return [list(documents) for documents in results]
+    
+    def _cache_key(self, query, emotional_level, top_k):
+        # Cùng truy vấn, mức độ cảm xúc và top_k trên cùng index cho cùng kết quả
+        return (
+            normalize_query(query),
+            emotional_level,
+            top_k,
+            self.expansion_weights.get(emotional_level),
+            Config.CATEGORY_ROUTING
+        )
+    
+    def _expand_queries(self, vector_db, queries, emotional_level):
+        """
+        Mở rộng các truy vấn theo mức độ cảm xúc
+        
+        Args:
+            vector_db: Vector database
+            queries: Danh sách truy vấn gốc
+            emotional_level: Mức độ cảm xúc (1-5)
+            
+        Returns:
+            tuple: (danh sách truy vấn, (vector từ khóa, trọng số) hoặc None); vector database
+                   không hỗ trợ encode_query nhận truy vấn đã nối chuỗi từ khóa
+        """
+        keyword_vectors = self._get_keyword_vectors(vector_db)
+        if keyword_vectors is None:
+            return [self._expand_query(query, emotional_level) for query in queries], None
+        
+        # Cộng vector từ khóa tính sẵn vào vector truy vấn thay vì nối chuỗi từ khóa
+        level = emotional_level if emotional_level in keyword_vectors else 1
+        weight = self.expansion_weights.get(level, 1.0)
+        return list(queries), ((keyword_vectors[level], weight) if weight > 0 else None)
+    
+    def _search_documents_batch(self, vector_db, queries, emotional_level, top_k, deadline):
+        """
+        Tìm tài liệu cho một lô truy vấn cùng mức độ cảm xúc (không dùng cache)
+        
+        Returns:
+            tuple: (danh sách tài liệu của từng truy vấn, True nếu kết quả đầy đủ)
+        """
+        search_kwargs = {}
+        hybrid = isinstance(vector_db, HybridRetriever)
+        if hybrid:
+            search_kwargs["deadline"] = deadline
+        
+        texts, expansion = self._expand_queries(vector_db, queries, emotional_level)
+        if expansion is not None:
+            search_kwargs["expansion"] = expansion
+        
+        def search(positions, **extra_kwargs):
+            batch = [texts[i] for i in positions]
+            if hybrid:
+                return vector_db.similarity_search_batch_with_status(batch, k=top_k, **search_kwargs, **extra_kwargs)
+            if hasattr(vector_db, "similarity_search_batch"):
+                return vector_db.similarity_search_batch(batch, k=top_k, **search_kwargs, **extra_kwargs), True
+            return _faiss_search_batch(vector_db, batch, top_k), True
+        
+        positions = list(range(len(texts)))
+        results, complete = [[] for _ in positions], True
+        categories = self._route_categories(vector_db, emotional_level)
+        if categories:
+            results, complete = search(positions, categories=categories)
+        
+        # Không lọc theo danh mục, hoặc phân vùng không đủ tài liệu liên quan cho các truy vấn này
+        fallback = [i for i in positions if len(results[i]) < top_k]
+        if fallback:
+            documents, fallback_complete = search(fallback)
+            for i, docs in zip(fallback, documents):
+                results[i] = docs
+            complete = complete and fallback_complete
+        return results, complete
+    
+    def _search_documents(self, vector_db, query, emotional_level, top_k, deadline):
+        """
+        Tìm tài liệu trong vector database (không dùng cache)
+        
+        Args:
+            vector_db: Vector database
+            query: Truy vấn gốc
+            emotional_level: Mức độ cảm xúc (1-5)
+            top_k: Số tài liệu cần lấy
+            deadline: Deadline của request (tùy chọn)
+            
+        Returns:
+            tuple: (danh sách tài liệu, True nếu kết quả đầy đủ)
+        """
+        search_kwargs = {}
+        hybrid = isinstance(vector_db, HybridRetriever)
+        if hybrid:
+            # Backend nào chưa xong khi request sắp hết hạn thì bị bỏ qua
+            search_kwargs["deadline"] = deadline
+        
+        (expanded_query,), expansion = self._expand_queries(vector_db, [query], emotional_level)
+        if expansion is not None:
+            search_kwargs["expansion"] = expansion
+        
+        def search(**extra_kwargs):
+            if hybrid:
+                return vector_db.similarity_search_with_status(expanded_query, k=top_k, **search_kwargs, **extra_kwargs)
+            return vector_db.similarity_search(expanded_query, k=top_k, **search_kwargs, **extra_kwargs), True
+        
+        categories = self._route_categories(vector_db, emotional_level)
+        documents, complete = [], True
+        if categories:
+            documents, complete = search(categories=categories)
+        if len(documents) < top_k:
+            # Không lọc theo danh mục, hoặc phân vùng không đủ tài liệu liên quan
+            documents, complete = search()
+        return documents, complete
+    
+    def get_crisis_documents(self, top_k=3, deadline=None):
+        """
+        Lấy tài liệu cho tin nhắn khủng hoảng
+        
+        Tài liệu được tìm một lần với truy vấn cố định rồi dùng lại cho đến khi
+        vector database được thay, nên tin nhắn khủng hoảng không phải chờ tìm kiếm.
+        
+        Args:
+            top_k: Số tài liệu cần lấy
+            deadline: Deadline của request (tùy chọn)
+            
+        Returns:
+            list: Danh sách tài liệu
+        """
+        with self._use_vector_db() as vector_db:
+            cached_db, documents = self._crisis_documents
+            if vector_db is not None and cached_db is vector_db and len(documents) >= top_k:
+                return documents[:top_k]
+            
+            if deadline is not None:
+                deadline.check("truy xuất tài liệu")
+            documents = self._retrieve_documents(vector_db, CRISIS_QUERY, 5, top_k, deadline)
+            if vector_db is not None and documents and vector_db is self.vector_db:
+                self._crisis_documents = (vector_db, documents)
+            return documents
+    
+    def _route_categories(self, vector_db, emotional_level):
+        """
+        Chọn các danh mục cần tìm cho mức độ cảm xúc
+        
+        Args:
+            vector_db: Vector database đang dùng
+            emotional_level: Mức độ cảm xúc (1-5)
+            
+        Returns:
+            list: Các danh mục có tài liệu trong index, None nếu tìm trên toàn bộ tài liệu
+        """
+        if not Config.CATEGORY_ROUTING or not hasattr(vector_db, "category_counts"):
+            return None
+        
+        counts = vector_db.category_counts()
+        categories = CATEGORY_ROUTES.get(emotional_level)
+        if not counts or not categories:
+            return None
+        
+        categories = [category for category in categories if counts.get(category)]
+        if sum(counts[category] for category in categories) < Config.PARTITION_MIN_CHUNKS:
+            print(f"🔍 Các danh mục cho mức {emotional_level} có quá ít tài liệu, tìm trên toàn bộ tài liệu")
+            return None
+        return categories
+    
     def _expand_query(self, query, emotional_level):
         """
-        Mở rộng truy vấn dựa trên mức độ cảm xúc
+        Mở rộng truy vấn dựa trên mức độ cảm xúc bằng cách nối chuỗi từ khóa
+        (cho vector database không hỗ trợ encode_query)
         
         Args:
             query: Truy vấn gốc
@@ -57,17 +503,8 @@ class RAGManager:
         Returns:
             str: Truy vấn đã mở rộng
         """
-        # Các từ khóa liên quan đến mỗi mức độ cảm xúc
-        emotional_keywords = {
-            1: ["bình thường", "ổn định", "tích cực"],
-            2: ["lo lắng nhẹ", "căng thẳng nhẹ", "hơi buồn"],
-            3: ["lo âu", "căng thẳng", "buồn", "trầm"],
-            4: ["trầm cảm", "lo âu nặng", "căng thẳng cao", "sợ hãi"],
-            5: ["khủng hoảng", "tuyệt vọng", "cực kỳ lo âu", "cực kỳ trầm cảm"]
-        }
-        
         # Lấy từ khóa phù hợp với mức độ cảm xúc
-        keywords = emotional_keywords.get(emotional_level, emotional_keywords[1])
+        keywords = EMOTIONAL_KEYWORDS.get(emotional_level, EMOTIONAL_KEYWORDS[1])
         
         # Mở rộng truy vấn với các từ khóa
         expanded_query = f"{query} {' '.join(keywords)}"
@@ -0,0 +1,76 @@
+# app/retrieval_cache.py
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from app.metrics import CACHE_HITS, CACHE_MISSES
+
+def normalize_query(text):
+    """
+    Chuẩn hóa câu truy vấn để các tin nhắn chỉ khác chữ hoa/thường, khoảng trắng
+    hoặc cách mã hóa dấu (NFC/NFD) dùng chung một khóa cache
+
+    Args:
+        text: Câu truy vấn
+
+    Returns:
+        str: Câu truy vấn đã chuẩn hóa
+    """
+    return " ".join(unicodedata.normalize("NFC", text).lower().split())
+
+class LRUCache:
+    """
+    Cache LRU an toàn với nhiều thread, ghi số lần hit/miss vào metric misoul_cache_*{cache=name}.
+
+    Mỗi cache chỉ gắn với một phiên bản index: khi index được xây dựng lại hoặc thay
+    thế, bên sở hữu tạo cache mới nên kết quả cũ không bao giờ được dùng lại.
+    """
+
+    def __init__(self, name, max_entries=1024):
+        """
+        Khởi tạo LRUCache
+
+        Args:
+            name: Tên cache (nhãn cache của metric)
+            max_entries: Số mục tối đa (0 = tắt cache)
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns:
+            Giá trị đã lưu, None nếu không có
+        """
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        if value is None:
+            CACHE_MISSES.inc(cache=self.name)
+        else:
+            CACHE_HITS.inc(cache=self.name)
+        return value
+
+    def put(self, key, value):
+        """
+        Lưu giá trị, xóa mục ít dùng nhất khi cache đầy
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
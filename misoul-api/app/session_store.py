@@ -0,0 +1,408 @@
+# app/session_store.py
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from config import Config
+from app.deadline import DeadlineExceeded
+from app.metrics import SESSION_EVICTIONS, SESSION_COUNT, SESSION_BYTES
+
+class Turn:
+    """
+    Một lượt trò chuyện ở dạng gọn (không có __dict__)
+
+    Hỗ trợ unpack như tuple: user_msg, assistant_msg = turn
+    """
+    __slots__ = ("user", "assistant")
+
+    def __init__(self, user, assistant):
+        self.user = user
+        self.assistant = assistant
+
+    def __iter__(self):
+        yield self.user
+        yield self.assistant
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return f"Turn({self.user!r}, {self.assistant!r})"
+
+class SessionState:
+    """
+    Trạng thái hội thoại của một người dùng
+
+    Attributes:
+        history: Danh sách các Turn gần nhất (user_message, assistant_response)
+        pending_response: Nội dung bài tập đang chờ người dùng xác nhận
+        waiting_confirmation: True nếu đang chờ người dùng xác nhận nhận bài tập
+        warning_shown: Giá trị turn_count tại lần cuối hiển thị cảnh báo khẩn cấp (None nếu chưa)
+        turn_count: Tổng số lượt đã trò chuyện (không bị giới hạn như history)
+    """
+    __slots__ = ("history", "pending_response", "waiting_confirmation", "warning_shown", "turn_count")
+
+    def __init__(self, history=None, pending_response="", waiting_confirmation=False, warning_shown=None, turn_count=None):
+        self.history = history if history is not None else []
+        self.pending_response = pending_response
+        self.waiting_confirmation = waiting_confirmation
+        self.warning_shown = warning_shown
+        self.turn_count = turn_count if turn_count is not None else len(self.history)
+
+    def add_turn(self, user_message, assistant_message, max_turns, max_assistant_chars=0):
+        """
+        Thêm một lượt trò chuyện, chỉ giữ max_turns lượt gần nhất
+
+        Args:
+            user_message: Tin nhắn của người dùng
+            assistant_message: Phản hồi của MISOUL
+            max_turns: Số lượt tối đa được giữ
+            max_assistant_chars: Cắt phản hồi còn số ký tự này (0 = giữ nguyên)
+        """
+        if max_assistant_chars and len(assistant_message) > max_assistant_chars:
+            assistant_message = assistant_message[:max_assistant_chars]
+        self.history.append(Turn(user_message, assistant_message))
+        if len(self.history) > max_turns:
+            del self.history[:-max_turns]
+        self.turn_count += 1
+
+    def copy(self):
+        """Tạo bản sao để thay đổi trong một lượt mà không ảnh hưởng bản đã lưu"""
+        return SessionState(
+            list(self.history), self.pending_response, self.waiting_confirmation,
+            self.warning_shown, self.turn_count
+        )
+
+    def estimate_size(self):
+        """
+        Returns:
+            int: Ước lượng số byte bộ nhớ mà trạng thái chiếm
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.history) + sys.getsizeof(self.pending_response)
+        for turn in self.history:
+            size += sys.getsizeof(turn) + sys.getsizeof(turn.user) + sys.getsizeof(turn.assistant)
+        return size
+
+    def to_dict(self):
+        return {
+            "history": [[turn.user, turn.assistant] for turn in self.history],
+            "pending_response": self.pending_response,
+            "waiting_confirmation": self.waiting_confirmation,
+            "warning_shown": self.warning_shown,
+            "turn_count": self.turn_count
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            history=[Turn(user_msg, assistant_msg) for user_msg, assistant_msg in data.get("history", [])],
+            pending_response=data.get("pending_response", ""),
+            waiting_confirmation=data.get("waiting_confirmation", False),
+            warning_shown=data.get("warning_shown"),
+            turn_count=data.get("turn_count")
+        )
+
+class SessionStore:
+    """
+    Giao diện lưu trữ trạng thái hội thoại.
+
+    Mỗi lượt trò chuyện đọc trạng thái một lần bằng load() và ghi lại
+    một lần bằng save(), nên backend chỉ cần hỗ trợ đọc/ghi theo user_id.
+    Backend dùng chung giữa các process cài đặt thêm lock() để các lượt của
+    cùng một người dùng ở các worker khác nhau không ghi đè nhau.
+    """
+
+    def load(self, user_id):
+        """
+        Returns:
+            SessionState: Bản sao trạng thái của người dùng (trạng thái mới nếu chưa có)
+        """
+        raise NotImplementedError
+
+    def save(self, user_id, state):
+        """Ghi trạng thái của người dùng"""
+        raise NotImplementedError
+
+    def exists(self, user_id):
+        """
+        Returns:
+            bool: True nếu đã có trạng thái của người dùng
+        """
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        """
+        Returns:
+            bool: True nếu đã xóa, False nếu không có trạng thái
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self, user_id, deadline=None):
+        """
+        Giữ lượt của người dùng giữa các process trong khối lệnh with
+
+        Mặc định không làm gì: store chỉ dùng trong một process đã được UserLocks
+        tuần tự hóa.
+
+        Args:
+            user_id: ID của người dùng
+            deadline: Deadline của request (tùy chọn), giới hạn thời gian chờ
+
+        Raises:
+            DeadlineExceeded: Nếu hết hạn khi còn chờ process khác trả lượt
+        """
+        yield
+
+class InMemorySessionStore(SessionStore):
+    """
+    Lưu trạng thái hội thoại trong bộ nhớ của process (không chia sẻ giữa các worker).
+
+    Bộ nhớ bị giới hạn theo LRU + TTL: phiên không hoạt động quá ttl_seconds
+    bị xóa, và khi vượt max_sessions hoặc max_bytes thì phiên ít dùng nhất bị xóa trước.
+    """
+
+    def __init__(self, max_sessions=10000, ttl_seconds=6 * 3600, max_bytes=64 * 1024 * 1024):
+        """
+        Khởi tạo InMemorySessionStore
+
+        Args:
+            max_sessions: Số phiên tối đa (0 = không giới hạn)
+            ttl_seconds: Thời gian không hoạt động trước khi phiên bị xóa (0 = không hết hạn)
+            max_bytes: Ngân sách bộ nhớ ước lượng cho tất cả phiên (0 = không giới hạn)
+        """
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        # user_id -> (state, last_access, size), theo thứ tự truy cập cũ -> mới
+        self._sessions = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        SESSION_COUNT.set_function(lambda: len(self._sessions), store="memory")
+        SESSION_BYTES.set_function(lambda: self._total_bytes, store="memory")
+
+    def _is_expired(self, last_access, now):
+        return bool(self.ttl_seconds) and now - last_access > self.ttl_seconds
+
+    def _remove(self, user_id, reason=None):
+        _, _, size = self._sessions.pop(user_id)
+        self._total_bytes -= size
+        if reason:
+            SESSION_EVICTIONS.inc(reason=reason)
+
+    def _evict(self, now):
+        # Phiên ít dùng nhất nằm ở đầu, nên các phiên hết hạn cũng nằm ở đầu
+        while self._sessions:
+            user_id, (_, last_access, _) = next(iter(self._sessions.items()))
+            if self._is_expired(last_access, now):
+                self._remove(user_id, "ttl")
+            elif self.max_sessions and len(self._sessions) > self.max_sessions:
+                self._remove(user_id, "lru")
+            elif self.max_bytes and self._total_bytes > self.max_bytes and len(self._sessions) > 1:
+                self._remove(user_id, "memory")
+            else:
+                break
+
+    def load(self, user_id):
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return SessionState()
+            state, last_access, size = entry
+            if self._is_expired(last_access, now):
+                self._remove(user_id, "ttl")
+                return SessionState()
+            self._sessions[user_id] = (state, now, size)
+            self._sessions.move_to_end(user_id)
+            return state.copy()
+
+    def save(self, user_id, state):
+        now = time.time()
+        state = state.copy()
+        size = state.estimate_size()
+        with self._lock:
+            if user_id in self._sessions:
+                self._remove(user_id)
+            self._sessions[user_id] = (state, now, size)
+            self._total_bytes += size
+            self._evict(now)
+
+    def exists(self, user_id):
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            return entry is not None and not self._is_expired(entry[1], time.time())
+
+    def delete(self, user_id):
+        with self._lock:
+            if user_id not in self._sessions:
+                return False
+            self._remove(user_id)
+            return True
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Lưu trạng thái hội thoại trong SQLite ở chế độ WAL.
+
+    Tất cả worker gunicorn trên cùng máy dùng chung một file, nên lượt
+    xác nhận "có" vẫn tìm thấy bài tập đang chờ dù rơi vào worker khác.
+    Mỗi lượt chỉ cần một câu SELECT và một câu UPSERT. Phiên không hoạt động
+    quá ttl_seconds được xóa định kỳ.
+
+    lock() tuần tự hóa các lượt của một người dùng giữa các worker bằng một hàng
+    trong bảng session_locks (lease): worker khác chờ đến khi hàng bị xóa, hoặc
+    hết hạn sau lock_ttl_seconds nếu worker đang giữ bị dừng giữa chừng.
+    """
+
+    # Số lần ghi giữa hai lần dọn phiên hết hạn
+    CLEANUP_INTERVAL = 500
+    # Thời gian chờ giữa hai lần thử lấy lượt đang bị worker khác giữ (giây)
+    LOCK_POLL_SECONDS = 0.05
+
+    def __init__(self, db_path, ttl_seconds=0, lock_ttl_seconds=120):
+        """
+        Khởi tạo SQLiteSessionStore
+
+        Args:
+            db_path: Đường dẫn file SQLite
+            ttl_seconds: Thời gian không hoạt động trước khi phiên bị xóa (0 = không hết hạn)
+            lock_ttl_seconds: Thời gian tối đa một lượt giữ lock() trước khi worker khác được lấy lại
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.lock_ttl_seconds = lock_ttl_seconds
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Mỗi thread dùng một connection riêng
+        self._local = threading.local()
+        self._writes = 0
+
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id TEXT PRIMARY KEY, "
+            "state TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS session_locks ("
+            "user_id TEXT PRIMARY KEY, "
+            "owner TEXT NOT NULL, "
+            "expires_at REAL NOT NULL)"
+        )
+        print(f"✅ Đã khởi tạo SQLite session store tại {db_path}")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _min_updated_at(self):
+        return time.time() - self.ttl_seconds if self.ttl_seconds else 0
+
+    def load(self, user_id):
+        row = self._connection().execute(
+            "SELECT state FROM sessions WHERE user_id = ? AND updated_at >= ?",
+            (user_id, self._min_updated_at())
+        ).fetchone()
+        if row is None:
+            return SessionState()
+        return SessionState.from_dict(json.loads(row[0]))
+
+    def save(self, user_id, state):
+        connection = self._connection()
+        connection.execute(
+            "INSERT INTO sessions (user_id, state, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+            (user_id, json.dumps(state.to_dict(), ensure_ascii=False), time.time())
+        )
+
+        self._writes += 1
+        if self.ttl_seconds and self._writes % self.CLEANUP_INTERVAL == 0:
+            cursor = connection.execute("DELETE FROM sessions WHERE updated_at < ?", (self._min_updated_at(),))
+            if cursor.rowcount > 0:
+                SESSION_EVICTIONS.inc(cursor.rowcount, reason="ttl")
+
+    def exists(self, user_id):
+        row = self._connection().execute(
+            "SELECT 1 FROM sessions WHERE user_id = ? AND updated_at >= ?",
+            (user_id, self._min_updated_at())
+        ).fetchone()
+        return row is not None
+
+    def delete(self, user_id):
+        cursor = self._connection().execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+    def _try_lock(self, user_id, owner):
+        # Chỉ lấy được khi chưa có hàng hoặc lease của worker trước đã hết hạn
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO session_locks (user_id, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE session_locks.expires_at < ?",
+            (user_id, owner, now + self.lock_ttl_seconds, now)
+        )
+        return cursor.rowcount > 0
+
+    @contextmanager
+    def lock(self, user_id, deadline=None):
+        owner = uuid.uuid4().hex
+        while not self._try_lock(user_id, owner):
+            if deadline is not None and deadline.remaining() <= 0:
+                raise DeadlineExceeded(f"Request đã hết hạn khi chờ lượt của người dùng {user_id} ở worker khác")
+            wait = self.LOCK_POLL_SECONDS
+            if deadline is not None:
+                wait = min(wait, deadline.remaining())
+            time.sleep(max(wait, 0))
+
+        try:
+            yield
+        finally:
+            self._connection().execute(
+                "DELETE FROM session_locks WHERE user_id = ? AND owner = ?", (user_id, owner)
+            )
+
+def create_session_store(backend=None):
+    """
+    Tạo session store theo cấu hình
+
+    Args:
+        backend: "memory", "sqlite" hoặc "auto" (mặc định lấy từ Config.SESSION_STORE)
+
+    Returns:
+        SessionStore: Session store đã khởi tạo
+    """
+    backend = (backend or Config.SESSION_STORE).lower()
+    # gunicorn.conf.py đã đổi "auto" thành "sqlite" khi chạy nhiều worker,
+    # nên "auto" còn lại ở đây nghĩa là chỉ có một process
+    if backend == "auto":
+        backend = "memory"
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            Config.SESSION_DB_PATH,
+            ttl_seconds=Config.SESSION_TTL_SECONDS,
+            lock_ttl_seconds=Config.SESSION_LOCK_TTL_SECONDS
+        )
+    if backend == "memory":
+        return InMemorySessionStore(
+            max_sessions=Config.SESSION_MAX_USERS,
+            ttl_seconds=Config.SESSION_TTL_SECONDS,
+            max_bytes=Config.SESSION_MEMORY_BUDGET_MB * 1024 * 1024
+        )
+    raise ValueError(f"Session store không hợp lệ: {backend} (chỉ hỗ trợ 'memory', 'sqlite' hoặc 'auto')")
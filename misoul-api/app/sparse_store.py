@@ -0,0 +1,298 @@
+# app/sparse_store.py
+import os
+from typing import List
+import numpy as np
+import scipy.sparse
+from langchain_core.documents import Document
+
+from config import Config
+from app.chunk_store import save_arrays, load_array, load_documents, as_chunk_store, CHUNKS_FILE
+from app.partitions import CategoryPartitions
+from app.retrieval_cache import LRUCache, normalize_query
+
+# Số truy vấn được chấm điểm trong một phép nhân ma trận, giới hạn bộ nhớ của ma trận điểm
+BATCH_SIZE = 256
+
+def top_k_indices(scores, k):
+    """
+    Chọn vị trí của k điểm cao nhất mà không sắp xếp toàn bộ mảng
+
+    Args:
+        scores: Mảng điểm của các đoạn văn bản
+        k: Số kết quả
+
+    Returns:
+        numpy.ndarray: Vị trí các điểm cao nhất, điểm cao nhất trước
+    """
+    k = min(k, len(scores))
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+class SparseVectorStore(CategoryPartitions):
+    """
+    Vector store lưu embeddings TF-IDF dưới dạng ma trận thưa CSR.
+
+    Mỗi đoạn văn bản chỉ có vài trăm từ khác 0 trên 5000 chiều, nên ma trận CSR
+    nhỏ hơn nhiều so với index FAISS dạng dense và được tạo trực tiếp từ kết quả
+    của vectorizer, không phải chuyển sang list Python. Các vector đã được chuẩn hóa
+    L2 nên tích vô hướng là độ tương đồng cosine; thứ tự kết quả giống với khoảng
+    cách L2 của FAISS.
+
+    Có cùng các hàm tìm kiếm mà RAGManager dùng với FAISS (similarity_search), thêm
+    tham số categories để chỉ tìm trong phân vùng của các danh mục đó và expansion để
+    cộng vector từ khóa tính sẵn vào vector truy vấn (encode_query/search_vector).
+    """
+
+    # Tên các file lưu trong thư mục index: ma trận CSR lưu thành 3 mảng .npy để memory-map được
+    MATRIX_ARRAYS = ("matrix_data", "matrix_indices", "matrix_indptr")
+    LEGACY_MATRIX_FILE = "matrix.npz"  # Định dạng cũ (nén, không memory-map được)
+    DOCUMENTS_FILE = CHUNKS_FILE
+
+    def __init__(self, matrix, documents, embedding):
+        """
+        Khởi tạo SparseVectorStore
+
+        Args:
+            matrix: Ma trận CSR (số đoạn x số chiều), mỗi hàng là embedding của một đoạn
+            documents: ChunkStore hoặc danh sách Document tương ứng với các hàng
+            embedding: MISOULEmbeddings đã fit
+        """
+        if matrix.shape[0] != len(documents):
+            raise ValueError(f"Ma trận có {matrix.shape[0]} hàng nhưng có {len(documents)} tài liệu")
+
+        self.matrix = scipy.sparse.csr_matrix(matrix, dtype=np.float32)
+        self.documents = as_chunk_store(documents)
+        self.embedding = embedding
+        self._query_vectors = LRUCache("sparse_query_vector", Config.QUERY_VECTOR_CACHE_SIZE)
+        self._init_partitions()
+
+    @classmethod
+    def from_documents(cls, documents, embedding):
+        """
+        Fit vectorizer và tạo vector store từ danh sách tài liệu
+
+        Args:
+            documents: Danh sách Document
+            embedding: MISOULEmbeddings (được fit nếu chưa fit)
+
+        Returns:
+            SparseVectorStore: Vector store mới
+        """
+        documents = as_chunk_store(documents)
+        matrix = embedding.embed_documents_sparse(documents.texts())
+        return cls(matrix, documents, embedding)
+
+    @property
+    def dimension(self):
+        """Số chiều của vector embedding"""
+        return self.matrix.shape[1]
+
+    @property
+    def nbytes(self):
+        """Dung lượng bộ nhớ của ma trận (byte)"""
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def _row_blocks(self, partition):
+        """
+        Returns:
+            list: Ma trận CSR của từng đoạn hàng liên tiếp của phân vùng, dùng chung mảng
+                  data/indices với self.matrix (chỉ indptr của khối được tạo mới)
+        """
+        data, indices, indptr = self.matrix.data, self.matrix.indices, self.matrix.indptr
+        blocks = []
+        for start, end in partition.runs:
+            first, last = indptr[start], indptr[end]
+            blocks.append(scipy.sparse.csr_matrix(
+                (data[first:last], indices[first:last], (indptr[start:end + 1] - first).astype(indices.dtype)),
+                shape=(end - start, self.matrix.shape[1]),
+                copy=False
+            ))
+        return blocks
+
+    def _scores(self, query_matrix, partition=None):
+        """
+        Chấm điểm các truy vấn với các hàng của phân vùng (hoặc mọi hàng)
+
+        Args:
+            query_matrix: Ma trận CSR (số truy vấn x số chiều)
+            partition: Partition (tùy chọn)
+
+        Returns:
+            numpy.ndarray: Điểm (số truy vấn x số hàng của phân vùng)
+        """
+        # Nhân ma trận index với truy vấn chuyển vị để scipy chỉ phải chuyển đổi ma trận truy vấn nhỏ
+        if partition is None or not partition.contiguous:
+            scores = (self.matrix @ query_matrix.T).toarray().T
+            return scores if partition is None else scores[:, partition.rows]
+        if not partition.runs:
+            return np.zeros((query_matrix.shape[0], 0), dtype=np.float32)
+        return np.hstack([(block @ query_matrix.T).toarray().T for block in self._row_blocks(partition)])
+
+    def encode_query(self, text):
+        """
+        Tạo vector truy vấn
+
+        Args:
+            text: Câu truy vấn
+
+        Returns:
+            scipy.sparse.csr_matrix: Vector TF-IDF 1 hàng, đã chuẩn hóa L2 (dùng chung, không được sửa)
+        """
+        text = normalize_query(text)
+        vector = self._query_vectors.get(text)
+        if vector is None:
+            vector = self.embedding.embed_query_sparse(text)
+            self._query_vectors.put(text, vector)
+        return vector
+
+    def search_vector(self, query_vector, k: int = 4, categories=None):
+        """
+        Tìm các đoạn văn bản có tích vô hướng lớn nhất với vector truy vấn
+
+        Args:
+            query_vector: Vector do encode_query tạo (có thể đã cộng thêm vector khác)
+            k: Số kết quả
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+
+        Returns:
+            list: Danh sách (Document, điểm), điểm cao nhất trước
+        """
+        partition = self.partition(categories) if categories else None
+        scores = self._scores(query_vector, partition)[0]
+
+        # Truy vấn không có từ nào trong từ vựng thì không có tài liệu liên quan
+        if not scores.any():
+            return []
+
+        top = top_k_indices(scores, k)
+        return [(self.documents[i], float(score)) for i, score in zip(self._row_ids(top, partition).tolist(), scores[top])]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, categories=None, expansion=None):
+        """
+        Tìm các đoạn văn bản tương tự nhất với câu truy vấn
+
+        Args:
+            query: Câu truy vấn
+            k: Số kết quả
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+            expansion: (vector từ khóa do encode_query tạo, trọng số) cộng vào vector truy vấn (tùy chọn)
+
+        Returns:
+            list: Danh sách (Document, điểm cosine), điểm cao nhất trước
+        """
+        query_vector = self.encode_query(query)
+        if expansion is not None:
+            keyword_vector, weight = expansion
+            query_vector = query_vector + weight * keyword_vector
+        return self.search_vector(query_vector, k=k, categories=categories)
+
+    def similarity_search(self, query: str, k: int = 4, categories=None, expansion=None) -> List[Document]:
+        """
+        Tìm các đoạn văn bản tương tự nhất với câu truy vấn
+
+        Args:
+            query: Câu truy vấn
+            k: Số kết quả
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+            expansion: (vector từ khóa, trọng số) cộng vào vector truy vấn (tùy chọn)
+
+        Returns:
+            List[Document]: Danh sách tài liệu, liên quan nhất trước
+        """
+        return [
+            doc for doc, _ in
+            self.similarity_search_with_score(query, k=k, categories=categories, expansion=expansion)
+        ]
+
+    def similarity_search_batch_with_score(self, queries, k: int = 4, categories=None, expansion=None):
+        """
+        Tìm kiếm cho nhiều câu truy vấn: tạo vector của tất cả truy vấn trong một lần gọi
+        vectorizer và chấm điểm bằng một phép nhân ma trận cho mỗi BATCH_SIZE truy vấn
+
+        Args:
+            queries: Danh sách câu truy vấn
+            k: Số kết quả của mỗi truy vấn
+            categories: Chỉ tìm trong các danh mục này (tùy chọn)
+            expansion: (vector từ khóa, trọng số) cộng vào vector của mọi truy vấn (tùy chọn)
+
+        Returns:
+            list: Với mỗi truy vấn theo thứ tự, danh sách (Document, điểm cosine) như similarity_search_with_score
+        """
+        if not queries:
+            return []
+
+        partition = self.partition(categories) if categories else None
+        query_matrix = self.embedding.embed_queries_sparse([normalize_query(query) for query in queries])
+        # Vector từ khóa giống nhau cho mọi truy vấn nên điểm của nó chỉ tính một lần
+        keyword_scores = None
+        if expansion is not None:
+            keyword_vector, weight = expansion
+            keyword_scores = weight * self._scores(keyword_vector, partition)[0]
+
+        results = []
+        for start in range(0, query_matrix.shape[0], BATCH_SIZE):
+            batch_scores = self._scores(query_matrix[start:start + BATCH_SIZE], partition)
+            if keyword_scores is not None:
+                batch_scores += keyword_scores
+            for scores in batch_scores:
+                if not scores.any():
+                    results.append([])
+                    continue
+                top = top_k_indices(scores, k)
+                results.append([
+                    (self.documents[i], float(score)) for i, score in zip(self._row_ids(top, partition).tolist(), scores[top])
+                ])
+        return results
+
+    def similarity_search_batch(self, queries, k: int = 4, categories=None, expansion=None) -> List[List[Document]]:
+        """
+        Tìm kiếm cho nhiều câu truy vấn (tham số như similarity_search_batch_with_score)
+
+        Returns:
+            list: Với mỗi truy vấn theo thứ tự, danh sách tài liệu liên quan nhất trước
+        """
+        return [
+            [doc for doc, _ in results] for results in
+            self.similarity_search_batch_with_score(queries, k=k, categories=categories, expansion=expansion)
+        ]
+
+    def save_local(self, directory):
+        """
+        Lưu ma trận và tài liệu vào thư mục
+
+        Args:
+            directory: Thư mục lưu (vectorizer được lưu riêng bằng MISOULEmbeddings.save)
+        """
+        os.makedirs(directory, exist_ok=True)
+        save_arrays(directory, **dict(zip(self.MATRIX_ARRAYS, (self.matrix.data, self.matrix.indices, self.matrix.indptr))))
+        self.documents.save(directory)
+
+    @classmethod
+    def load_local(cls, directory, embedding):
+        """
+        Tải vector store từ thư mục
+
+        Args:
+            directory: Thư mục do save_local ghi
+            embedding: MISOULEmbeddings đã tải từ cùng thư mục
+
+        Returns:
+            SparseVectorStore: Vector store đã tải (ma trận được memory-map nếu Config.INDEX_MMAP)
+        """
+        documents = load_documents(directory)
+        legacy_path = os.path.join(directory, cls.LEGACY_MATRIX_FILE)
+        if os.path.exists(legacy_path):
+            matrix = scipy.sparse.load_npz(legacy_path)
+        else:
+            data, indices, indptr = (load_array(directory, name) for name in cls.MATRIX_ARRAYS)
+            # copy=False giữ các mảng đã memory-map, scipy không chép lại
+            matrix = scipy.sparse.csr_matrix(
+                (data, indices, indptr), shape=(len(indptr) - 1, embedding.dimension), copy=False
+            )
+        return cls(matrix, documents, embedding)
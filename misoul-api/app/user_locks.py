@@ -0,0 +1,61 @@
+# app/user_locks.py
+import threading
+from contextlib import contextmanager
+
+from app.deadline import DeadlineExceeded
+
+class UserLocks:
+    """
+    Khóa theo từng người dùng để các lượt trò chuyện của cùng một người được xử lý tuần tự.
+
+    Mỗi user_id có một khóa riêng nên người dùng khác nhau vẫn chạy song song hoàn toàn.
+    Khóa chỉ tồn tại khi có request đang giữ hoặc đang chờ, nên số khóa không tăng
+    theo tổng số người dùng.
+
+    Khóa chỉ có hiệu lực trong một process; giữa các worker gunicorn dùng chung
+    session store, các lượt được tuần tự hóa bởi SessionStore.lock().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}  # user_id -> [threading.Lock, số request đang giữ hoặc chờ]
+
+    @contextmanager
+    def hold(self, user_id, deadline=None):
+        """
+        Giữ khóa của người dùng trong khối lệnh with
+
+        Args:
+            user_id: ID của người dùng
+            deadline: Deadline của request (tùy chọn), giới hạn thời gian chờ khóa
+
+        Raises:
+            DeadlineExceeded: Nếu hết hạn khi còn chờ lượt trước của người dùng
+        """
+        with self._lock:
+            entry = self._locks.get(user_id)
+            if entry is None:
+                entry = self._locks[user_id] = [threading.Lock(), 0]
+            entry[1] += 1
+
+        try:
+            if deadline is None:
+                acquired = entry[0].acquire()
+            else:
+                acquired = entry[0].acquire(timeout=deadline.remaining())
+            if not acquired:
+                raise DeadlineExceeded(f"Request đã hết hạn khi chờ lượt trước của người dùng {user_id}")
+
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[user_id]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._locks)
@@ -0,0 +1,101 @@
+# benchmarks/ann_bench.py
+"""
+Đo các loại index FAISS (FAISS_INDEX_TYPE) khi số đoạn văn bản tăng: thời gian xây dựng,
+recall@k so với tìm kiếm chính xác (IndexFlatL2) và độ trễ p50/p99 của một truy vấn, với
+các giá trị nprobe (IVF) và efSearch (HNSW) khác nhau.
+
+Các đoạn văn bản được đọc từ index sparse đã xây dựng (VECTOR_DB_PATH/db_sparse). Để mô
+phỏng thư viện tài liệu lớn hơn, mỗi đoạn giả được tạo bằng cách trộn vector TF-IDF của hai
+đoạn thật rồi chuẩn hóa lại. Truy vấn là 20 từ đầu của các đoạn được chọn ngẫu nhiên.
+
+Chạy từ thư mục misoul-api (tham số là các hệ số tăng số đoạn, mặc định 1 2 4):
+    python benchmarks/ann_bench.py 1 5 10
+"""
+import os
+import sys
+import time
+import numpy as np
+import scipy.sparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+from config import Config
+from app.misoul_embeddings import MISOULEmbeddings
+from app.sparse_store import SparseVectorStore, load_documents
+from app.faiss_index import create_faiss_index, configure_search, factory_string
+from app.pdf_processor_langchain import PDFProcessor
+
+# Loại index -> các giá trị tham số tìm kiếm được thử
+SEARCH_PARAMETERS = {
+    "ivf_flat": ("nprobe", [1, 4, 8, 16]),
+    "ivf_pq": ("nprobe", [1, 4, 8, 16]),
+    "hnsw": ("efSearch", [16, 64, 128])
+}
+
+def grow(matrix, factor, rng):
+    """Tạo ma trận (số đoạn * factor) gồm các đoạn thật và các đoạn giả trộn từ hai đoạn thật"""
+    count = matrix.shape[0]
+    extra = count * (factor - 1)
+    if extra == 0:
+        return matrix
+    first, second = rng.integers(0, count, extra), rng.integers(0, count, extra)
+    mixed = 0.7 * matrix[first] + 0.3 * matrix[second]
+    norms = np.sqrt(np.asarray(mixed.multiply(mixed).sum(axis=1))).ravel()
+    mixed = scipy.sparse.diags(1 / np.where(norms > 0, norms, 1)) @ mixed
+    return scipy.sparse.vstack([matrix, mixed]).tocsr()
+
+def latencies_ms(index, queries, k):
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query[None, :], k)
+        times.append((time.perf_counter() - start) * 1e3)
+    return np.percentile(times, 50), np.percentile(times, 99)
+
+def recall(index, queries, truth, k):
+    _, found = index.search(queries, k)
+    return np.mean([len(set(row) & set(expected)) / k for row, expected in zip(found, truth)])
+
+def main(factors=(1, 2, 4), k=5, query_count=200):
+    index_path = PDFProcessor.get_index_path(backend="sparse")
+    if not os.path.exists(os.path.join(index_path, SparseVectorStore.DOCUMENTS_FILE)):
+        print(f"❌ Chưa có index sparse tại {index_path}, hãy xây dựng index trước")
+        return
+
+    chunks = load_documents(index_path)
+    embedding = MISOULEmbeddings()
+    matrix = embedding.embed_documents_sparse([doc.page_content for doc in chunks])
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(chunks), size=min(query_count, len(chunks)), replace=False)
+    queries = embedding.embed_queries_sparse(
+        [" ".join(chunks[i].page_content.split()[:20]) for i in sample]
+    ).toarray().astype(np.float32)
+
+    print(f"{len(chunks)} đoạn thật, {matrix.shape[1]} chiều, {len(queries)} truy vấn, top-{k}")
+    for factor in factors:
+        vectors = grow(matrix, factor, rng).toarray().astype(np.float32)
+        count, dimension = vectors.shape
+
+        exact = faiss.IndexFlatL2(dimension)
+        exact.add(vectors)
+        _, truth = exact.search(queries, k)
+        p50, p99 = latencies_ms(exact, queries, k)
+
+        print(f"\n{count} đoạn ({vectors.nbytes / 2**20:.0f} MB dạng dense)")
+        print(f"  {'Index':<22} {'Tham số':<14} {'Xây dựng (s)':>12} {f'Recall@{k}':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+        print(f"  {'Flat (chính xác)':<22} {'':<14} {'':>12} {1:10.3f} {p50:10.2f} {p99:10.2f}")
+
+        for index_type, (parameter, values) in SEARCH_PARAMETERS.items():
+            start = time.perf_counter()
+            index = create_faiss_index(vectors, index_type)
+            index.add(vectors)
+            build = time.perf_counter() - start
+            for value in values:
+                configure_search(index, nprobe=value, ef_search=value)
+                p50, p99 = latencies_ms(index, queries, k)
+                print(f"  {factory_string(index_type, dimension, count):<22} {f'{parameter}={value}':<14} "
+                      f"{build:12.2f} {recall(index, queries, truth, k):10.3f} {p50:10.2f} {p99:10.2f}")
+
+if __name__ == "__main__":
+    main(factors=[int(value) for value in sys.argv[1:]] or (1, 2, 4))
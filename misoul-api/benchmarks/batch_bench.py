@@ -0,0 +1,66 @@
+# benchmarks/batch_bench.py
+"""
+So sánh tìm kiếm theo lô (similarity_search_batch: một lần gọi vectorizer và một phép
+nhân ma trận) với gọi similarity_search cho từng truy vấn, trên cùng các đoạn văn bản.
+
+Cần index sparse đã xây dựng (VECTOR_DB_PATH/db_sparse) để lấy các đoạn văn bản;
+các backend được tạo lại trong bộ nhớ từ các đoạn này.
+
+Chạy từ thư mục misoul-api:
+    python benchmarks/batch_bench.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.misoul_embeddings import MISOULEmbeddings
+from app.sparse_store import SparseVectorStore, load_documents
+from app.bm25_store import BM25Store
+from app.pdf_processor_langchain import PDFProcessor
+
+QUERIES = [
+    "kỹ thuật thở giảm lo âu",
+    "trầm cảm mất ngủ",
+    "chánh niệm thiền",
+    "toi bi mat ngu va lo au",
+    "tôi thấy áp lực vì công việc",
+    "breathing exercise for panic attacks",
+    "cognitive restructuring negative thoughts",
+    "sleep problems and depression"
+]
+
+def timed_ms(function):
+    start = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - start) * 1e3
+
+def main(k=3, batch_size=1000):
+    index_path = PDFProcessor.get_index_path(backend="sparse")
+    if not os.path.exists(os.path.join(index_path, SparseVectorStore.DOCUMENTS_FILE)):
+        print(f"❌ Chưa có index sparse tại {index_path}, hãy xây dựng index trước")
+        return
+
+    chunks = load_documents(index_path)
+    stores = {
+        "sparse": SparseVectorStore.from_documents(chunks, MISOULEmbeddings()),
+        "bm25": BM25Store.from_documents(chunks)
+    }
+    # Mỗi truy vấn khác nhau để cache vector truy vấn không làm lệch kết quả
+    queries = [f"{QUERIES[i % len(QUERIES)]} {i}" for i in range(batch_size)]
+
+    print(f"{len(chunks)} đoạn văn bản, {batch_size} truy vấn, top-{k}\n")
+    print(f"  {'':<10} {'Từng truy vấn (ms)':>20} {'Theo lô (ms)':>14} {'Tăng tốc':>10} {'Giống nhau':>12}")
+    for name, store in stores.items():
+        single, single_ms = timed_ms(lambda: [store.similarity_search(query, k=k) for query in queries])
+        # Xóa cache vector truy vấn để lô cũng phải tạo lại vector
+        store._query_vectors.clear()
+        batch, batch_ms = timed_ms(lambda: store.similarity_search_batch(queries, k=k))
+        same = sum(
+            [doc.page_content for doc in a] == [doc.page_content for doc in b] for a, b in zip(single, batch)
+        )
+        print(f"  {name:<10} {single_ms:20.1f} {batch_ms:14.1f} {single_ms / batch_ms:9.1f}x {same:>7}/{batch_size}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# benchmarks/chunk_store_bench.py
+"""
+So sánh cách lưu các đoạn văn bản của index khi khởi động worker: thời gian tải, bộ nhớ
+riêng (USS) tăng thêm sau khi tải và thời gian lấy top-k Document cho một truy vấn (các
+đoạn được chọn ngẫu nhiên, nên hầu hết không có sẵn trong cache Document của ChunkStore).
+
+  - documents.json: danh sách Document đọc từ JSON (định dạng cũ của sparse/BM25/LSA)
+  - Docstore pickle: (InMemoryDocstore, index_to_docstore_id) như FAISS.save_local
+  - ChunkStore: các mảng memory-map, chỉ tạo Document cho các kết quả
+
+Mỗi cách được tải trong một process con riêng (fork) để đo USS (Linux). Process cha giữ
+một ChunkStore đã đọc hết các trang, như các worker khác đang phục vụ cùng index, nên các
+trang memory-map dùng chung không bị tính vào USS của process con. Các đoạn văn bản
+được đọc từ index sparse đã xây dựng (VECTOR_DB_PATH/db_sparse).
+
+Chạy từ thư mục misoul-api:
+    python benchmarks/chunk_store_bench.py
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from app.sparse_store import SparseVectorStore
+from app.chunk_store import ChunkStore, load_documents
+from app.pdf_processor_langchain import PDFProcessor
+
+def private_memory_mb():
+    """USS của process hiện tại (MB)"""
+    with open("/proc/self/smaps_rollup") as f:
+        fields = dict(line.split(":", 1) for line in f if ":" in line)
+    kilobytes = sum(int(fields[name].split()[0]) for name in ("Private_Clean", "Private_Dirty"))
+    return kilobytes / 1024
+
+def load_json(directory):
+    with open(os.path.join(directory, "documents.json"), 'r', encoding='utf-8') as f:
+        documents = [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in json.load(f)]
+    return documents.__getitem__
+
+def load_pickle(directory):
+    with open(os.path.join(directory, "index.pkl"), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return lambda i: docstore.search(index_to_docstore_id[i])
+
+def load_chunk_store(directory):
+    return ChunkStore.load(directory, mmap=True).__getitem__
+
+def measure(load, directory, lookups):
+    """
+    Tải trong process con rồi lấy các Document theo lookups
+
+    Returns:
+        tuple: (thời gian tải ms, USS tăng thêm sau khi tải MB, thời gian lấy top-k µs mỗi truy vấn)
+    """
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        before = private_memory_mb()
+        start = time.perf_counter()
+        get = load(directory)
+        load_ms = (time.perf_counter() - start) * 1e3
+        uss = private_memory_mb() - before
+        start = time.perf_counter()
+        for rows in lookups:
+            [get(int(i)) for i in rows]
+        lookup_us = (time.perf_counter() - start) / len(lookups) * 1e6
+        os.write(write, json.dumps([load_ms, uss, lookup_us]).encode())
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as reader:
+        result = json.loads(reader.read())
+    os.waitpid(pid, 0)
+    return result
+
+def main(k=5, query_count=1000):
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("❌ Benchmark cần /proc/self/smaps_rollup (Linux)")
+        return
+    index_path = PDFProcessor.get_index_path(backend="sparse")
+    if not os.path.exists(os.path.join(index_path, SparseVectorStore.DOCUMENTS_FILE)):
+        print(f"❌ Chưa có index sparse tại {index_path}, hãy xây dựng index trước")
+        return
+
+    chunks = load_documents(index_path)
+    documents = [Document(page_content=doc.page_content, metadata={
+        key: value for key, value in doc.metadata.items() if key != "snippet"
+    }) for doc in chunks]
+    rng = np.random.default_rng(0)
+    lookups = rng.integers(0, len(documents), size=(query_count, k))
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "documents.json"), 'w', encoding='utf-8') as f:
+            json.dump([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents], f, ensure_ascii=False)
+        ids = {i: str(i) for i in range(len(documents))}
+        with open(os.path.join(directory, "index.pkl"), 'wb') as f:
+            pickle.dump((InMemoryDocstore({ids[i]: doc for i, doc in enumerate(documents)}), ids), f)
+        ChunkStore.from_documents(documents).save(directory)
+        shared = ChunkStore.load(directory, mmap=True)
+        for array in (shared.text, shared.offsets, shared.snippets, shared.snippet_offsets, shared.codes):
+            array.sum()
+
+        print(f"{len(documents)} đoạn văn bản, top-{k}, {query_count} truy vấn\n")
+        print(f"  {'Định dạng':<22} {'File (MB)':>10} {'Tải (ms)':>10} {'USS tăng (MB)':>14} {f'Top-{k} (µs)':>12}")
+        for label, load, files in [
+            ("documents.json", load_json, ["documents.json"]),
+            ("Docstore pickle", load_pickle, ["index.pkl"]),
+            ("ChunkStore (mmap)", load_chunk_store, [name for name in os.listdir(directory) if name.startswith("chunk")])
+        ]:
+            size = sum(os.path.getsize(os.path.join(directory, name)) for name in files) / 2**20
+            load_ms, uss, lookup_us = measure(load, directory, lookups)
+            print(f"  {label:<22} {size:10.1f} {load_ms:10.1f} {uss:14.1f} {lookup_us:12.1f}")
+
+if __name__ == "__main__":
+    main()
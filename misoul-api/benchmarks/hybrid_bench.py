@@ -0,0 +1,62 @@
+# benchmarks/hybrid_bench.py
+"""
+Đo chi phí của tìm kiếm hybrid: bước gộp reciprocal rank fusion và độ trễ của
+HybridRetriever so với từng backend chạy riêng.
+
+Cần index sparse đã xây dựng (VECTOR_DB_PATH/db_sparse) để lấy các đoạn văn bản;
+các backend được tạo lại trong bộ nhớ từ các đoạn này.
+
+Chạy từ thư mục misoul-api:
+    python benchmarks/hybrid_bench.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.misoul_embeddings import MISOULEmbeddings
+from app.sparse_store import SparseVectorStore, load_documents
+from app.bm25_store import BM25Store
+from app.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from app.pdf_processor_langchain import PDFProcessor
+
+QUERIES = [
+    "kỹ thuật thở giảm lo âu lo âu căng thẳng buồn trầm",
+    "trầm cảm mất ngủ trầm cảm lo âu nặng căng thẳng cao sợ hãi",
+    "toi bi mat ngu va lo au lo âu căng thẳng buồn trầm",
+    "khủng hoảng tự tử tự hại ý định tự sát tuyệt vọng hỗ trợ khẩn cấp an toàn tìm kiếm giúp đỡ"
+]
+
+def per_query_us(function, number):
+    seconds = timeit.timeit(lambda: [function(query) for query in QUERIES], number=number)
+    return seconds / (number * len(QUERIES)) * 1e6
+
+def main(k=3, number=200):
+    index_path = PDFProcessor.get_index_path(backend="sparse")
+    if not os.path.exists(os.path.join(index_path, SparseVectorStore.DOCUMENTS_FILE)):
+        print(f"❌ Chưa có index sparse tại {index_path}, hãy xây dựng index trước")
+        return
+
+    chunks = load_documents(index_path)
+    stores = {
+        "sparse": SparseVectorStore.from_documents(chunks, MISOULEmbeddings()),
+        "bm25": BM25Store.from_documents(chunks)
+    }
+    hybrid = HybridRetriever(stores, timeout=1.0)
+    candidates = k * HybridRetriever.CANDIDATE_MULTIPLIER
+
+    # Kết quả có sẵn của từng backend, để đo riêng bước gộp
+    result_lists = {
+        query: [store.similarity_search(query, k=candidates) for store in stores.values()]
+        for query in QUERIES
+    }
+
+    print(f"{len(chunks)} đoạn văn bản, top-{k}, {candidates} ứng viên mỗi backend\n")
+    print(f"  {'Gộp RRF':<28} {per_query_us(lambda q: reciprocal_rank_fusion(result_lists[q], top_k=k), number * 10):10.1f} µs")
+    for name, store in stores.items():
+        print(f"  {'Chỉ ' + name:<28} {per_query_us(lambda q: store.similarity_search(q, k=candidates), number):10.1f} µs")
+    print(f"  {'Hybrid (song song + gộp)':<28} {per_query_us(lambda q: hybrid.similarity_search(q, k=k), number):10.1f} µs")
+
+if __name__ == "__main__":
+    main()
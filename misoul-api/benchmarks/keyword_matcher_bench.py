@@ -0,0 +1,108 @@
+# benchmarks/keyword_matcher_bench.py
+"""
+So sánh KeywordMatcher với cách quét chuỗi con trên từng danh sách từ khóa.
+
+Đo hai trường hợp:
+- Một lần quét tất cả các nhóm trên một văn bản (không dùng cache)
+- Toàn bộ phần kiểm tra từ khóa của một lượt trò chuyện: tự hại và khủng hoảng
+  trên tin nhắn người dùng, bài tập trên phản hồi và tách câu tại từ khóa bài tập
+
+Chạy từ thư mục misoul-api:
+    python benchmarks/keyword_matcher_bench.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.keyword_matcher import (
+    KEYWORDS, SELF_HARM_KEYWORDS, CRISIS_KEYWORDS, EXERCISE_INDICATORS, CONFIRMATION_KEYWORDS
+)
+
+USER_MESSAGES = [
+    "Dạo này tôi thấy rất mệt mỏi và căng thẳng vì công việc",
+    "tôi không muốn sống nữa, mọi thứ không còn ý nghĩa",
+    "toi muon tu tu",
+    "có",
+    "Mình hay bị mất ngủ, có cách nào giúp mình thư giãn không?",
+    "Tôi cảm thấy lo lắng trước kỳ thi sắp tới, tim đập nhanh và khó thở"
+]
+
+ASSISTANT_RESPONSE = (
+    "Mình hiểu cảm giác căng thẳng trước kỳ thi là rất phổ biến. Bạn không đơn độc đâu. "
+    "Khi lo âu xuất hiện, cơ thể thường phản ứng bằng nhịp tim nhanh và hơi thở gấp. "
+    "Một kỹ thuật thở đơn giản có thể giúp bạn bình tĩnh lại: hít vào 4 giây, giữ 7 giây, thở ra 8 giây. "
+    "Bạn cũng có thể thử phương pháp 5-4-3-2-1 để đưa sự chú ý về hiện tại."
+)
+
+def legacy_scan(text):
+    """Cách cũ: mỗi nhóm quét toàn bộ danh sách bằng toán tử in"""
+    text = text.lower()
+    return {
+        category
+        for category, keywords in (
+            ("self_harm", SELF_HARM_KEYWORDS),
+            ("crisis", CRISIS_KEYWORDS),
+            ("exercise", EXERCISE_INDICATORS),
+            ("confirmation", CONFIRMATION_KEYWORDS)
+        )
+        if any(keyword in text for keyword in keywords)
+    }
+
+def matcher_scan(text):
+    """Một lần quét KeywordMatcher, bỏ qua cache"""
+    return {match.category for match in KEYWORDS._scan(text)}
+
+def legacy_turn(message, response):
+    """Phần kiểm tra từ khóa của một lượt theo code cũ"""
+    lowered = message.lower()
+    any(keyword in lowered for keyword in SELF_HARM_KEYWORDS)
+    any(keyword in lowered for keyword in CRISIS_KEYWORDS)
+    if any(indicator in response.lower() for indicator in EXERCISE_INDICATORS):
+        for sentence in re.split(r'(?<=[.!?])\s+', response):
+            if any(indicator in sentence.lower() for indicator in EXERCISE_INDICATORS):
+                for indicator in EXERCISE_INDICATORS:
+                    if indicator in sentence.lower():
+                        re.compile(re.escape(indicator), re.IGNORECASE).split(sentence, 1)
+                        break
+                break
+
+def matcher_turn(message, response):
+    """Phần kiểm tra từ khóa của một lượt với KeywordMatcher (cache bắt đầu trống mỗi lượt)"""
+    KEYWORDS._cached_scan.cache_clear()
+    KEYWORDS.contains(message, "self_harm")
+    KEYWORDS.contains(message, "crisis")
+    indicator = KEYWORDS.first(response, "exercise")
+    if indicator is not None:
+        re.split(r'(?<=[.!?])\s+', response[:indicator.start])
+        re.split(r'(?<=[.!?])\s+', response[indicator.start:])
+
+def run(label, function, args_list, number):
+    seconds = timeit.timeit(lambda: [function(*args) for args in args_list], number=number)
+    per_call = seconds / (number * len(args_list)) * 1e6
+    print(f"  {label:<36} {per_call:8.2f} µs")
+
+def main(number=5000):
+    print(f"Một lần quét tất cả các nhóm, tin nhắn người dùng ({len(USER_MESSAGES)} mẫu)")
+    run("Quét chuỗi con (4 danh sách)", legacy_scan, [(text,) for text in USER_MESSAGES], number)
+    run("KeywordMatcher", matcher_scan, [(text,) for text in USER_MESSAGES], number)
+
+    print(f"\nMột lần quét tất cả các nhóm, phản hồi của MISOUL ({len(ASSISTANT_RESPONSE)} ký tự)")
+    run("Quét chuỗi con (4 danh sách)", legacy_scan, [(ASSISTANT_RESPONSE,)], number)
+    run("KeywordMatcher", matcher_scan, [(ASSISTANT_RESPONSE,)], number)
+
+    turns = [(text, ASSISTANT_RESPONSE) for text in USER_MESSAGES]
+    print("\nKiểm tra từ khóa của một lượt trò chuyện")
+    run("Code cũ", legacy_turn, turns, number)
+    run("KeywordMatcher", matcher_turn, turns, number)
+
+    print("\nKhác biệt về kết quả (cách cũ -> KeywordMatcher):")
+    for text in USER_MESSAGES + [ASSISTANT_RESPONSE]:
+        legacy, matched = legacy_scan(text), matcher_scan(text)
+        if legacy != matched:
+            print(f"  {text[:50]!r}: {sorted(legacy)} -> {sorted(matched)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/lsa_bench.py
+"""
+Đo LSAStore (TF-IDF chiếu bằng TruncatedSVD, lưu float32/float16/int8) so với
+SparseVectorStore (ma trận TF-IDF chưa nén) trên cùng các đoạn văn bản.
+
+Báo cáo bộ nhớ của index, thời gian xây dựng, thời gian một truy vấn, bộ nhớ cấp phát
+thêm lớn nhất trong một truy vấn và recall@k so với top-k của SparseVectorStore.
+
+Cần index sparse đã xây dựng (VECTOR_DB_PATH/db_sparse) để lấy các đoạn văn bản;
+các index được tạo lại trong bộ nhớ từ các đoạn này.
+
+Chạy từ thư mục misoul-api:
+    python benchmarks/lsa_bench.py
+"""
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.misoul_embeddings import MISOULEmbeddings
+from app.sparse_store import SparseVectorStore, load_documents
+from app.lsa_store import LSAStore
+from app.pdf_processor_langchain import PDFProcessor
+
+QUERIES = [
+    "kỹ thuật thở giảm lo âu lo âu căng thẳng buồn trầm",
+    "trầm cảm mất ngủ trầm cảm lo âu nặng căng thẳng cao sợ hãi",
+    "chánh niệm thiền bình thường ổn định tích cực",
+    "tôi thấy áp lực vì công việc lo lắng nhẹ căng thẳng nhẹ hơi buồn",
+    "breathing exercise for panic attacks",
+    "cognitive restructuring negative automatic thoughts",
+    "sleep problems and low mood in depression",
+    "mindful awareness of the present moment"
+]
+
+CONFIGURATIONS = [(128, "float32"), (256, "float32"), (256, "float16"), (256, "int8"), (512, "int8")]
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def query_latency(store, k, number):
+    # Xóa cache vector truy vấn sau mỗi lượt để đo cả bước tạo vector
+    def run():
+        store._query_vectors.clear()
+        for query in QUERIES:
+            store.similarity_search(query, k=k)
+    return timeit.timeit(run, number=number) / (number * len(QUERIES)) * 1e3
+
+def query_peak(store, k):
+    # Bộ nhớ cấp phát thêm lớn nhất khi tìm kiếm (numpy báo cấp phát cho tracemalloc)
+    store.similarity_search(QUERIES[0], k=k)
+    peak = 0
+    for query in QUERIES:
+        store._query_vectors.clear()
+        tracemalloc.start()
+        store.similarity_search(query, k=k)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak / 2**10
+
+def recall(store, baseline, k):
+    hits = 0
+    for query in QUERIES:
+        expected = {doc.page_content for doc in baseline[query]}
+        hits += len(expected & {doc.page_content for doc in store.similarity_search(query, k=k)})
+    return hits / sum(len(baseline[query]) for query in QUERIES)
+
+def main(k=5, number=50):
+    index_path = PDFProcessor.get_index_path(backend="sparse")
+    if not os.path.exists(os.path.join(index_path, SparseVectorStore.DOCUMENTS_FILE)):
+        print(f"❌ Chưa có index sparse tại {index_path}, hãy xây dựng index trước")
+        return
+
+    chunks = load_documents(index_path)
+    sparse, sparse_build = timed(lambda: SparseVectorStore.from_documents(chunks, MISOULEmbeddings()))
+    baseline = {query: sparse.similarity_search(query, k=k) for query in QUERIES}
+
+    print(f"{len(chunks)} đoạn văn bản, TF-IDF {sparse.dimension} chiều, top-{k}\n")
+    print(f"  {'':<22} {'Bộ nhớ (MB)':>12} {'Xây dựng (s)':>13} {'Truy vấn (ms)':>14} {'Cấp phát (KB)':>14} {f'Recall@{k}':>10}")
+    print(f"  {'Sparse (chưa nén)':<22} {sparse.nbytes / 2**20:12.2f} {sparse_build:13.2f} "
+          f"{query_latency(sparse, k, number):14.3f} {query_peak(sparse, k):14.1f} {1:10.2f}")
+    # Ma trận TF-IDF dạng dense float32 như trong FAISS, để so sánh
+    print(f"  {'Dense float32 (FAISS)':<22} {len(sparse) * sparse.dimension * 4 / 2**20:12.2f}")
+
+    for components, dtype in CONFIGURATIONS:
+        store, build = timed(lambda: LSAStore.from_documents(chunks, MISOULEmbeddings(), components=components, dtype=dtype))
+        print(f"  {f'LSA {components} {dtype}':<22} {store.nbytes / 2**20:12.2f} {build:13.2f} "
+              f"{query_latency(store, k, number):14.3f} {query_peak(store, k):14.1f} {recall(store, baseline, k):10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/mmap_bench.py
+"""
+Đo bộ nhớ riêng (USS) của mỗi worker và thời gian tải index khi nhiều worker cùng phục vụ
+một index, theo 3 cách:
+
+  - Mỗi worker tự đọc index vào bộ nhớ (INDEX_MMAP=False)
+  - Mỗi worker tự tải index, các mảng được memory-map (INDEX_MMAP=True)
+  - Master tải trước rồi fork worker (gunicorn preload_app, INDEX_MMAP=True)
+
+USS là phần bộ nhớ chỉ process đó dùng (Private_Clean + Private_Dirty trong
+/proc/<pid>/smaps_rollup, chỉ có trên Linux); phần dùng chung qua page cache hoặc
+copy-on-write không được tính. Mỗi worker chạy vài truy vấn sau khi tải để đọc index,
+cả truy vấn lọc theo danh mục của từng mức độ cảm xúc (CATEGORY_ROUTES) như RAGManager.
+
+Cần index đã xây dựng trong VECTOR_DB_PATH. Chạy từ thư mục misoul-api (tham số là các
+backend, mặc định backend đang cấu hình):
+    python benchmarks/mmap_bench.py sparse bm25
+"""
+import os
+import sys
+import gc
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app.pdf_processor_langchain import PDFProcessor
+from app.rag_manager import CATEGORY_ROUTES
+
+QUERIES = [
+    "kỹ thuật thở giảm lo âu",
+    "trầm cảm mất ngủ",
+    "chánh niệm thiền",
+    "breathing exercise for panic attacks"
+]
+
+def private_memory_mb():
+    """USS của process hiện tại (MB)"""
+    with open("/proc/self/smaps_rollup") as f:
+        fields = dict(line.split(":", 1) for line in f if ":" in line)
+    kilobytes = sum(int(fields[name].split()[0]) for name in ("Private_Clean", "Private_Dirty"))
+    return kilobytes / 1024
+
+def run_workers(workers, load):
+    """
+    Fork các worker, mỗi worker gọi load() rồi tìm kiếm; khi tất cả worker đã tải xong
+    (để các trang dùng chung thực sự được nhiều process cùng map), mỗi worker báo USS
+
+    Returns:
+        list: (USS MB, thời gian tải giây) của từng worker
+    """
+    children = []
+    for _ in range(workers):
+        result_read, result_write = os.pipe()
+        go_read, go_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(result_read)
+            os.close(go_write)
+            start = time.perf_counter()
+            db = load()
+            load_seconds = time.perf_counter() - start
+            for query in QUERIES:
+                db.similarity_search(query, k=3)
+                if hasattr(db, "category_counts"):
+                    for categories in CATEGORY_ROUTES.values():
+                        db.similarity_search(query, k=3, categories=categories)
+            os.write(result_write, b"loaded\n")
+            os.read(go_read, 1)
+            os.write(result_write, json.dumps([private_memory_mb(), load_seconds]).encode())
+            os._exit(0)
+        os.close(result_write)
+        os.close(go_read)
+        children.append((pid, os.fdopen(result_read), go_write))
+
+    for _, reader, _ in children:
+        reader.readline()
+    results = []
+    for pid, reader, go_write in children:
+        os.write(go_write, b"1")
+        results.append(json.loads(reader.read()))
+        reader.close()
+        os.close(go_write)
+        os.waitpid(pid, 0)
+    return results
+
+def main(backends=None, workers=4):
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("❌ Benchmark cần /proc/self/smaps_rollup (Linux)")
+        return
+
+    for backend in backends or [PDFProcessor.get_backends()[0]]:
+        print(f"\nBackend {backend}, {workers} worker")
+        print(f"  {'':<34} {'USS/worker (MB)':>16} {'Tổng USS (MB)':>14} {'Tải (ms)':>10}")
+
+        for label, mmap, preload in [
+            ("Tự tải, đọc vào bộ nhớ", False, False),
+            ("Tự tải, memory-map", True, False),
+            ("Master tải trước + memory-map", True, True)
+        ]:
+            Config.INDEX_MMAP = mmap
+            if preload:
+                db = PDFProcessor._load_index(backend)
+                gc.freeze()
+                results = run_workers(workers, lambda: db)
+                gc.unfreeze()
+                del db
+            else:
+                results = run_workers(workers, lambda: PDFProcessor._load_index(backend))
+            if any(result is None for result in results):
+                print(f"❌ Không tải được index {backend}")
+                break
+            uss = [memory for memory, _ in results]
+            load_ms = sum(seconds for _, seconds in results) / len(results) * 1e3
+            print(f"  {label:<34} {sum(uss) / len(uss):16.1f} {sum(uss):14.1f} {load_ms:10.1f}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or None)
@@ -0,0 +1,88 @@
+# benchmarks/retriever_bench.py
+"""
+So sánh SparseVectorStore (ma trận CSR) và BM25Store (inverted index) với FAISS (index dense)
+trên cùng các đoạn văn bản.
+
+Đo thời gian xây dựng, bộ nhớ của index, thời gian một truy vấn và mức trùng khớp
+của top-k với FAISS.
+
+Các đoạn văn bản được đọc từ index sparse đã xây dựng (VECTOR_DB_PATH/db_sparse) nếu có,
+nếu không thì đọc và chia nhỏ các file PDF trong PDF_DIRECTORY (chậm hơn nhiều).
+
+Chạy từ thư mục misoul-api:
+    python benchmarks/retriever_bench.py
+"""
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from app.misoul_embeddings import MISOULEmbeddings
+from app.sparse_store import SparseVectorStore, load_documents
+from app.bm25_store import BM25Store
+from app.pdf_processor_langchain import PDFProcessor
+
+QUERIES = [
+    "kỹ thuật thở giảm lo âu lo âu căng thẳng buồn trầm",
+    "trầm cảm mất ngủ trầm cảm lo âu nặng căng thẳng cao sợ hãi",
+    "chánh niệm thiền bình thường ổn định tích cực",
+    "toi bi mat ngu va lo au lo âu căng thẳng buồn trầm",
+    "tôi thấy áp lực vì công việc lo lắng nhẹ căng thẳng nhẹ hơi buồn",
+    "khủng hoảng tự tử tự hại ý định tự sát tuyệt vọng hỗ trợ khẩn cấp an toàn tìm kiếm giúp đỡ"
+]
+
+def load_chunks():
+    """Đọc các đoạn văn bản từ index sparse có sẵn hoặc từ file PDF"""
+    index_path = PDFProcessor.get_index_path(backend="sparse")
+    if os.path.exists(os.path.join(index_path, SparseVectorStore.DOCUMENTS_FILE)):
+        return list(load_documents(index_path))
+
+    processor = PDFProcessor()
+    chunks = []
+    for pdf_file in sorted(os.listdir(processor.pdf_directory)):
+        if pdf_file.endswith(".pdf"):
+            path = os.path.join(processor.pdf_directory, pdf_file)
+            chunks.extend(processor.add_metadata_to_chunks(processor.create_chunks(processor.load_pdf(path)), path))
+    return chunks
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def query_latency(store, k, number):
+    seconds = timeit.timeit(lambda: [store.similarity_search(query, k=k) for query in QUERIES], number=number)
+    return seconds / (number * len(QUERIES)) * 1e3
+
+def main(k=3, number=50):
+    chunks = load_chunks()
+    if not chunks:
+        print("❌ Không có đoạn văn bản nào để đo")
+        return
+
+    sparse, sparse_build = timed(lambda: SparseVectorStore.from_documents(chunks, MISOULEmbeddings()))
+    dense, dense_build = timed(lambda: FAISS.from_documents(chunks, MISOULEmbeddings()))
+    bm25, bm25_build = timed(lambda: BM25Store.from_documents(chunks))
+    dense_bytes = dense.index.ntotal * dense.index.d * 4
+
+    print(f"{len(chunks)} đoạn văn bản, {sparse.dimension} chiều, "
+          f"{sparse.matrix.nnz / (len(sparse) * sparse.dimension):.2%} phần tử khác 0, "
+          f"BM25 {bm25.dimension} term\n")
+    print(f"  {'':<22} {'FAISS (dense)':>14} {'Sparse (CSR)':>14} {'BM25':>14}")
+    print(f"  {'Xây dựng (s)':<22} {dense_build:14.2f} {sparse_build:14.2f} {bm25_build:14.2f}")
+    print(f"  {'Bộ nhớ index (MB)':<22} {dense_bytes / 2**20:14.1f} {sparse.nbytes / 2**20:14.1f} {bm25.nbytes / 2**20:14.1f}")
+    print(f"  {'Truy vấn (ms)':<22} {query_latency(dense, k, number):14.2f} "
+          f"{query_latency(sparse, k, number):14.2f} {query_latency(bm25, k, number):14.2f}")
+
+    print(f"\nTrùng khớp top-{k} với FAISS (Sparse, BM25):")
+    for query in QUERIES:
+        dense_top = {doc.page_content for doc in dense.similarity_search(query, k=k)}
+        sparse_top = {doc.page_content for doc in sparse.similarity_search(query, k=k)}
+        bm25_top = {doc.page_content for doc in bm25.similarity_search(query, k=k)}
+        print(f"  {len(dense_top & sparse_top)}/{k}  {len(dense_top & bm25_top)}/{k}  {query[:50]}")
+
+if __name__ == "__main__":
+    main()
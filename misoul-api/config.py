@@ -18,9 +18,60 @@ class Config:
     
     # Đường dẫn lưu trữ vector database
     VECTOR_DB_PATH = os.path.join(os.getcwd(), 'data', 'misoul_vectordb')
+    INDEX_MMAP = os.environ.get('INDEX_MMAP', 'True').lower() == 'true'                  # Memory-map index (chỉ đọc) để các worker dùng chung page cache
+    INDEX_KEEP_VERSIONS = int(os.environ.get('INDEX_KEEP_VERSIONS', 2))                   # Số phiên bản index giữ trên đĩa (gồm phiên bản đang dùng)
+    INDEX_WATCH_INTERVAL = float(os.environ.get('INDEX_WATCH_INTERVAL', 10))              # Số giây giữa hai lần worker kiểm tra phiên bản index mới (0 = tắt)
+    
+    # Cách tìm kiếm tài liệu: "sparse" (TF-IDF, ma trận thưa CSR), "faiss" (TF-IDF, index FAISS dạng dense),
+    # "bm25" (inverted index BM25), "lsa" (TF-IDF chiếu xuống LSA_COMPONENTS chiều) hoặc "hybrid"
+    # (tìm song song trên các backend trong HYBRID_BACKENDS rồi gộp kết quả)
+    RETRIEVER_BACKEND = os.environ.get('RETRIEVER_BACKEND', 'sparse')
+    LSA_COMPONENTS = int(os.environ.get('LSA_COMPONENTS', 256))                         # Số chiều sau khi chiếu bằng TruncatedSVD
+    LSA_DTYPE = os.environ.get('LSA_DTYPE', 'int8')                                     # Kiểu lưu vector LSA: float32, float16 hoặc int8
+    # Loại index của backend faiss: "flat" (tìm chính xác), "ivf_flat", "ivf_pq" hoặc "hnsw" (tìm gần đúng)
+    FAISS_INDEX_TYPE = os.environ.get('FAISS_INDEX_TYPE', 'flat')
+    FAISS_NLIST = int(os.environ.get('FAISS_NLIST', 0))                                 # Số cụm IVF (0 = khoảng căn bậc hai số đoạn)
+    FAISS_NPROBE = int(os.environ.get('FAISS_NPROBE', 8))                               # Số cụm IVF được duyệt mỗi truy vấn
+    FAISS_PQ_M = int(os.environ.get('FAISS_PQ_M', 50))                                  # Số sub-quantizer PQ (phải chia hết số chiều)
+    FAISS_PQ_NBITS = int(os.environ.get('FAISS_PQ_NBITS', 8))                           # Số bit của mỗi mã PQ
+    FAISS_HNSW_M = int(os.environ.get('FAISS_HNSW_M', 32))                              # Số cạnh của mỗi nút HNSW
+    FAISS_EF_CONSTRUCTION = int(os.environ.get('FAISS_EF_CONSTRUCTION', 40))            # Độ rộng tìm kiếm khi xây dựng HNSW
+    FAISS_EF_SEARCH = int(os.environ.get('FAISS_EF_SEARCH', 64))                        # Độ rộng tìm kiếm HNSW mỗi truy vấn
+    HYBRID_BACKENDS = os.environ.get('HYBRID_BACKENDS', 'sparse,bm25')                 # Các backend dùng trong chế độ hybrid
+    HYBRID_TIMEOUT_MS = int(os.environ.get('HYBRID_TIMEOUT_MS', 200))                   # Backend chậm hơn bị bỏ qua trong lượt đó
+    HYBRID_RRF_K = int(os.environ.get('HYBRID_RRF_K', 60))                              # Hằng số k của reciprocal rank fusion
+    CATEGORY_ROUTING = os.environ.get('CATEGORY_ROUTING', 'True').lower() == 'true'     # Chỉ tìm trong các danh mục phù hợp với mức độ cảm xúc
+    PARTITION_MIN_CHUNKS = int(os.environ.get('PARTITION_MIN_CHUNKS', 50))              # Ít đoạn hơn thì tìm trên toàn bộ tài liệu
+    # Trọng số của vector từ khóa cảm xúc cộng vào vector truy vấn, theo mức độ cảm xúc 1-5
+    QUERY_EXPANSION_WEIGHTS = os.environ.get('QUERY_EXPANSION_WEIGHTS', '1.0,1.0,1.0,1.0,1.0')
+    QUERY_VECTOR_CACHE_SIZE = int(os.environ.get('QUERY_VECTOR_CACHE_SIZE', 1024))       # Số vector truy vấn được lưu cho mỗi index (0 = tắt)
+    RETRIEVAL_CACHE_SIZE = int(os.environ.get('RETRIEVAL_CACHE_SIZE', 1024))             # Số kết quả tìm kiếm được lưu cho mỗi index (0 = tắt)
+    CHUNK_CACHE_SIZE = int(os.environ.get('CHUNK_CACHE_SIZE', 1024))                     # Số Document đã tạo từ ChunkStore được giữ lại cho mỗi index (0 = tắt)
     
     # Thêm đường dẫn thư mục PDF
     PDF_DIRECTORY = os.path.join(os.getcwd(), 'data', 'pdfs')
     
     # Cấu hình debug
-    DEBUG = os.environ.get('DEBUG', 'True').lower() == 'true'
\ No newline at end of file
+    DEBUG = os.environ.get('DEBUG', 'True').lower() == 'true'
+    
+    # Giới hạn xử lý tin nhắn chat
+    CHAT_MAX_WORKERS = int(os.environ.get('CHAT_MAX_WORKERS', 4))          # Số thread xử lý đồng thời
+    CHAT_QUEUE_SIZE = int(os.environ.get('CHAT_QUEUE_SIZE', 16))           # Số request được phép chờ
+    CHAT_TIMEOUT_SECONDS = int(os.environ.get('CHAT_TIMEOUT_SECONDS', 30)) # Thời gian chờ tối đa cho một tin nhắn
+    CHAT_RETRY_AFTER_SECONDS = int(os.environ.get('CHAT_RETRY_AFTER_SECONDS', 5))  # Giá trị header Retry-After khi quá tải
+    
+    # Cấu hình phản hồi cho tin nhắn khủng hoảng (có nội dung tự hại)
+    CRISIS_MAX_OUTPUT_TOKENS = int(os.environ.get('CRISIS_MAX_OUTPUT_TOKENS', 512))   # Phản hồi ngắn gọn để trả lời nhanh hơn
+    CRISIS_TEMPERATURE = float(os.environ.get('CRISIS_TEMPERATURE', 0.3))
+    CRISIS_TOP_K = int(os.environ.get('CRISIS_TOP_K', 3))                            # Số tài liệu khủng hoảng được chọn sẵn
+    
+    # Lưu trữ trạng thái hội thoại: "memory" (trong process), "sqlite" (dùng chung giữa các worker)
+    # hoặc "auto" (sqlite khi gunicorn chạy nhiều worker, memory khi chỉ có một process)
+    SESSION_STORE = os.environ.get('SESSION_STORE', 'auto')
+    SESSION_DB_PATH = os.environ.get('SESSION_DB_PATH', os.path.join(os.getcwd(), 'data', 'sessions.sqlite3'))
+    SESSION_MAX_TURNS = int(os.environ.get('SESSION_MAX_TURNS', 10))                    # Số lượt trò chuyện giữ lại cho mỗi người dùng
+    SESSION_ASSISTANT_MAX_CHARS = int(os.environ.get('SESSION_ASSISTANT_MAX_CHARS', 500)) # Độ dài tối đa của phản hồi lưu trong lịch sử (0 = không cắt)
+    SESSION_MAX_USERS = int(os.environ.get('SESSION_MAX_USERS', 10000))                 # Số phiên tối đa trong bộ nhớ (0 = không giới hạn)
+    SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', 6 * 3600))          # Phiên không hoạt động quá thời gian này bị xóa (0 = không hết hạn)
+    SESSION_MEMORY_BUDGET_MB = int(os.environ.get('SESSION_MEMORY_BUDGET_MB', 64))      # Ngân sách bộ nhớ cho các phiên (0 = không giới hạn)
+    SESSION_LOCK_TTL_SECONDS = int(os.environ.get('SESSION_LOCK_TTL_SECONDS', 120))     # Lượt đang giữ trong SQLite hết hạn sau thời gian này nếu worker bị dừng
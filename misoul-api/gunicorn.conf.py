@@ -0,0 +1,63 @@
+# gunicorn.conf.py
+# Cấu hình gunicorn cho MISOUL API: gunicorn app.api:app
+import os
+import gc
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Khởi động trước có thể mất thời gian (nạp index), tránh để master kill worker
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+
+# Tải app và index trong master trước khi fork để các worker dùng chung một bản index
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() == 'true'
+
+def on_starting(server):
+    """
+    Chọn session store dùng chung khi chạy nhiều worker
+
+    Mỗi worker có bộ nhớ riêng, nên với SESSION_STORE=memory lượt xác nhận bài tập,
+    lịch sử và việc giới hạn cảnh báo khẩn cấp có thể rơi vào worker chưa thấy lượt trước.
+    """
+    store = os.environ.get('SESSION_STORE', 'auto').lower()
+    if server.cfg.workers <= 1:
+        return
+    if store == 'auto':
+        # Worker được fork sau bước này nên nhận biến môi trường; với preload_app,
+        # config đã được import trong master nên cập nhật cả Config
+        os.environ['SESSION_STORE'] = 'sqlite'
+        config = sys.modules.get('config')
+        if config is not None:
+            config.Config.SESSION_STORE = 'sqlite'
+        server.log.info(f"Chạy {server.cfg.workers} worker, dùng SQLite session store dùng chung")
+    elif store == 'memory':
+        server.log.warning(
+            f"SESSION_STORE=memory với {server.cfg.workers} worker: mỗi worker có trạng thái hội thoại riêng, "
+            "lượt xác nhận bài tập và lịch sử có thể bị mất khi request rơi vào worker khác"
+        )
+
+def when_ready(server):
+    """
+    Với preload_app, tải vector database trong master trước khi tạo worker
+    """
+    if not preload_app:
+        return
+    from app.api import preload_vector_db
+    if preload_vector_db():
+        # Bỏ các object đã tải khỏi bộ thu gom rác, để GC trong worker không ghi vào
+        # các trang bộ nhớ dùng chung và làm copy-on-write sao chép chúng
+        gc.freeze()
+    else:
+        server.log.warning("Không tải trước được vector database, mỗi worker sẽ tự tải")
+
+def post_worker_init(worker):
+    """
+    Khởi tạo MISOUL trong worker trước khi worker bắt đầu nhận request
+    """
+    from app.api import warm_up
+    if not warm_up():
+        worker.log.warning("Khởi động trước MISOUL thất bại, /api/ready sẽ trả về 503")
@@ -1,6 +1,6 @@
 # run.py
 import os
-from app.api import app  # Import từ thư mục app
+from app.api import app, warm_up  # Import từ thư mục app
 from config import Config
 import sys
 import io
@@ -28,6 +28,12 @@ if __name__ == '__main__':
     debug_mode = Config.DEBUG
     print(f"🚀 Khởi động MISOUL API trong chế độ {'DEBUG' if debug_mode else 'PRODUCTION'}")
     
+    # Khởi tạo trước chatbot và index trước khi nhận request
+    # (khi bật reloader, chỉ process con mới phục vụ request)
+    if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        if not warm_up():
+            print("⚠️ CẢNH BÁO: Khởi động trước MISOUL thất bại, /api/ready sẽ trả về 503")
+    
     # Chạy app
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=debug_mode)
\ No newline at end of file
@@ -0,0 +1,75 @@
+# tests/test_chat_executor.py
+import threading
+import unittest
+
+from app.chat_executor import ChatExecutor
+
+class SerializedTurnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ChatExecutor(max_workers=2, max_queue_size=8)
+        self.release = threading.Event()
+        self.order = []
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+
+    def blocking_turn(self, name):
+        self.order.append(f"{name} start")
+        self.release.wait(5)
+        self.order.append(f"{name} end")
+        return name
+
+    def turn(self, name):
+        self.order.append(name)
+        return name
+
+    def test_waiting_turn_does_not_hold_a_worker(self):
+        first = self.executor.submit(self.blocking_turn, "a1", serial_key="a")
+        second = self.executor.submit(self.turn, "a2", serial_key="a")
+
+        # Lượt thứ hai của "a" chờ trong hàng đợi, thread còn lại vẫn phục vụ người dùng khác
+        self.assertEqual(self.executor.submit(self.turn, "b1", serial_key="b").result(timeout=1), "b1")
+        self.assertFalse(second.done())
+        self.assertEqual(self.executor.in_flight, 1)
+        self.assertEqual(self.executor.queue_depth, 1)
+
+        self.release.set()
+        self.assertEqual(second.result(timeout=1), "a2")
+        self.assertEqual(first.result(), "a1")
+        self.assertLess(self.order.index("a1 end"), self.order.index("a2"))
+
+    def test_cancelled_turn_keeps_order(self):
+        self.executor.submit(self.blocking_turn, "a1", serial_key="a")
+        cancelled = self.executor.submit(self.turn, "a2", serial_key="a")
+        third = self.executor.submit(self.turn, "a3", serial_key="a")
+
+        # Lượt bị hủy khi còn chờ trả lại chỗ ngay nhưng lượt sau vẫn chờ lượt đang chạy
+        self.assertTrue(cancelled.cancel())
+        self.assertFalse(third.done())
+
+        self.release.set()
+        self.assertEqual(third.result(timeout=1), "a3")
+        self.assertEqual(self.order, ["a1 start", "a1 end", "a3"])
+        self.assertEqual(self.executor.queue_depth, 0)
+
+    def test_serialized_block_waits_for_queued_turns(self):
+        self.executor.submit(self.blocking_turn, "a1", serial_key="a")
+        entered = threading.Event()
+
+        def stream():
+            with self.executor.serialized("a"):
+                self.order.append("stream")
+                entered.set()
+
+        thread = threading.Thread(target=stream)
+        thread.start()
+        self.assertFalse(entered.wait(0.2))
+
+        self.release.set()
+        thread.join(timeout=1)
+        self.assertEqual(self.order, ["a1 start", "a1 end", "stream"])
+
+if __name__ == "__main__":
+    unittest.main()
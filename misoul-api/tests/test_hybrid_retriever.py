@@ -0,0 +1,59 @@
+# tests/test_hybrid_retriever.py
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+from config import Config
+from app.hybrid_retriever import HybridRetriever
+
+class FakeStore:
+    """Backend giả trả về cùng danh sách tài liệu sau delay giây"""
+
+    def __init__(self, name, delay=0.0):
+        self.documents = [Document(page_content=f"{name} {i}", metadata={"source": name}) for i in range(10)]
+        self.delay = delay
+        self.release = threading.Event()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def similarity_search(self, query, k=4):
+        if self.delay:
+            self.release.wait(self.delay)
+        return self.documents[:k]
+
+class SlowBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        # Tên backend riêng cho mỗi test để không dùng chung pool (và task cũ) giữa các test
+        self.slow_name = f"slow-{self.id()}"
+        self.fast = FakeStore("fast")
+        self.slow = FakeStore("slow", delay=5.0)
+        self.retriever = HybridRetriever({"fast": self.fast, self.slow_name: self.slow}, timeout=0.05)
+
+    def tearDown(self):
+        self.slow.release.set()
+
+    def test_persistently_slow_backend_degrades_to_fast_backend(self):
+        # Nhiều lượt liên tiếp hơn số thread của backend chậm: task cũ của nó vẫn chạy
+        for _ in range(20):
+            start = time.perf_counter()
+            documents, complete = self.retriever.similarity_search_with_status("lo âu", k=3)
+            self.assertFalse(complete)
+            self.assertEqual([doc.page_content for doc in documents], ["fast 0", "fast 1", "fast 2"])
+            self.assertLess(time.perf_counter() - start, 1.0)
+
+    def test_concurrent_turns_keep_fast_results(self):
+        # Số lượt đồng thời như giới hạn của ChatExecutor
+        with ThreadPoolExecutor(max_workers=max(2, Config.CHAT_MAX_WORKERS)) as pool:
+            results = list(pool.map(
+                lambda _: self.retriever.similarity_search("lo âu", k=3), range(40)
+            ))
+        for documents in results:
+            self.assertEqual([doc.page_content for doc in documents], ["fast 0", "fast 1", "fast 2"])
+
+if __name__ == "__main__":
+    unittest.main()
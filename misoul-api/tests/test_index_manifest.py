@@ -0,0 +1,68 @@
+# tests/test_index_manifest.py
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from app import index_manifest
+from app.index_manifest import write_manifest, read_manifest, IndexManifestError, MANIFEST_FILE
+
+class ReadManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "vectors.npy")
+        with open(self.path, "wb") as f:
+            f.write(b"\x01" * 4096)
+        write_manifest(self.directory.name, backend="sparse")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def rewrite(self, data, keep_mtime=False):
+        stat = os.stat(self.path)
+        with open(self.path, "wb") as f:
+            f.write(data)
+        if keep_mtime:
+            os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        else:
+            os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def test_unchanged_index_is_not_hashed(self):
+        with mock.patch.object(index_manifest, "file_sha256", side_effect=AssertionError("đã đọc file")):
+            read_manifest(self.directory.name)
+
+    def test_changed_size_is_rejected(self):
+        self.rewrite(b"\x01" * 10)
+        with self.assertRaises(IndexManifestError):
+            read_manifest(self.directory.name)
+
+    def test_changed_mtime_falls_back_to_checksum(self):
+        # Cùng nội dung (thư mục được chép lại) vẫn tải được, nội dung khác thì bị từ chối
+        self.rewrite(b"\x01" * 4096)
+        read_manifest(self.directory.name)
+        self.rewrite(b"\x02" * 4096)
+        with self.assertRaises(IndexManifestError):
+            read_manifest(self.directory.name)
+
+    def test_full_check_catches_corruption_with_same_stat(self):
+        self.rewrite(b"\x02" * 4096, keep_mtime=True)
+        read_manifest(self.directory.name)
+        with self.assertRaises(IndexManifestError):
+            read_manifest(self.directory.name, checksums=True)
+
+    def test_manifest_without_stats_is_hashed(self):
+        manifest_path = os.path.join(self.directory.name, MANIFEST_FILE)
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        del manifest["stats"]
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        self.rewrite(b"\x02" * 4096, keep_mtime=True)
+        with self.assertRaises(IndexManifestError):
+            read_manifest(self.directory.name)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+# tests/test_index_versions.py
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from config import Config
+from app.index_versions import (
+    IndexVersion, IndexReloader, prune_versions, publish_version, list_versions, version_path
+)
+
+class IndexVersionTest(unittest.TestCase):
+
+    def test_retired_version_stays_usable_until_last_release(self):
+        vector_db = object()
+        version = IndexVersion(vector_db, "v1")
+        live = IndexVersion.live
+
+        # Hai truy vấn đang chạy khi RAGManager chuyển sang phiên bản mới
+        self.assertTrue(version.acquire())
+        self.assertTrue(version.acquire())
+        version.retire()
+        self.assertIs(version.vector_db, vector_db)
+        self.assertEqual(version.in_flight, 1)
+
+        version.release()
+        self.assertIs(version.vector_db, vector_db)
+        self.assertEqual(IndexVersion.live, live)
+
+        version.release()
+        self.assertIsNone(version.vector_db)
+        self.assertEqual(IndexVersion.live, live - 1)
+
+    def test_acquire_fails_after_last_release(self):
+        version = IndexVersion(object(), "v1")
+        self.assertTrue(version.acquire())
+        version.retire()
+        version.release()
+        self.assertFalse(version.acquire())
+        self.assertEqual(version.in_flight, 0)
+
+class PruneVersionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.versions = ["20260101-000000", "20260102-000000", "20260103-000000", "20260104-000000", "20260105-000000"]
+        for version in self.versions:
+            os.makedirs(version_path(self.root, version))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_keeps_current_and_newest_older_versions(self):
+        publish_version(self.root, self.versions[-1])
+        removed = prune_versions(self.root, keep=3)
+        self.assertEqual(removed, self.versions[:2])
+        self.assertEqual(list_versions(self.root), self.versions[2:])
+
+    def test_never_removes_current_after_rollback(self):
+        # CURRENT trỏ về phiên bản cũ (quay lại bản trước), các bản mới hơn vẫn có trên đĩa
+        publish_version(self.root, self.versions[0])
+        removed = prune_versions(self.root, keep=2)
+        self.assertNotIn(self.versions[0], removed)
+        self.assertEqual(list_versions(self.root), [self.versions[0], self.versions[-1]])
+
+    def test_keep_one_leaves_only_current(self):
+        publish_version(self.root, self.versions[2])
+        prune_versions(self.root, keep=1)
+        self.assertEqual(list_versions(self.root), [self.versions[2]])
+
+class IndexReloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(Config, "VECTOR_DB_PATH", self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+        self.served = None
+        self.loaded = {}
+        self.installed = []
+        self.reloader = IndexReloader(
+            load=lambda version: self.loaded.get(version),
+            install=self.install,
+            served_version=lambda: self.served
+        )
+
+    def install(self, vector_db, version):
+        self.installed.append((vector_db, version))
+        self.served = version
+
+    def test_installs_new_current_version(self):
+        vector_db = object()
+        self.loaded["v2"] = vector_db
+        publish_version(self.directory.name, "v2")
+
+        self.assertEqual(self.reloader.reload(), "succeeded")
+        self.assertEqual(self.installed, [(vector_db, "v2")])
+        self.assertEqual(self.reloader.reload(), "unchanged")
+        self.assertEqual(len(self.installed), 1)
+
+    def test_failed_load_keeps_served_version(self):
+        self.served = "v1"
+        publish_version(self.directory.name, "v2")
+
+        self.assertEqual(self.reloader.reload(), "failed")
+        self.assertEqual(self.installed, [])
+        status = self.reloader.status()
+        self.assertEqual(status["served_version"], "v1")
+        self.assertEqual(status["last_version"], "v2")
+        self.assertIsNotNone(status["error"])
+
+if __name__ == "__main__":
+    unittest.main()
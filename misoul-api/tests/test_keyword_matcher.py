@@ -0,0 +1,35 @@
+# tests/test_keyword_matcher.py
+"""
+Chạy từ thư mục misoul-api:
+    python -m unittest discover tests
+"""
+import unittest
+
+from app.keyword_matcher import KEYWORDS
+
+class KeywordMatcherTest(unittest.TestCase):
+
+    def test_unaccented_input_matches_accented_keywords(self):
+        self.assertEqual(KEYWORDS.match_categories("toi muon tu tu"), {"self_harm", "crisis"})
+        self.assertIn("self_harm", KEYWORDS.match_categories("TOI MUON CHET"))
+
+    def test_accented_input_matches_exact_keywords(self):
+        self.assertEqual(KEYWORDS.match_categories("Tôi muốn tự tử"), {"self_harm", "crisis"})
+        self.assertIn("self_harm", KEYWORDS.match_categories("tôi không muốn sống nữa"))
+
+    def test_accented_words_that_fold_to_keywords_do_not_match(self):
+        for text in [
+            "Hãy từ từ hít thở",            # "từ từ" -> "tu tu" (tự tử)
+            "Tôi đã lo âu từ hai năm nay",  # "từ hai" -> "tu hai" (tự hại)
+            "hôm nay lớp tôi treo cờ"       # "treo cờ" -> "treo co" (treo cổ)
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(KEYWORDS.match_categories(text), set())
+
+    def test_exact_categories_require_accents(self):
+        self.assertEqual(KEYWORDS.match_categories("có"), {"confirmation"})
+        self.assertEqual(KEYWORDS.match_categories("co"), set())
+        self.assertEqual(KEYWORDS.match_categories("cô"), set())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# tests/test_misoul_chatbot.py
+import unittest
+
+from config import Config
+from app.metrics import CRISIS_LATENCY
+from app.misoul_chatbot import MISOULChatbot
+from app.prompt_manager import PromptManager
+
+class RecordingLLM:
+    """LLM giả, ghi lại cấu hình sinh của mỗi lần gọi"""
+
+    def __init__(self, text="Mình ở đây lắng nghe bạn."):
+        self.text = text
+        self.calls = []
+
+    def generate_response(self, prompt, temperature=None, max_tokens=None, deadline=None):
+        self.calls.append({"temperature": temperature, "max_tokens": max_tokens})
+        return self.text
+
+    def generate_response_stream(self, prompt, temperature=None, max_tokens=None, deadline=None):
+        self.calls.append({"temperature": temperature, "max_tokens": max_tokens})
+        yield self.text
+
+class RecordingRAG:
+    """RAGManager giả, ghi lại cách truy xuất tài liệu"""
+
+    vector_db = None
+
+    def __init__(self):
+        self.calls = []
+
+    def retrieve_documents(self, query, emotional_level=1, top_k=3, deadline=None):
+        self.calls.append("normal")
+        return []
+
+    def get_crisis_documents(self, top_k=3, deadline=None):
+        self.calls.append("crisis")
+        return []
+
+BENIGN_ACCENTED_MESSAGES = [
+    "Hãy từ từ hít thở",
+    "Tôi đã lo âu từ hai năm nay",
+    "hôm nay lớp tôi treo cờ"
+]
+
+class CrisisFastLaneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.llm = RecordingLLM()
+        self.rag = RecordingRAG()
+        self.chatbot = MISOULChatbot(self.llm, self.rag, PromptManager())
+        self.warning = self.chatbot.get_emergency_warning()
+
+    def test_benign_accented_messages_stay_on_normal_path(self):
+        for index, message in enumerate(BENIGN_ACCENTED_MESSAGES):
+            for streaming in (False, True):
+                with self.subTest(message=message, streaming=streaming):
+                    user_id = f"user-{index}-{streaming}"
+                    if streaming:
+                        replies = list(self.chatbot.process_message_stream(message, 2, user_id=user_id))
+                    else:
+                        replies = self.chatbot.process_message(message, 2, user_id=user_id)
+                        replies = replies if isinstance(replies, list) else [replies]
+                    self.assertNotIn(self.warning, replies)
+                    self.assertEqual(self.rag.calls[-1], "normal")
+                    self.assertIsNone(self.llm.calls[-1]["max_tokens"])
+
+    def test_unaccented_self_harm_message_uses_fast_lane(self):
+        replies = list(self.chatbot.process_message_stream("toi muon tu tu", 5, user_id="crisis-user"))
+        self.assertEqual(replies[0], self.warning)
+        self.assertEqual(self.rag.calls[-1], "crisis")
+        self.assertEqual(self.llm.calls[-1]["max_tokens"], Config.CRISIS_MAX_OUTPUT_TOKENS)
+
+    def test_warning_latency_is_kept_per_endpoint(self):
+        def warnings(endpoint):
+            state = CRISIS_LATENCY._values.get(CRISIS_LATENCY._key({"phase": "warning", "endpoint": endpoint}))
+            return state["count"] if state else 0
+
+        before = {endpoint: warnings(endpoint) for endpoint in ("chat", "chat_stream")}
+        self.chatbot.process_message("toi muon tu tu", 5, user_id="blocking-user")
+        self.assertEqual(warnings("chat"), before["chat"] + 1)
+        self.assertEqual(warnings("chat_stream"), before["chat_stream"])
+
+        list(self.chatbot.process_message_stream("toi muon tu tu", 5, user_id="stream-user"))
+        self.assertEqual(warnings("chat"), before["chat"] + 1)
+        self.assertEqual(warnings("chat_stream"), before["chat_stream"] + 1)
+
+if __name__ == "__main__":
+    unittest.main()
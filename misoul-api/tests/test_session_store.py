@@ -0,0 +1,66 @@
+# tests/test_session_store.py
+import os
+import tempfile
+import threading
+import unittest
+
+from app.deadline import Deadline, DeadlineExceeded
+from app.session_store import SQLiteSessionStore
+
+class SQLiteLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "sessions.sqlite3")
+        # Hai store trên cùng một file như hai worker gunicorn
+        self.worker_a = SQLiteSessionStore(path, lock_ttl_seconds=60)
+        self.worker_b = SQLiteSessionStore(path, lock_ttl_seconds=60)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_turns_of_one_user_are_serialized_across_stores(self):
+        held = threading.Event()
+        release = threading.Event()
+        order = []
+
+        def worker_a_turn():
+            with self.worker_a.lock("user"):
+                held.set()
+                release.wait(5)
+                state = self.worker_a.load("user")
+                state.add_turn("a", "trả lời a", max_turns=10)
+                self.worker_a.save("user", state)
+                order.append("a")
+
+        thread = threading.Thread(target=worker_a_turn)
+        thread.start()
+        held.wait(1)
+
+        # Người dùng khác không phải chờ
+        with self.worker_b.lock("other", Deadline(0.2)):
+            pass
+        with self.assertRaises(DeadlineExceeded):
+            with self.worker_b.lock("user", Deadline(0.2)):
+                pass
+
+        release.set()
+        with self.worker_b.lock("user", Deadline(2)):
+            state = self.worker_b.load("user")
+            state.add_turn("b", "trả lời b", max_turns=10)
+            self.worker_b.save("user", state)
+            order.append("b")
+        thread.join(timeout=1)
+
+        self.assertEqual(order, ["a", "b"])
+        self.assertEqual([turn.user for turn in self.worker_a.load("user").history], ["a", "b"])
+
+    def test_expired_lock_is_taken_over(self):
+        self.worker_a.lock_ttl_seconds = 0
+        # Worker giữ lượt bị dừng giữa chừng: lượt không được trả nhưng hết hạn ngay
+        self.worker_a.lock("user").__enter__()
+        with self.worker_b.lock("user", Deadline(1)):
+            pass
+
+if __name__ == "__main__":
+    unittest.main()